@@ -0,0 +1,261 @@
+"""
+Offline throughput benchmark.
+
+Runs the web endpoints and the CLI pipeline end to end against the local
+YouTube stand-in (mock_youtube.py), so concurrency can be tuned and
+regressions caught without touching YouTube:
+    python benchmark.py --videos 300 --latency 0.05 --workers 8
+    python benchmark.py --block-rate 0.05 --json results.json
+    python benchmark.py --compare results.json
+
+Reports videos per second, p50/p99 latency per operation and the peak RSS
+of the process after each scenario.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from mock_youtube import MockYouTubeServer, redirect_youtube
+from egress import get_shared_pool
+from transcript_cache import configure_shared_cache
+from search_index import configure_shared_index
+
+SCENARIOS = ('load_url', 'download', 'download_zip', 'cli')
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[rank - 1]
+
+
+def tune_limiter(limiter, rate, backoff_base):
+    """Let a limiter run at `rate` and back off in seconds rather than minutes"""
+    with limiter.lock:
+        limiter.rate = limiter.max_rate = rate
+        limiter.burst = max(1, int(rate))
+        limiter.tokens = limiter.burst
+        limiter.backoff_base = backoff_base
+        limiter.backoff_max = backoff_base * 8
+        limiter.paused_until = 0
+        limiter.consecutive_blocks = 0
+
+
+# Scenarios: each returns (videos processed, [latency of each operation])
+
+def bench_load_url(client, playlist_url, videos, options):
+    start = time.perf_counter()
+    response = client.post('/api/load_url', json={'url': playlist_url})
+    elapsed = time.perf_counter() - start
+    data = response.get_json()
+    if response.status_code != 200:
+        raise RuntimeError(f"load_url failed: {data}")
+    return data['count'], [elapsed]
+
+
+def bench_download(client, playlist_url, videos, options):
+    latencies = []
+    count = 0
+    batch = options.batch_size or len(videos)
+    for i in range(0, len(videos), batch):
+        start = time.perf_counter()
+        response = client.post('/api/download', json={'videos': videos[i:i + batch],
+                                                      'workers': options.workers})
+        latencies.append(time.perf_counter() - start)
+        data = response.get_json()
+        if response.status_code != 200:
+            raise RuntimeError(f"download failed: {data}")
+        count += len(data['results'])
+    return count, latencies
+
+
+def bench_download_zip(client, playlist_url, videos, options):
+    # The transcripts themselves are fetched first, outside the timing
+    response = client.post('/api/download', json={'videos': videos, 'workers': options.workers})
+    files = [{'filename': r['filename'], 'content': r['content']}
+             for r in response.get_json()['results'] if r['success']]
+
+    start = time.perf_counter()
+    response = client.post('/api/download_zip', json={'files': files})
+    size = len(response.get_data())
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200 or not size:
+        raise RuntimeError("download_zip failed")
+    return len(files), [elapsed]
+
+
+def bench_cli(client, playlist_url, videos, options):
+    import py_trans
+
+    output = tempfile.mkdtemp(prefix='bench-cli-')
+    try:
+        start = time.perf_counter()
+        success, failed, _ = py_trans.run(
+            [playlist_url], output_folder=output, workers=options.workers,
+            use_cache=options.cache, resume=False, quiet=True)
+        return success + failed, [time.perf_counter() - start]
+    finally:
+        shutil.rmtree(output, ignore_errors=True)
+
+
+BENCHMARKS = {
+    'load_url': bench_load_url,
+    'download': bench_download,
+    'download_zip': bench_download_zip,
+    'cli': bench_cli
+}
+
+
+def run_benchmarks(options):
+    from web_trans import app
+
+    results = {}
+    cache_dir = tempfile.mkdtemp(prefix='bench-cache-')
+    server = MockYouTubeServer(
+        latency=options.latency, jitter=options.jitter, block_rate=options.block_rate,
+        error_rate=options.error_rate, disabled_rate=options.disabled_rate, seed=options.seed)
+
+    try:
+        with server, redirect_youtube(server.base_url):
+            playlist_url = server.playlist_url(options.videos)
+            client = app.test_client()
+
+            for name in options.scenarios:
+                # Every scenario starts cold unless the cache is being measured. The search index is
+                # kept in the temp folder too, so mock videos never end up in the user's index
+                configure_shared_cache(os.path.join(cache_dir, name), enabled=options.cache)
+                configure_shared_index(os.path.join(cache_dir, name))
+                for endpoint in get_shared_pool().endpoints:
+                    tune_limiter(endpoint.limiter, options.rate, options.backoff)
+
+                # Video list for the download scenarios (not timed)
+                videos = client.post('/api/load_url', json={'url': playlist_url}).get_json()['videos']
+                server.reset_stats()
+
+                count = 0
+                latencies = []
+                start = time.perf_counter()
+                for _ in range(options.repeat):
+                    processed, samples = BENCHMARKS[name](client, playlist_url, videos, options)
+                    count += processed
+                    latencies.extend(samples)
+                elapsed = time.perf_counter() - start
+
+                stats = server.stats()
+                results[name] = {
+                    'videos': count,
+                    'seconds': round(elapsed, 3),
+                    'videos_per_second': round(count / elapsed, 2) if elapsed else None,
+                    'p50': round(percentile(latencies, 50), 4),
+                    'p99': round(percentile(latencies, 99), 4),
+                    'peak_rss_mb': peak_rss_mb(),
+                    'requests': sum(v for k, v in stats.items() if k.startswith('/')),
+                    'blocked': stats.get('status_429', 0),
+                    'server_errors': stats.get('status_500', 0)
+                }
+                print_result(name, results[name])
+    finally:
+        configure_shared_cache(enabled=False)
+        configure_shared_index(enabled=False)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return results
+
+
+def print_result(name, result):
+    rss = result['peak_rss_mb']
+    rss = f"{rss:.0f} MB" if rss is not None else "n/a"
+    print(f"{name:<14} {result['videos']:>6} videos  {result['videos_per_second']:>8} videos/s  "
+          f"p50 {result['p50']:.3f}s  p99 {result['p99']:.3f}s  peak RSS {rss}  "
+          f"({result['requests']} requests, {result['blocked']} blocked)")
+
+
+def compare(results, baseline, max_regression):
+    """Print throughput changes against a baseline; return the scenarios that regressed"""
+    regressed = []
+    for name, result in results.items():
+        before = baseline.get(name, {}).get('videos_per_second')
+        if not before or result['videos_per_second'] is None:
+            continue
+        change = result['videos_per_second'] / before - 1
+        print(f"{name:<14} {before:>8} -> {result['videos_per_second']:>8} videos/s ({change:+.0%})")
+        if change < -max_regression:
+            regressed.append(name)
+    return regressed
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the downloaders against a local YouTube stand-in.")
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO', help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument('--videos', type=int, default=200, help="playlist size (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per scenario (default: %(default)s)")
+    parser.add_argument('-w', '--workers', type=int, default=4, help="fetch workers (default: %(default)s)")
+    parser.add_argument('--batch-size', type=int, default=50,
+                        help="videos per /api/download request, 0 for one request (default: %(default)s)")
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="mock server latency per request in seconds (default: %(default)s)")
+    parser.add_argument('--jitter', type=float, default=0.02, help="extra random latency (default: %(default)s)")
+    parser.add_argument('--block-rate', type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of 500 responses")
+    parser.add_argument('--disabled-rate', type=float, default=0.0, help="fraction of videos without captions")
+    parser.add_argument('--rate', type=float, default=1000.0,
+                        help="rate limiter requests per second (default: effectively unlimited)")
+    parser.add_argument('--backoff', type=float, default=0.5,
+                        help="rate limiter backoff base in seconds (default: %(default)s)")
+    parser.add_argument('--cache', action='store_true',
+                        help="use the transcript cache (runs after the first are then warm)")
+    parser.add_argument('--seed', type=int, default=1, help="seed for injected failures")
+    parser.add_argument('--json', metavar='FILE', help="write the results to FILE")
+    parser.add_argument('--compare', metavar='FILE', help="compare throughput with an earlier --json run")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="with --compare, exit 1 if videos/s drops by more than this (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    options = parser.parse_args(argv)
+    options.scenarios = options.scenarios or list(SCENARIOS)
+    unknown = [name for name in options.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    results = run_benchmarks(options)
+
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if options.compare:
+        with open(options.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print()
+        regressed = compare(results, baseline, options.max_regression)
+        if regressed:
+            print(f"Throughput regressed: {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Distributed crawls for large backfills.
+
+A coordinator enumerates playlists onto a durable work queue (work_queue.py);
+any number of workers, on this machine or others, lease a few videos at a
+time, fetch them through their own egress pool and write into shared
+storage, then ack. A worker that dies simply stops extending its leases, and
+its videos go back to the queue for someone else.
+
+    python py_trans.py crawl enqueue URL... --queue /shared/crawl-queue
+    python py_trans.py crawl work --queue /shared/crawl-queue -o /shared/transcripts
+    python py_trans.py crawl status --queue /shared/crawl-queue
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from manifest import RETRYABLE
+from packed_store import PackedWriter
+from transcript_core import resolve_urls, run_pipeline, make_writer, ParquetWriter
+from work_queue import DEFAULT_LEASE
+
+ENQUEUE_BATCH = 500
+PASS_SIZE = 1000        # videos per set of writers (and per Parquet file)
+POLL_INTERVAL = 10      # seconds between looks at an empty queue with --wait
+
+
+def worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def enqueue(queue, urls, start_from=1, on_invalid=None):
+    """Put every video behind urls on the queue; returns (found, added) counts"""
+    found = added = 0
+    batch = []
+    for video_num, video in resolve_urls(urls, start_from, on_invalid):
+        batch.append({'video_id': video['id'], 'video_num': video_num, 'video': video})
+        if len(batch) >= ENQUEUE_BATCH:
+            found, added = found + len(batch), added + queue.put(batch)
+            batch = []
+    if batch:
+        found, added = found + len(batch), added + queue.put(batch)
+    return found, added
+
+
+class CrawlWorker:
+    """
+    Leases videos from a queue and runs them through the usual pipeline.
+
+    Text files and packed stores are written as each video finishes, so it
+    is acked right away. Parquet rows only reach disk when the writer is
+    closed, so with Parquet output a pass of up to PASS_SIZE videos is
+    acked after its file is complete (the leases are kept alive until then).
+    """
+
+    def __init__(self, queue, output_folder, formats=('txt',), worker=None, batch=8,
+                 lease_seconds=DEFAULT_LEASE, index=None, **fetch_options):
+        self.queue = queue
+        self.output_folder = output_folder
+        self.formats = list(formats)
+        self.worker = worker or worker_name()
+        self.batch = batch
+        self.lease_seconds = lease_seconds
+        self.index = index
+        self.fetch_options = fetch_options
+        self.held = {}
+        self.lock = threading.Lock()
+        self.counts = {'done': 0, 'failed': 0, 'retried': 0}
+
+    def make_writers(self):
+        writers = []
+        for output_format in self.formats:
+            if output_format == 'parquet':
+                # Several workers may start a file in the same second
+                filename = f"transcripts-{time.strftime('%Y%m%d-%H%M%S')}-{self.worker}.parquet"
+                writers.append(ParquetWriter(self.output_folder, filename=filename))
+            elif output_format == 'packed':
+                # A packed store has a single writer, so each worker appends to its own
+                writers.append(PackedWriter(os.path.join(self.output_folder, self.worker)))
+            else:
+                writers.append(make_writer(self.output_folder, output_format))
+        return writers
+
+    def _leased_videos(self, limit):
+        taken = 0
+        while taken < limit:
+            tasks = self.queue.lease(self.worker, min(self.batch, limit - taken), self.lease_seconds)
+            if not tasks:
+                return
+            for task in tasks:
+                with self.lock:
+                    self.held[task['video_id']] = task
+                taken += 1
+                yield task['video_num'], task['video']
+
+    def _keep_leases(self, stop):
+        while not stop.wait(self.lease_seconds / 3):
+            with self.lock:
+                video_ids = list(self.held)
+            if video_ids:
+                try:
+                    self.queue.extend(video_ids, self.worker, self.lease_seconds)
+                except Exception as e:
+                    print(f"  ⚠ Could not extend leases: {e}")
+
+    def _settle(self, result):
+        if result['success']:
+            self.queue.ack(result['id'], {key: result[key] for key in ('filename', 'languages') if key in result})
+            self.counts['done'] += 1
+        else:
+            retry = result['status'] == RETRYABLE
+            self.queue.fail(result['id'], result['error'], retry=retry)
+            self.counts['retried' if retry else 'failed'] += 1
+        with self.lock:
+            self.held.pop(result['id'], None)
+
+    def run_pass(self, on_result=None):
+        """Work through up to PASS_SIZE videos; returns how many were leased"""
+        writers = self.make_writers()
+        deferred = [] if 'parquet' in self.formats else None
+        processed = 0
+        results = run_pipeline(self._leased_videos(PASS_SIZE), writer=writers,
+                               index=self.index, **self.fetch_options)
+        try:
+            for result in results:
+                processed += 1
+                if deferred is None:
+                    self._settle(result)
+                else:
+                    deferred.append(result)
+                if on_result:
+                    on_result(result)
+            # run_pipeline has closed the writers by now, so the Parquet file is complete
+            for result in deferred or []:
+                self._settle(result)
+        finally:
+            # Stops the fetches (and closes the writers) at once if we got here by an exception
+            results.close()
+            with self.lock:
+                unfinished = list(self.held)
+                self.held.clear()
+            if unfinished:
+                self.queue.release(unfinished)
+        return processed
+
+    def run(self, wait=False, stop_event=None, on_result=None):
+        """Work until the queue is empty (with wait: until stop_event is set); returns the counts"""
+        stop_event = stop_event or threading.Event()
+        keeper_stop = threading.Event()
+        keeper = threading.Thread(target=self._keep_leases, args=(keeper_stop,), daemon=True)
+        keeper.start()
+        try:
+            while not stop_event.is_set():
+                if not self.run_pass(on_result):
+                    if not wait:
+                        break
+                    stop_event.wait(POLL_INTERVAL)
+        finally:
+            keeper_stop.set()
+        return self.counts
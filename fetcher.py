@@ -0,0 +1,211 @@
+"""
+Concurrent transcript fetching.
+A bounded thread pool fetches several transcripts at once through a shared
+egress pool (one rate limiter per endpoint), and results are handed back in
+playlist order. Concurrent fetches of the same video (from other jobs or web
+clients) are coalesced into one request.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from youtube_transcript_api import YouTubeTranscriptApi
+from rate_limiter import RateLimitCancelled
+from egress import EgressPool, get_shared_pool
+from transcript_cache import get_shared_cache, DEFAULT_LANGUAGE
+from languages import NoTranscriptFound
+from manifest import classify_error, FAILED
+from singleflight import SingleFlight
+from metrics import metrics
+
+DEFAULT_WORKERS = 4
+MAX_WORKERS = 16
+
+# Shared by every fetch_transcripts call in the process
+transcript_flights = SingleFlight()
+metrics.add_collector(lambda: [('coalesced_requests', {'kind': 'transcript'}, transcript_flights.stats()['coalesced'])])
+
+
+class StopSignal:
+    """Event-like flag that is set when the caller cancels or the consumer stops reading"""
+
+    def __init__(self, cancel_event=None):
+        self.cancel_event = cancel_event
+        self.closed = threading.Event()
+
+    def set(self):
+        self.closed.set()
+
+    def is_set(self):
+        return self.closed.is_set() or (self.cancel_event is not None and self.cancel_event.is_set())
+
+    def wait(self, timeout):
+        if self.cancel_event is None:
+            return self.closed.wait(timeout)
+
+        # Poll both events so a long rate-limit pause still notices cancellation quickly
+        deadline = time.monotonic() + timeout
+        while not self.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.closed.wait(min(remaining, 0.25))
+        return True
+
+
+def fetch_transcripts(video_ids, workers=DEFAULT_WORKERS, limiter=None,
+                      cancel_event=None, make_api=YouTubeTranscriptApi, on_backoff=None,
+                      use_cache=True, cache=None, pool=None, languages=None, recheck_failed=False):
+    """
+    Fetch transcripts for video_ids with up to `workers` requests in flight.
+
+    Yields (index, video_id, transcript_result, error) in the same order as
+    video_ids; exactly one of transcript_result/error is set. Only a small
+    window of results is buffered, so memory stays flat for long playlists.
+    Stops early (without yielding the rest) once cancel_event is set.
+    
+    Cached transcripts are returned without touching YouTube or the rate
+    limiter; `cache` defaults to the shared on-disk cache. Permanent failures
+    (no captions, private/deleted videos) are cached too and fail straight
+    away on later runs until the cache's re-check interval is up, unless
+    recheck_failed is set.
+
+    Requests go through `pool` (the shared egress pool by default); passing
+    just a `limiter` fetches directly under that limiter instead.
+
+    With a `languages` LanguagePlan each result is a list of transcripts,
+    one per output the video has (deduplicated by language code), all
+    fetched from a single transcript list request.
+    """
+    workers = max(1, min(int(workers), MAX_WORKERS))
+    if pool is None:
+        pool = EgressPool.direct(limiter) if limiter is not None else get_shared_pool()
+    if use_cache and cache is None:
+        cache = get_shared_cache()
+    stop = StopSignal(cancel_event)
+    local = threading.local()
+
+    def fetch_via(endpoint, video_id, keys=None):
+        # API objects are cheap; the endpoint's pooled session behind them is what gets reused
+        if not hasattr(local, 'apis'):
+            local.apis = {}
+        if endpoint not in local.apis:
+            local.apis[endpoint] = make_api(http_client=endpoint.session())
+        with metrics.timer('transcript_fetch'):
+            if keys is not None:
+                return languages.fetch(local.apis[endpoint], video_id, keys)
+            return local.apis[endpoint].fetch(video_id)
+
+    def known_failure(video_id, key):
+        if use_cache and cache is not None and not recheck_failed:
+            failure = cache.get_failure(video_id, key)
+            if failure is not None:
+                metrics.inc('failure_cache_hits_total')
+            return failure
+        return None
+
+    def remember_failure(video_id, error, keys):
+        # Only permanent failures; transient ones are retried on the next run as usual
+        if use_cache and cache is not None and classify_error(error) == FAILED:
+            for key in keys:
+                cache.put_failure(video_id, error, key)
+
+    def fetch_default(video_id):
+        if use_cache and cache is not None:
+            cached = cache.get(video_id)
+            if cached is not None:
+                return cached
+        failure = known_failure(video_id, DEFAULT_LANGUAGE)
+        if failure is not None:
+            raise failure
+
+        try:
+            result = pool.call(fetch_via, video_id, cancel_event=stop, on_backoff=on_backoff)
+        except Exception as e:
+            remember_failure(video_id, e, [DEFAULT_LANGUAGE])
+            raise
+
+        if use_cache and cache is not None:
+            cache.put(video_id, result)
+        return result
+
+    def fetch_languages(video_id):
+        found = {}
+        failure = None
+        missing = []
+        keys = languages.keys()
+        for key in keys:
+            cached = cache.get(video_id, key) if use_cache and cache is not None else None
+            known = known_failure(video_id, key) if cached is None else None
+            if cached is not None:
+                found[key] = cached
+            elif known is not None:
+                # A language the video didn't have last time isn't worth another transcript list request
+                failure = failure or known
+            else:
+                missing.append(key)
+
+        if missing:
+            try:
+                fetched = pool.call(fetch_via, video_id, missing, cancel_event=stop, on_backoff=on_backoff)
+            except Exception as e:
+                remember_failure(video_id, e, missing)
+                raise
+            for key in missing:
+                if key in fetched:
+                    if use_cache and cache is not None:
+                        cache.put(video_id, fetched[key], key)
+                else:
+                    remember_failure(video_id, NoTranscriptFound(f"No transcript for {key}"), [key])
+            found.update(fetched)
+
+        if not found:
+            raise failure or NoTranscriptFound(f"No transcript for {languages.describe()}")
+        unique = {}
+        for key in keys:
+            if key in found:
+                unique.setdefault(found[key].language_code, found[key])
+        return list(unique.values())
+
+    fetch = fetch_default if languages is None else fetch_languages
+    flight_options = (tuple(languages.keys()) if languages is not None else None, use_cache, recheck_failed)
+
+    def fetch_one(video_id):
+        while True:
+            try:
+                return transcript_flights.do((video_id,) + flight_options, fetch, video_id, cancel_event=stop)
+            except RateLimitCancelled:
+                if stop.is_set():
+                    raise
+                # The fetch we were waiting on belonged to a caller that was cancelled; do it ourselves
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch')
+    pending = deque()
+    ids = iter(enumerate(video_ids))
+
+    def submit_next():
+        for index, video_id in ids:
+            pending.append((index, video_id, executor.submit(fetch_one, video_id)))
+            return True
+        return False
+
+    try:
+        # Keep a couple of requests queued per worker so nobody sits idle
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+
+        while pending and not stop.is_set():
+            index, video_id, future = pending.popleft()
+            try:
+                result, error = future.result(), None
+            except RateLimitCancelled:
+                break
+            except Exception as e:
+                result, error = None, e
+
+            submit_next()
+            yield index, video_id, result, error
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,12 +1,15 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
-from youtube_transcript_api import YouTubeTranscriptApi
 import os
-import re
-from urllib.parse import parse_qs, urlparse
-from pytube import Playlist, YouTube
+from pytube import Playlist
 import threading
-import time
+from titles import iter_playlist_pages, resolve_titles
+from manifest import RunManifest
+from metrics import metrics
+from search_index import get_shared_index
+from transcript_core import (is_playlist, resolve_video, select_videos, run_pipeline, fill_missing_titles,
+                             make_writer, OUTPUT_FORMATS)
+from fetcher import DEFAULT_WORKERS, MAX_WORKERS
 
 class TranscriptDownloaderGUI:
     def __init__(self, root):
@@ -16,6 +19,7 @@ class TranscriptDownloaderGUI:
         
         self.video_list = []
         self.is_downloading = False
+        self.cancel_event = threading.Event()
         
         # URL Input Frame
         url_frame = ttk.LabelFrame(root, text="Enter URL", padding=10)
@@ -60,6 +64,10 @@ class TranscriptDownloaderGUI:
         ttk.Entry(folder_frame, textvariable=self.folder_var, width=50).pack(side="left", padx=5)
         ttk.Button(folder_frame, text="Browse", command=self.browse_folder).pack(side="left", padx=5)
         
+        self.resume_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(folder_frame, text="Resume (skip videos already downloaded here)",
+                        variable=self.resume_var).pack(side="left", padx=5)
+        
         # Download Button
         btn_frame = ttk.Frame(root)
         btn_frame.pack(fill="x", padx=10, pady=5)
@@ -70,6 +78,16 @@ class TranscriptDownloaderGUI:
         self.cancel_btn = ttk.Button(btn_frame, text="Cancel", command=self.cancel_download, state="disabled")
         self.cancel_btn.pack(side="left", padx=5)
         
+        ttk.Label(btn_frame, text="Parallel downloads:").pack(side="left", padx=(20, 5))
+        self.workers_var = tk.IntVar(value=DEFAULT_WORKERS)
+        ttk.Spinbox(btn_frame, from_=1, to=MAX_WORKERS, textvariable=self.workers_var, width=4,
+                    state="readonly").pack(side="left")
+        
+        ttk.Label(btn_frame, text="Format:").pack(side="left", padx=(20, 5))
+        self.format_var = tk.StringVar(value="txt")
+        ttk.Combobox(btn_frame, textvariable=self.format_var, values=OUTPUT_FORMATS, width=8,
+                     state="readonly").pack(side="left")
+        
         # Progress Frame
         progress_frame = ttk.LabelFrame(root, text="Progress", padding=10)
         progress_frame.pack(fill="x", padx=10, pady=5)
@@ -98,16 +116,6 @@ class TranscriptDownloaderGUI:
         if folder:
             self.folder_var.set(folder)
     
-    def is_playlist(self, url):
-        return 'list=' in url
-    
-    def extract_video_id(self, url):
-        if 'watch?v=' in url:
-            return url.split('watch?v=')[1].split('&')[0]
-        elif 'youtu.be/' in url:
-            return url.split('youtu.be/')[1].split('?')[0]
-        return None
-    
     def load_url(self):
         url = self.url_entry.get().strip()
         if not url:
@@ -124,47 +132,44 @@ class TranscriptDownloaderGUI:
     
     def _load_url_thread(self, url):
         try:
-            if self.is_playlist(url):
+            if is_playlist(url):
                 self.log("Detected playlist URL")
                 playlist = Playlist(url)
                 
-                self.video_list = []
-                total = len(playlist.video_urls)
-                for idx, video_url in enumerate(playlist.video_urls, 1):
-                    self.root.after(0, lambda i=idx, t=total: self.log(f"Loading video {i}/{t}..."))
-                    video_id = self.extract_video_id(video_url)
-                    if video_id:
-                        try:
-                            yt = YouTube(video_url)
-                            title = yt.title
-                        except Exception as e:
-                            self.root.after(0, lambda e=e: self.log(f"  Warning: Could not fetch title - {e}"))
-                            title = video_id
-                        self.video_list.append({'id': video_id, 'title': title, 'url': video_url})
+                # Show each page as soon as it arrives; titles come with the page data
+                # and only the gaps are looked up (in parallel)
+                first_page = True
+                for page in iter_playlist_pages(playlist):
+                    resolve_titles(page)
+                    for video in fill_missing_titles(page):
+                        self.root.after(0, lambda v=video['id']: self.log(f"  Warning: Could not fetch title for {v}"))
+                    
+                    if first_page:
+                        self.root.after(0, lambda p=page: self._update_playlist_ui(p))
+                        first_page = False
+                    else:
+                        self.root.after(0, lambda p=page: self._append_playlist_page(p))
                 
-                self.root.after(0, self._update_playlist_ui)
+                self.root.after(0, lambda f=not first_page: self._finish_playlist_load(f))
             else:
                 self.log("Detected single video URL")
-                video_id = self.extract_video_id(url)
-                if video_id:
-                    try:
-                        yt = YouTube(url)
-                        title = yt.title
-                    except Exception as e:
-                        self.root.after(0, lambda e=e: self.log(f"Warning: Could not fetch title - {e}"))
-                        title = video_id
-                    self.video_list = [{'id': video_id, 'title': title, 'url': url}]
+                video = resolve_video(url)
+                if video:
+                    if video['title'] == video['id']:
+                        self.root.after(0, lambda: self.log("Warning: Could not fetch title"))
+                    self.video_list = [video]
                     self.root.after(0, self._update_single_video_ui)
                 else:
                     self.root.after(0, lambda: messagebox.showerror("Error", "Invalid YouTube URL"))
                     self.root.after(0, lambda: self.load_btn.config(state="normal"))
         except Exception as e:
-            self.root.after(0, lambda: self.log(f"Error loading URL: {e}"))
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Failed to load URL: {e}"))
+            self.root.after(0, lambda e=str(e): self.log(f"Error loading URL: {e}"))
+            self.root.after(0, lambda e=str(e): messagebox.showerror("Error", f"Failed to load URL: {e}"))
             self.root.after(0, lambda: self.load_btn.config(state="normal"))
     
-    def _update_playlist_ui(self):
-        self.log(f"Found {len(self.video_list)} videos in playlist")
+    def _update_playlist_ui(self, videos):
+        self.video_list = list(videos)
+        self.log(f"Loaded {len(self.video_list)} videos, loading the rest of the playlist...")
         
         # Show playlist frame
         self.playlist_frame.pack(fill="x", padx=10, pady=5, after=self.url_entry.master)
@@ -177,7 +182,24 @@ class TranscriptDownloaderGUI:
         
         # Update video list
         self.update_video_list()
-        self.load_btn.config(state="normal")
+    
+    def _append_playlist_page(self, videos):
+        offset = len(self.video_list)
+        self.video_list.extend(videos)
+        
+        options = list(self.start_video_combo['values'])
+        options.extend(f"{offset+i+1}. {v['title']}" for i, v in enumerate(videos))
+        self.start_video_combo['values'] = options
+        
+        for i, video in enumerate(videos, offset):
+            self.video_listbox.insert(tk.END, f"{i+1}. {video['title']}")
+    
+    def _finish_playlist_load(self, found_videos):
+        if not found_videos:
+            self.video_list = []
+        self.log(f"Found {len(self.video_list)} videos in playlist")
+        if not self.is_downloading:
+            self.load_btn.config(state="normal")
     
     def _update_single_video_ui(self):
         self.log(f"Loaded video: {self.video_list[0]['title']}")
@@ -218,70 +240,75 @@ class TranscriptDownloaderGUI:
             start_index = 0
         
         self.is_downloading = True
+        self.cancel_event = threading.Event()
         self.download_btn.config(state="disabled")
         self.cancel_btn.config(state="normal")
         self.load_btn.config(state="disabled")
         
         # Start download in thread
-        thread = threading.Thread(target=self._download_thread, args=(start_index, output_folder))
+        thread = threading.Thread(target=self._download_thread,
+                                  args=(start_index, output_folder, self.workers_var.get(),
+                                        self.resume_var.get(), self.format_var.get()))
         thread.daemon = True
         thread.start()
     
-    def _download_thread(self, start_index, output_folder):
-        api = YouTubeTranscriptApi()
-        total_videos = len(self.video_list) - start_index
+    def _download_thread(self, start_index, output_folder, workers, resume, output_format):
+        run_started = metrics.snapshot()
+        manifest = RunManifest(output_folder)
+        try:
+            writer = make_writer(output_folder, output_format)
+        except RuntimeError as e:
+            self.root.after(0, lambda e=str(e): messagebox.showerror("Error", e))
+            self.root.after(0, self._reset_buttons)
+            return
+        
         success_count = 0
         error_count = 0
         
+        # Work out which videos still need fetching; finished ones are skipped when resuming
+        for video_num, video in enumerate(self.video_list[:start_index], 1):
+            manifest.record_skipped(video['id'], index=video_num, title=video['title'])
+        skip_ids = [video['id'] for video in self.video_list[start_index:]
+                    if resume and manifest.is_done(video['id'])]
+        todo = select_videos(self.video_list, start_index, skip_ids)
+        already_done = len(skip_ids)
+        total_videos = len(todo)
+        
+        if already_done:
+            self.root.after(0, lambda: self.log(f"Skipping {already_done} videos already downloaded"))
         self.root.after(0, lambda: self.progress_bar.config(maximum=total_videos, value=0))
         
-        for i in range(start_index, len(self.video_list)):
-            if not self.is_downloading:
-                self.root.after(0, lambda: self.log("Download cancelled"))
-                break
+        # Fetch several transcripts at once (shared rate limiter pauses and retries if YouTube blocks us)
+        results = run_pipeline(
+            todo,
+            writer=writer,
+            manifest=manifest,
+            index=get_shared_index(),
+            workers=workers,
+            cancel_event=self.cancel_event,
+            on_backoff=lambda e, delay: self.root.after(
+                0, lambda d=delay: self.log(f"⚠ Rate limited, pausing for {d:.0f}s before retrying..."))
+        )
+        
+        for done, result in enumerate(results, 1):
+            video_num = result['video_num']
             
-            video = self.video_list[i]
-            video_num = i + 1
-            
-            self.root.after(0, lambda v=video_num, t=total_videos: 
+            self.root.after(0, lambda v=video_num: 
                            self.progress_var.set(f"Processing video {v}/{len(self.video_list)}"))
-            self.root.after(0, lambda: self.log(f"\n[{video_num}/{len(self.video_list)}] Processing: {video['title']}"))
+            self.root.after(0, lambda v=video_num, t=result['title']:
+                           self.log(f"\n[{v}/{len(self.video_list)}] Processing: {t}"))
             
-            try:
-                # Fetch transcript
-                time.sleep(5)  # Rate limiting to avoid IP blocking
-                transcript_result = api.fetch(video['id'])
-                
-                # Extract text
-                full_text = " ".join([snippet.text for snippet in transcript_result.snippets])
-                
-                # Create filename
-                safe_title = re.sub(r'[<>:"/\\|?*]', '', video['title'])
-                filename = f"{video_num:02d}_{safe_title}.txt"
-                filepath = os.path.join(output_folder, filename)
-                
-                # Save to file
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(f"Video ID: {video['id']}\n")
-                    f.write(f"Title: {video['title']}\n")
-                    f.write(f"URL: {video['url']}\n")
-                    f.write(f"Language: {transcript_result.language} ({transcript_result.language_code})\n")
-                    f.write("-" * 80 + "\n\n")
-                    f.write(full_text)
-                
+            if result['success']:
                 success_count += 1
-                self.root.after(0, lambda f=filepath: self.log(f"✓ Saved to: {f}"))
-                
-            except Exception as e:
+                self.root.after(0, lambda f=result['path']: self.log(f"✓ Saved to: {f}"))
+            else:
                 error_count += 1
-                error_msg = str(e)
-                self.root.after(0, lambda e=error_msg: self.log(f"✗ Error: {e}"))
-                
-                if "IpBlocked" in error_msg or "blocked" in error_msg.lower():
-                    self.root.after(0, lambda: self.log("\n⚠ YouTube is blocking requests. Stopping download."))
-                    break
+                self.root.after(0, lambda e=result['error']: self.log(f"✗ Error: {e}"))
             
-            self.root.after(0, lambda v=i-start_index+1: self.progress_bar.config(value=v))
+            self.root.after(0, lambda v=done: self.progress_bar.config(value=v))
+        
+        if self.cancel_event.is_set():
+            self.root.after(0, lambda: self.log("Download cancelled"))
         
         # Complete
         self.root.after(0, lambda: self.progress_var.set(
@@ -290,11 +317,14 @@ class TranscriptDownloaderGUI:
         self.root.after(0, lambda: self.log(f"Download completed: {success_count} successful, {error_count} failed"))
         self.root.after(0, lambda: self.log(f"Transcripts saved in '{output_folder}'"))
         self.root.after(0, lambda: self.log(f"{'='*60}"))
+        report = '\n'.join(metrics.report_lines(since=run_started))
+        self.root.after(0, lambda: self.log(f"Timings:\n{report}"))
         
         self.root.after(0, self._reset_buttons)
     
     def cancel_download(self):
         self.is_downloading = False
+        self.cancel_event.set()
         self.cancel_btn.config(state="disabled")
     
     def _reset_buttons(self):
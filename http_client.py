@@ -0,0 +1,77 @@
+"""
+Shared HTTP session settings for every outbound request.
+
+Sessions keep connections alive in a pool sized for the fetch and title
+workers, retry failed connection attempts, ask for compressed responses and
+never wait forever: every request gets DEFAULT_TIMEOUT unless it passes its
+own.
+"""
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+POOL_SIZE = 32             # Connections kept per host; covers fetch + title workers
+CONNECT_RETRIES = 2
+
+try:
+    import brotli  # noqa: F401  (urllib3 decodes br responses when it is installed)
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter with a bigger pool, connect retries and an optional local source address"""
+
+    def __init__(self, source_address=None, pool_size=POOL_SIZE, **kwargs):
+        self.source_address = (source_address, 0) if source_address else None
+        # Only retry when no request was sent yet; 429s and other statuses are left to the caller
+        retries = Retry(total=CONNECT_RETRIES, connect=CONNECT_RETRIES, read=0, status=0,
+                        backoff_factor=0.3, raise_on_status=False)
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size,
+                         max_retries=retries, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.source_address:
+            kwargs['source_address'] = self.source_address
+        super().init_poolmanager(*args, **kwargs)
+
+
+class PooledSession(requests.Session):
+    """requests.Session with a default timeout for every request"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+def make_session(proxy=None, source_address=None, timeout=DEFAULT_TIMEOUT, pool_size=POOL_SIZE):
+    """A keep-alive session, optionally through a proxy or from a local source address"""
+    session = PooledSession(timeout)
+    adapter = PooledAdapter(source_address, pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    if proxy:
+        session.proxies = {'http': proxy, 'https': proxy}
+    return session
+
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def get_shared_session():
+    """Process-wide direct session for requests that don't go through the egress pool"""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = make_session()
+        return _shared_session
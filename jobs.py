@@ -0,0 +1,268 @@
+"""
+Background job engine for transcript downloads.
+Jobs run on a shared worker pool and can be polled or cancelled by ID.
+Each job gets an output folder on the server, so finished transcripts
+never have to be sent back and forth through the browser. With a shared
+state backend, job status and results are also visible to (and can be
+cancelled from) the other worker processes of the server.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_OUTPUT_ROOT = os.environ.get(
+    'TRANSCRIPT_JOB_DIR', os.path.join(tempfile.gettempdir(), 'youtube-transcripts-jobs'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+FINISHED_STATES = (COMPLETED, CANCELLED, FAILED)
+
+
+class ShuttingDown(Exception):
+    """Raised by JobManager.submit() once the server has started draining"""
+
+
+class Job:
+    """A single background download and the results it has produced so far"""
+
+    def __init__(self, total, output_dir):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.total = total
+        self.output_dir = output_dir
+        self.results = []
+        self.success_count = 0
+        self.error_count = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def is_finished(self):
+        return self.status in FINISHED_STATES
+
+    def add_result(self, result):
+        with self.lock:
+            self.results.append(result)
+            if result.get('success'):
+                self.success_count += 1
+            else:
+                self.error_count += 1
+
+    def _summary(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'processed': len(self.results),
+            'success_count': self.success_count,
+            'error_count': self.error_count,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+    def summary(self):
+        """Job status without the results"""
+        with self.lock:
+            return self._summary()
+
+    def to_dict(self, since=0):
+        """Job status plus any results after index `since` (for incremental polling)"""
+        with self.lock:
+            return dict(self._summary(), next=len(self.results), results=self.results[since:])
+
+
+class StoredJob:
+    """A job run by another worker process, as last saved in the shared state backend"""
+
+    def __init__(self, backend, data):
+        self.backend = backend
+        self.data = data
+        self.id = data['job_id']
+        self.status = data['status']
+        self.output_dir = data['output_dir']
+
+    def cancel(self):
+        # The owning process checks this flag and cancels the job there
+        self.backend.set(f"job:{self.id}:cancel", True, ttl=3600)
+
+    def is_finished(self):
+        return self.status in FINISHED_STATES
+
+    def to_dict(self, since=0):
+        results = self.backend.items(f"job:{self.id}:results", since)
+        data = {key: value for key, value in self.data.items() if key != 'output_dir'}
+        return dict(data, next=since + len(results), results=results)
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool and keeps them around for polling.
+    Given a state backend (see state_backend.py) it also saves every job's
+    status and results there and picks up cancellations made elsewhere.
+    """
+
+    def __init__(self, max_workers=4, keep_finished_for=3600, output_root=DEFAULT_OUTPUT_ROOT,
+                 backend=None, cancel_poll_interval=1.0):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.keep_finished_for = keep_finished_for
+        self.output_root = output_root
+        self.backend = backend
+        self.accepting = True
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+        if backend is not None:
+            threading.Thread(target=self._watch_cancellations, args=(cancel_poll_interval,),
+                             name='job-cancel-watch', daemon=True).start()
+
+    def submit(self, work, total=0, output_dir=None):
+        """
+        Start a job. `work(job)` must return an iterable of result dicts and
+        should stop early once `job.cancel_event` is set. Files go in
+        `job.output_dir`, a fresh folder unless output_dir is given (e.g. to
+        resume into an earlier job's folder).
+        """
+        if not self.accepting:
+            raise ShuttingDown("Server is shutting down, try again shortly")
+        self._prune()
+        job = Job(total, output_dir)
+        if job.output_dir is None:
+            job.output_dir = os.path.join(self.output_root, job.id)
+        os.makedirs(job.output_dir, exist_ok=True)
+        with self.lock:
+            self.jobs[job.id] = job
+        self._save(job)
+        self.executor.submit(self._run, job, work)
+        return job
+
+    def get(self, job_id):
+        """This process's job, or one saved in the shared backend by another process, or None"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None and self.backend is not None:
+            data = self.backend.get(f"job:{job_id}")
+            if data is not None:
+                return StoredJob(self.backend, data)
+        return job
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job:
+            job.cancel()
+        return job
+
+    def shutdown(self, wait=True):
+        """Cancel everything still running and stop the worker pool"""
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancel()
+        self.executor.shutdown(wait=wait)
+
+    def drain(self, timeout=60):
+        """
+        Graceful shutdown: stop taking new jobs, give the running ones up to
+        `timeout` seconds to finish, then cancel the rest (they can be
+        resumed later). Returns the number of jobs that had to be cancelled.
+        """
+        self.accepting = False
+        deadline = time.monotonic() + timeout
+        while self._unfinished() and time.monotonic() < deadline:
+            time.sleep(0.5)
+
+        remaining = self._unfinished()
+        for job in remaining:
+            job.cancel()
+        self.executor.shutdown(wait=True)
+        return len(remaining)
+
+    def status_counts(self):
+        """{status: number of this process's jobs}"""
+        counts = {}
+        with self.lock:
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _unfinished(self):
+        with self.lock:
+            return [job for job in self.jobs.values() if not job.is_finished()]
+
+    def _save(self, job, result=None):
+        if self.backend is None:
+            return
+        if result is not None:
+            self.backend.append(f"job:{job.id}:results", result)
+        self.backend.set(f"job:{job.id}", dict(job.summary(), output_dir=job.output_dir))
+
+    def _watch_cancellations(self, interval):
+        while True:
+            time.sleep(interval)
+            for job in self._unfinished():
+                try:
+                    if self.backend.get(f"job:{job.id}:cancel"):
+                        job.cancel()
+                except Exception:
+                    pass  # Backend briefly unavailable; try again on the next round
+
+    def _run(self, job, work):
+        if job.is_cancelled():
+            self._finish(job, CANCELLED)
+            return
+
+        job.status = RUNNING
+        try:
+            results = work(job)
+            try:
+                for result in results:
+                    job.add_result(result)
+                    self._save(job, result)
+                    if job.is_cancelled():
+                        break
+            finally:
+                # A generator's fetches stop and its writers are closed before the job counts as finished
+                if hasattr(results, 'close'):
+                    results.close()
+            self._finish(job, CANCELLED if job.is_cancelled() else COMPLETED)
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, FAILED)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        if self.backend is not None:
+            self._save(job)
+            for key in (f"job:{job.id}", f"job:{job.id}:results"):
+                self.backend.expire(key, self.keep_finished_for)
+
+    def _prune(self):
+        """Forget finished jobs older than keep_finished_for seconds and delete their files"""
+        cutoff = time.time() - self.keep_finished_for
+        with self.lock:
+            expired = [job for job in self.jobs.values()
+                       if job.is_finished() and job.finished_at < cutoff]
+            for job in expired:
+                del self.jobs[job.id]
+            # A resumed job shares its folder with the job it resumed
+            in_use = {job.output_dir for job in self.jobs.values()}
+
+        for folder in {job.output_dir for job in expired} - in_use:
+            shutil.rmtree(folder, ignore_errors=True)
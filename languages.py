@@ -0,0 +1,90 @@
+"""
+Language selection for multilingual runs.
+
+A run can ask for several transcripts per video: each output is either a
+preference list (e.g. ['en', 'de', 'auto'] takes the first of those the
+video has) or a language to translate the primary transcript into. The
+video's transcript list is requested once and every output is fetched from
+it, so each extra language costs one request instead of a whole new run.
+"""
+AUTO = 'auto'  # The auto-generated track (spoken language), else whatever the video has
+TRANSLATE_PREFIX = 'translate:'
+
+
+class NoTranscriptFound(Exception):
+    """None of the requested languages is available (permanent, like the API's own error)"""
+
+
+def parse_languages(spec):
+    """['en', 'de', 'auto'] from 'en,de,auto'"""
+    return [code.strip() for code in spec.split(',') if code.strip()]
+
+
+def _translation_codes(transcript):
+    # translation_languages holds objects in youtube-transcript-api 1.x and dicts before
+    return {getattr(language, 'language_code', None) or language['language_code']
+            for language in transcript.translation_languages}
+
+
+def choose_transcript(transcripts, preferences):
+    """First transcript matching the preference list (manually created before generated), or None"""
+    for code in preferences:
+        if code == AUTO:
+            generated = [t for t in transcripts if t.is_generated]
+            if generated or transcripts:
+                return (generated or transcripts)[0]
+            continue
+        for transcript in sorted(transcripts, key=lambda t: t.is_generated):
+            if transcript.language_code == code:
+                return transcript
+    return None
+
+
+class LanguagePlan:
+    """
+    The outputs wanted for every video of a run. Each output has a key
+    ('en,de,auto' or 'translate:fr') that also names it in the cache.
+    """
+
+    def __init__(self, preferences=None, translations=()):
+        self.preferences = [list(p) for p in preferences] if preferences else [['en']]
+        self.translations = list(dict.fromkeys(translations))
+
+    def keys(self):
+        return ([','.join(p) for p in self.preferences] +
+                [TRANSLATE_PREFIX + code for code in self.translations])
+
+    def describe(self):
+        return ' | '.join(self.keys())
+
+    def select(self, transcript_list, keys=None):
+        """[(key, transcript)] for the wanted keys the video can provide, not fetched yet"""
+        transcripts = list(transcript_list)
+        keys = self.keys() if keys is None else keys
+        chosen = []
+
+        primary = choose_transcript(transcripts, self.preferences[0])
+        for i, (key, preferences) in enumerate(zip(self.keys(), self.preferences)):
+            transcript = primary if i == 0 else choose_transcript(transcripts, preferences)
+            if key in keys and transcript is not None:
+                chosen.append((key, transcript))
+
+        # Translate from the primary transcript, or any translatable one if it isn't
+        sources = [t for t in [primary] + transcripts if t is not None and t.is_translatable]
+        for code in self.translations:
+            key = TRANSLATE_PREFIX + code
+            if key not in keys:
+                continue
+            native = choose_transcript(transcripts, [code])
+            if native is not None:
+                chosen.append((key, native))  # A real transcript beats a machine translation
+                continue
+            for source in sources:
+                if code in _translation_codes(source):
+                    chosen.append((key, source.translate(code)))
+                    break
+        return chosen
+
+    def fetch(self, api, video_id, keys=None):
+        """{key: fetched transcript} for the wanted keys, from a single transcript list request"""
+        return {key: transcript.fetch() for key, transcript in self.select(api.list(video_id), keys)}
@@ -1,32 +1,160 @@
 """
 YouTube Transcript Downloader
 Main entry point - launches the web interface
+
+    python main.py                      development server, opens the browser
+    python main.py --production         production WSGI server (waitress, or gunicorn with --workers > 1)
 """
+import argparse
 import os
+import signal
+import sys
 import webbrowser
 import time
 import threading
-from web_trans import app
+import _thread
+
+DEFAULT_PORT = 5000
+
 
-def open_browser():
+def open_browser(port=DEFAULT_PORT):
     """Open browser after a short delay to allow server to start"""
     time.sleep(1.5)
-    webbrowser.open('http://localhost:5000')
+    webbrowser.open(f'http://localhost:{port}')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the YouTube Transcript Downloader web interface.")
+    parser.add_argument('--production', action='store_true',
+                        help="serve with a production WSGI server instead of Flask's development server")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes in production mode; more than 1 needs gunicorn (default: 1)")
+    parser.add_argument('--threads', type=int, default=8,
+                        help="request threads per worker in production mode (default: %(default)s)")
+    parser.add_argument('--drain-timeout', type=float, default=60,
+                        help="seconds running jobs get to finish on shutdown before they are "
+                             "cancelled (default: %(default)s)")
+    parser.add_argument('--state-backend', metavar='URL',
+                        help="shared job/rate-limit state: sqlite, sqlite:///path or redis://host:port/db "
+                             "(default in production mode: sqlite)")
+    parser.add_argument('--no-browser', action='store_true', help="don't open the browser")
+    return parser
+
+
+def run_development(args):
+    from web_trans import app
 
-if __name__ == '__main__':
-    # Create templates directory if it doesn't exist
-    os.makedirs('templates', exist_ok=True)
-    
     print("=" * 60)
     print("YouTube Transcript Downloader")
     print("=" * 60)
     print("\nStarting web server...")
-    print("Opening browser at http://localhost:5000")
+    print(f"Opening browser at http://localhost:{args.port}")
     print("\nPress Ctrl+C to stop the server")
     print("=" * 60)
-    
+
     # Open browser in a separate thread
-    threading.Thread(target=open_browser, daemon=True).start()
-    
+    if not args.no_browser:
+        threading.Thread(target=open_browser, args=(args.port,), daemon=True).start()
+
     # Start Flask server
-    app.run(debug=False, port=5000)
+    app.run(debug=False, host=args.host, port=args.port)
+
+
+def run_waitress(args):
+    """Single process, many threads; works everywhere waitress does (including Windows)"""
+    try:
+        from waitress import create_server
+    except ImportError:
+        print("Production mode needs waitress (pip install waitress)", file=sys.stderr)
+        return 2
+    from web_trans import app, job_manager
+
+    server = create_server(app, host=args.host, port=args.port, threads=args.threads)
+
+    def drain_then_stop():
+        cancelled = job_manager.drain(args.drain_timeout)
+        if cancelled:
+            print(f"Cancelled {cancelled} unfinished jobs; they can be resumed after the restart")
+        _thread.interrupt_main()
+
+    def on_signal(signum, frame):
+        # Keep serving (status polls, ZIPs) while jobs drain; a second Ctrl+C stops right away
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        print(f"Shutting down: waiting up to {args.drain_timeout:.0f}s for running jobs...")
+        threading.Thread(target=drain_then_stop, daemon=True).start()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    print(f"Serving on http://{args.host}:{args.port} with {args.threads} threads (waitress)")
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+def run_gunicorn(args):
+    """Several worker processes sharing state through the backend (Unix only)"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("More than one worker needs gunicorn (pip install gunicorn); "
+              "use --workers 1 to serve with waitress", file=sys.stderr)
+        return 2
+
+    def worker_exit(server, worker):
+        from web_trans import job_manager
+        job_manager.drain(args.drain_timeout)
+
+    class Application(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': f"{args.host}:{args.port}",
+                'workers': args.workers,
+                'threads': args.threads,
+                'worker_class': 'gthread',
+                # Streamed downloads keep a request open for minutes; gthread workers heartbeat separately
+                'timeout': 120,
+                'graceful_timeout': args.drain_timeout + 10,
+                'worker_exit': worker_exit
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from web_trans import app
+            return app
+
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers x "
+          f"{args.threads} threads (gunicorn)")
+    Application().run()
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # Create templates directory if it doesn't exist
+    os.makedirs('templates', exist_ok=True)
+
+    if args.state_backend:
+        os.environ['TRANSCRIPT_STATE_BACKEND'] = args.state_backend
+    if not args.production:
+        run_development(args)
+        return 0
+
+    # Worker processes (and threads) coordinate through the shared backend; set before web_trans loads
+    os.environ.setdefault('TRANSCRIPT_STATE_BACKEND', 'sqlite')
+    if args.workers > 1:
+        return run_gunicorn(args)
+    return run_waitress(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
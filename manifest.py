@@ -0,0 +1,85 @@
+"""
+Run manifest for resumable downloads.
+
+Every processed video gets a line in a JSON-lines file next to the output
+(`.manifest.jsonl`). The last line for a video wins, so the file can be
+appended to safely while a run is in progress and replayed to resume it.
+"""
+import json
+import os
+import threading
+import time
+
+DONE = 'done'
+FAILED = 'failed'          # permanent, e.g. captions disabled
+RETRYABLE = 'retryable'    # transient, e.g. network error or IP block
+SKIPPED = 'skipped'        # left out on purpose (before the start index), if not handled before
+
+MANIFEST_FILENAME = '.manifest.jsonl'
+
+PERMANENT_ERROR_NAMES = (
+    'TranscriptsDisabled', 'NoTranscriptFound', 'NoTranscriptAvailable', 'VideoUnavailable',
+    'VideoUnplayable', 'InvalidVideoId', 'AgeRestricted', 'NotTranslatable',
+    'TranslationLanguageNotAvailable', 'CachedFailure'
+)
+
+
+def classify_error(error):
+    """FAILED for errors that will happen again on retry, RETRYABLE for everything else"""
+    if type(error).__name__ in PERMANENT_ERROR_NAMES:
+        return FAILED
+    return RETRYABLE
+
+
+class RunManifest:
+    def __init__(self, folder, filename=MANIFEST_FILENAME):
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, filename)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Partially written last line from an interrupted run
+                self.entries[entry['video_id']] = entry
+
+    def status(self, video_id):
+        entry = self.entries.get(video_id)
+        return entry['status'] if entry else None
+
+    def is_done(self, video_id):
+        return self.status(video_id) == DONE
+
+    def record(self, video_id, status, **fields):
+        entry = dict(fields, video_id=video_id, status=status, updated_at=time.time())
+        with self.lock:
+            self.entries[video_id] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return entry
+
+    def record_skipped(self, video_id, **fields):
+        """
+        Mark a video as left out of this run. An outcome from an earlier run
+        is kept, so videos that are done stay done for the next resume.
+        """
+        if self.status(video_id) is None:
+            return self.record(video_id, SKIPPED, **fields)
+
+    def record_error(self, video_id, error, **fields):
+        """Record a failure, classified as permanent or retryable"""
+        return self.record(video_id, classify_error(error), error=str(error), **fields)
+
+    def summary(self):
+        counts = {DONE: 0, FAILED: 0, RETRYABLE: 0, SKIPPED: 0}
+        with self.lock:
+            for entry in self.entries.values():
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return counts
@@ -0,0 +1,226 @@
+"""
+Process-wide counters and latency histograms for the fetch pipeline.
+
+Every stage (playlist pages, title lookups, rate limit waits, transcript
+fetches, writes, indexing, ZIP building) is timed into a histogram and
+outcomes, error classes and throttling are counted. Modules can add
+collectors for live values such as the rate limiter state or cache hit
+ratio. The web app serves everything at /metrics in the Prometheus text
+format; the CLI and GUI print a per-run timing summary.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'yt_transcripts_'
+# Upper bounds in seconds; rate limit pauses can run to minutes
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HELP = {
+    'stage_seconds': ('histogram', 'Time spent per pipeline stage'),
+    'transcripts_total': ('counter', 'Transcripts processed by outcome'),
+    'errors_total': ('counter', 'Failed transcripts by error class'),
+    'throttled_total': ('counter', 'Blocked or unreachable responses per egress endpoint'),
+    'failure_cache_hits_total': ('counter', 'Fetches skipped because the video failed permanently before')
+}
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # The last one is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def copy(self):
+        other = Histogram()
+        other.buckets, other.count, other.total = list(self.buckets), self.count, self.total
+        return other
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (an estimate, like Prometheus does)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """Time the block into stage_seconds{stage=...}, whether or not it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def time_iter(self, stage, iterable):
+        """Yield from iterable, timing only the work of producing items (not the consumer's)"""
+        elapsed = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self.observe('stage_seconds', elapsed, stage=stage)
+
+    def add_collector(self, collector):
+        """collector() returns [(name, {labels}, value)] gauges, read at every scrape"""
+        self.collectors.append(collector)
+
+    def gauges(self):
+        values = []
+        for collector in self.collectors:
+            try:
+                values.extend(collector())
+            except Exception:
+                pass  # A broken collector shouldn't take the whole endpoint down
+        return values
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: histogram.copy() for key, histogram in self.histograms.items()}
+
+        lines = []
+        described = set()
+
+        def describe(name, default_type):
+            if name not in described:
+                described.add(name)
+                metric_type, help_text = HELP.get(name, (default_type, name.replace('_', ' ')))
+                lines.append(f"# HELP {PREFIX}{name} {help_text}")
+                lines.append(f"# TYPE {PREFIX}{name} {metric_type}")
+
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, 'counter')
+            lines.append(f"{PREFIX}{name}{_label_text(labels)} {value}")
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), histogram.buckets):
+                cumulative += count
+                lines.append(f"{PREFIX}{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_label_text(labels)} {histogram.total}")
+            lines.append(f"{PREFIX}{name}_count{_label_text(labels)} {histogram.count}")
+
+        # Samples of one metric have to be listed together, even when several collectors report it
+        for name, labels, value in sorted(self.gauges(), key=lambda gauge: gauge[0]):
+            describe(name, 'gauge')
+            lines.append(f"{PREFIX}{name}{_label_text(tuple(sorted(labels.items())))} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Copy of the stage timings and counters, to summarise a single run with timing_summary(since=...)"""
+        with self.lock:
+            return ({key: histogram.copy() for key, histogram in self.histograms.items()},
+                    dict(self.counters))
+
+    def timing_summary(self, since=None):
+        """[{'stage', 'count', 'total', 'mean', 'p50', 'p95'}] per stage, for everything after `since`"""
+        before = since[0] if since else {}
+        summary = []
+        with self.lock:
+            items = sorted(self.histograms.items())
+            histograms = [(key, histogram.copy()) for key, histogram in items]
+        for key, histogram in histograms:
+            name, labels = key
+            if name != 'stage_seconds':
+                continue
+            previous = before.get(key)
+            if previous is not None:
+                histogram.buckets = [a - b for a, b in zip(histogram.buckets, previous.buckets)]
+                histogram.count -= previous.count
+                histogram.total -= previous.total
+            if histogram.count:
+                summary.append({
+                    'stage': dict(labels)['stage'],
+                    'count': histogram.count,
+                    'total': histogram.total,
+                    'mean': histogram.total / histogram.count,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95)
+                })
+        return summary
+
+    def counter_totals(self, name, since=None):
+        """{label values: count} of one counter, for everything after `since`"""
+        before = since[1] if since else {}
+        with self.lock:
+            counters = dict(self.counters)
+        totals = {}
+        for (counter, labels), value in counters.items():
+            if counter == name:
+                value -= before.get((counter, labels), 0)
+                if value:
+                    totals[','.join(str(v) for _, v in labels)] = value
+        return totals
+
+    def report_lines(self, since=None):
+        """Per-run summary for the CLI and GUI logs: stage timings, errors, throttling, cache hit ratio"""
+        lines = [f"{'stage':<18}{'count':>7}{'total s':>10}{'mean s':>9}{'p50 <=':>9}{'p95 <=':>9}"]
+        for row in self.timing_summary(since):
+            lines.append(f"{row['stage']:<18}{row['count']:>7}{row['total']:>10.2f}{row['mean']:>9.3f}"
+                         f"{row['p50']:>9g}{row['p95']:>9g}")
+
+        for title, name in (('Errors', 'errors_total'), ('Throttled', 'throttled_total')):
+            totals = self.counter_totals(name, since)
+            if totals:
+                lines.append(f"{title}: " + ', '.join(f"{label} {count}" for label, count in sorted(totals.items())))
+
+        hit_ratio = [value for name, _, value in self.gauges() if name == 'cache_hit_ratio']
+        if hit_ratio:
+            lines.append(f"Cache hit ratio: {hit_ratio[0]:.0%}")
+        return lines
+
+
+# One registry per process
+metrics = Metrics()
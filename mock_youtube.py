@@ -0,0 +1,323 @@
+"""
+Local stand-in for the parts of YouTube the downloaders talk to.
+
+Serves playlist pages (plus browse continuations), watch pages, the
+innertube player endpoint and timedtext transcripts, with configurable
+latency and injected failures (429 blocks, 500 errors, disabled captions).
+redirect_youtube() points pytube and requests (and therefore
+youtube-transcript-api) at the server, so the real code paths run offline.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+YOUTUBE_ORIGIN = 'https://www.youtube.com'
+API_KEY = 'mock-innertube-key'
+PAGE_SIZE = 100
+DEFAULT_PLAYLIST_SIZE = 200
+
+
+def mock_video_id(n):
+    return f"mock{n:07d}"
+
+
+def mock_title(video_id):
+    return f"Mock video {video_id}"
+
+
+def _playlist_size(list_id):
+    """Playlists are generated on the fly; a trailing number in the ID sets the size"""
+    match = re.search(r'(\d+)$', list_id)
+    return int(match.group(1)) if match else DEFAULT_PLAYLIST_SIZE
+
+
+class MockYouTubeServer:
+    """
+    Threaded HTTP server on 127.0.0.1 (random port by default).
+
+    latency/jitter are in seconds and added to every response. block_rate,
+    error_rate and disabled_rate are probabilities of answering a transcript
+    request with a 429, a 500 or a video without captions.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.02, block_rate=0.0, error_rate=0.0,
+                 disabled_rate=0.0, snippets=120, seed=None, port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.block_rate = block_rate
+        self.error_rate = error_rate
+        self.disabled_rate = disabled_rate
+        self.snippets = snippets
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.counts = {}
+        self.counts_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def playlist_url(self, size=DEFAULT_PLAYLIST_SIZE):
+        """A YouTube playlist URL (rewritten to this server by redirect_youtube)"""
+        return f"{YOUTUBE_ORIGIN}/playlist?list=PLmock{size}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self.counts_lock:
+            return dict(self.counts)
+
+    def reset_stats(self):
+        with self.counts_lock:
+            self.counts.clear()
+
+    def _count(self, key):
+        with self.counts_lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _roll(self, rate):
+        if rate <= 0:
+            return False
+        with self.random_lock:
+            return self.random.random() < rate
+
+    def _delay(self):
+        with self.random_lock:
+            extra = self.random.uniform(0, self.jitter) if self.jitter else 0
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+    # Responses
+
+    def _renderer(self, n):
+        video_id = mock_video_id(n)
+        return {'playlistVideoRenderer': {
+            'videoId': video_id,
+            'index': {'simpleText': str(n)},
+            'title': {'runs': [{'text': mock_title(video_id)}]}
+        }}
+
+    def _playlist_items(self, list_id, offset):
+        size = _playlist_size(list_id)
+        items = [self._renderer(n) for n in range(offset + 1, min(offset + PAGE_SIZE, size) + 1)]
+        if offset + PAGE_SIZE < size:
+            items.append({'continuationItemRenderer': {'continuationEndpoint': {
+                'continuationCommand': {'token': f"{list_id}:{offset + PAGE_SIZE}"}}}})
+        return items
+
+    def playlist_page(self, list_id):
+        initial_data = {'contents': {'twoColumnBrowseResultsRenderer': {'tabs': [{'tabRenderer': {
+            'content': {'sectionListRenderer': {'contents': [{'itemSectionRenderer': {'contents': [
+                {'playlistVideoListRenderer': {'contents': self._playlist_items(list_id, 0)}}
+            ]}}]}}}}]}}}
+        ytcfg = {'INNERTUBE_API_KEY': API_KEY, 'INNERTUBE_CONTEXT_CLIENT_VERSION': '2.20200720.00.02'}
+        return (
+            "<!DOCTYPE html><html><head><title>Mock playlist - YouTube</title></head><body>"
+            f"<script>ytcfg.set({json.dumps(ytcfg)});</script>"
+            f"<script>var ytInitialData = {json.dumps(initial_data)};</script>"
+            "</body></html>"
+        )
+
+    def browse_continuation(self, token):
+        list_id, offset = token.rsplit(':', 1)
+        return {'onResponseReceivedActions': [{'appendContinuationItemsAction': {
+            'continuationItems': self._playlist_items(list_id, int(offset))}}]}
+
+    def watch_page(self, video_id):
+        title = mock_title(video_id)
+        details = {'videoId': video_id, 'title': title, 'lengthSeconds': str(self.snippets * 3)}
+        return (
+            f"<!DOCTYPE html><html><head><title>{escape(title)} - YouTube</title>"
+            f'<meta property="og:title" content="{escape(title)}"></head><body>'
+            f'<script>var ytcfg = {{"INNERTUBE_API_KEY":"{API_KEY}"}};</script>'
+            f"<script>var ytInitialPlayerResponse = {json.dumps({'videoDetails': details})};</script>"
+            "</body></html>"
+        )
+
+    def player(self, video_id, captions=True):
+        response = {
+            'playabilityStatus': {'status': 'OK'},
+            'videoDetails': {'videoId': video_id, 'title': mock_title(video_id),
+                             'lengthSeconds': str(self.snippets * 3), 'author': 'Mock channel'}
+        }
+        if captions:
+            response['captions'] = {'playerCaptionsTracklistRenderer': {
+                'captionTracks': [{
+                    'baseUrl': f"{YOUTUBE_ORIGIN}/api/timedtext?v={video_id}&lang=en",
+                    'name': {'runs': [{'text': 'English'}]},
+                    'vssId': '.en',
+                    'languageCode': 'en',
+                    'isTranslatable': True
+                }],
+                'translationLanguages': []
+            }}
+        return response
+
+    def timedtext(self, video_id):
+        lines = ['<?xml version="1.0" encoding="utf-8" ?><transcript>']
+        for i in range(self.snippets):
+            text = escape(f"Line {i + 1} of the transcript for {video_id}, with a few more words.")
+            lines.append(f'<text start="{i * 3}.0" dur="2.8">{text}</text>')
+        lines.append('</transcript>')
+        return ''.join(lines)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type='text/html; charset=utf-8'):
+                if not isinstance(body, (str, bytes)):
+                    body, content_type = json.dumps(body), 'application/json'
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                server._count(f"status_{status}")
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_json(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if not length:
+                    return {}
+                try:
+                    return json.loads(self.rfile.read(length))
+                except ValueError:
+                    return {}
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                server._count(url.path)
+                server._delay()
+
+                if url.path == '/playlist' and 'list' in query:
+                    self._send(200, server.playlist_page(query['list']))
+                elif url.path == '/watch' and 'v' in query:
+                    self._send(200, server.watch_page(query['v']))
+                elif url.path == '/api/timedtext' and 'v' in query:
+                    if server._roll(server.error_rate):
+                        self._send(500, 'Internal Server Error', 'text/plain')
+                    else:
+                        self._send(200, server.timedtext(query['v']), 'text/xml; charset=utf-8')
+                else:
+                    self._send(404, 'Not Found', 'text/plain')
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                data = self._read_json()
+                server._count(url.path)
+                server._delay()
+
+                if url.path == '/youtubei/v1/browse':
+                    token = data.get('continuation', '')
+                    if ':' not in token:
+                        self._send(400, {'error': 'bad continuation'})
+                    else:
+                        self._send(200, server.browse_continuation(token))
+                elif url.path == '/youtubei/v1/player':
+                    video_id = query.get('videoId') or data.get('videoId')
+                    if not video_id:
+                        self._send(400, {'error': 'videoId missing'})
+                    elif server._roll(server.block_rate):
+                        self._send(429, 'Too Many Requests', 'text/plain')
+                    else:
+                        self._send(200, server.player(video_id, not server._roll(server.disabled_rate)))
+                else:
+                    self._send(404, 'Not Found', 'text/plain')
+
+        return Handler
+
+
+@contextmanager
+def redirect_youtube(base_url):
+    """
+    Send every https://www.youtube.com request made through pytube or
+    requests (which youtube-transcript-api uses) to base_url instead.
+    """
+    import requests
+    from pytube import request as pytube_request
+
+    def rewrite(url):
+        if url.startswith(YOUTUBE_ORIGIN):
+            return base_url + url[len(YOUTUBE_ORIGIN):]
+        return url
+
+    original_request = requests.Session.request
+    original_urlopen = pytube_request.urlopen
+    original_no_proxy = os.environ.get('NO_PROXY')
+
+    def session_request(self, method, url, *args, **kwargs):
+        return original_request(self, method, rewrite(url), *args, **kwargs)
+
+    def urlopen(request, *args, **kwargs):
+        if isinstance(request, str):
+            request = rewrite(request)
+        else:
+            request.full_url = rewrite(request.full_url)
+        return original_urlopen(request, *args, **kwargs)
+
+    # Never send local traffic through a configured HTTP proxy
+    os.environ['NO_PROXY'] = ','.join(filter(None, [original_no_proxy, '127.0.0.1', 'localhost']))
+    requests.Session.request = session_request
+    pytube_request.urlopen = urlopen
+    try:
+        yield
+    finally:
+        requests.Session.request = original_request
+        pytube_request.urlopen = original_urlopen
+        if original_no_proxy is None:
+            os.environ.pop('NO_PROXY', None)
+        else:
+            os.environ['NO_PROXY'] = original_no_proxy
+
+
+if __name__ == '__main__':
+    # Run the stand-in on its own, e.g. to point a browser or curl at it
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local YouTube stand-in for offline testing.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--block-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockYouTubeServer(latency=args.latency, block_rate=args.block_rate,
+                               error_rate=args.error_rate, port=args.port)
+    print(f"Mock YouTube listening on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,407 @@
+"""
+Append-only packed transcript store.
+
+Instead of one small file per video, transcripts are appended to a single
+segment file and located through an offset index, so a large archive is a
+handful of files that back up and rsync sequentially:
+
+    transcripts.pack/
+        CURRENT               generation in use (switched atomically by compact())
+        segment-000001.dat    records: 16 byte header, video ID, compressed JSON
+        index-000001.idx      "video_id<TAB>offset<TAB>length[<TAB>D]" lines (D = deleted),
+                              last one wins
+
+Records are compressed one by one with zstd when the `zstandard` package is
+installed, zlib otherwise. The index can always be rebuilt from the segment,
+and a record torn by a crash is cut off the next time the store is opened.
+
+    python packed_store.py stats transcripts/transcripts.pack
+    python packed_store.py get transcripts/transcripts.pack VIDEO_ID
+    python packed_store.py export transcripts/transcripts.pack exported/ --format srt
+    python packed_store.py compact transcripts/transcripts.pack
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from transcript_cache import CachedSnippet, CachedTranscript
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+STORE_DIRNAME = 'transcripts.pack'
+MAGIC = b'YTTR'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHII')  # magic, version, codec, key length, payload length, crc32
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+TOMBSTONE = 0xFF
+
+CODECS = {'zstd': CODEC_ZSTD, 'zlib': CODEC_ZLIB, 'none': CODEC_RAW}
+
+
+class CorruptRecord(Exception):
+    """Raised when a record in the segment doesn't match its header"""
+
+
+def _compress(data, codec):
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, 6)
+    return data
+
+
+def _decompress(data, codec):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("This store holds zstd records; install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    return data
+
+
+def _encode_record(video_id, payload, codec):
+    key = video_id.encode('utf-8')
+    return HEADER.pack(MAGIC, VERSION, codec, len(key), len(payload), zlib.crc32(payload)) + key + payload
+
+
+def record_from_transcript(video, transcript_result, video_num=None):
+    """JSON-serialisable record for one fetched transcript"""
+    return {
+        'video': {'id': video['id'], 'title': video['title'], 'url': video['url']},
+        'video_num': video_num,
+        'language': transcript_result.language,
+        'language_code': transcript_result.language_code,
+        'is_generated': bool(getattr(transcript_result, 'is_generated', False)),
+        'snippets': [[s.text, s.start, s.duration] for s in transcript_result.snippets]
+    }
+
+
+def transcript_from_record(record):
+    """The record as a transcript object, usable anywhere a fetch result is"""
+    return CachedTranscript(
+        record['video']['id'],
+        [CachedSnippet(*snippet) for snippet in record['snippets']],
+        record['language'], record['language_code'], record['is_generated'])
+
+
+class PackedStore:
+    """
+    Segment file plus offset index. Safe to share between threads; only one
+    process should write to a store at a time.
+    """
+
+    def __init__(self, path, compression='zstd', use_mmap=False):
+        if compression == 'zstd' and zstandard is None:
+            compression = 'zlib'
+        self.path = path
+        self.codec = CODECS[compression]
+        self.use_mmap = use_mmap
+        self.lock = threading.RLock()
+        self.index = {}
+        self._mmap = None
+        os.makedirs(path, exist_ok=True)
+        self._open(self._read_generation())
+
+    # Files
+
+    def _read_generation(self):
+        try:
+            with open(os.path.join(self.path, 'CURRENT'), encoding='ascii') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return 1
+
+    def _segment_path(self, generation):
+        return os.path.join(self.path, f"segment-{generation:06d}.dat")
+
+    def _index_path(self, generation):
+        return os.path.join(self.path, f"index-{generation:06d}.idx")
+
+    def _open(self, generation):
+        self.generation = generation
+        self.index = {}
+        self._close_mmap()
+
+        indexed_end = 0
+        index_path = self._index_path(generation)
+        if os.path.exists(index_path):
+            good_bytes = 0
+            with open(index_path, encoding='utf-8') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        break  # Torn last line; _recover() re-indexes from the segment
+                    good_bytes += len(line.encode('utf-8'))
+                    parts = line.rstrip('\n').split('\t')
+                    video_id, offset, length = parts[0], int(parts[1]), int(parts[2])
+                    indexed_end = max(indexed_end, offset + length)
+                    if len(parts) > 3:
+                        self.index.pop(video_id, None)
+                    else:
+                        self.index[video_id] = (offset, length)
+            if good_bytes < os.path.getsize(index_path):
+                os.truncate(index_path, good_bytes)
+
+        self.segment = open(self._segment_path(generation), 'a+b')
+        self.index_file = open(index_path, 'a', encoding='utf-8')
+        self._recover(indexed_end)
+
+    def _recover(self, start):
+        """Index records written after the last index line; cut off a torn trailing record"""
+        size = os.path.getsize(self._segment_path(self.generation))
+        if size <= start:
+            return
+
+        good_end = start
+        for offset, length, video_id, codec, _ in self._scan(start):
+            self._index_record(video_id, offset, length, deleted=codec == TOMBSTONE)
+            good_end = offset + length
+
+        if good_end < size:
+            self.segment.truncate(good_end)
+        self.index_file.flush()
+
+    def _scan(self, start=0):
+        """Yield (offset, length, video_id, codec, payload) for each intact record from `start`"""
+        with open(self._segment_path(self.generation), 'rb') as f:
+            f.seek(start)
+            offset = start
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                magic, version, codec, key_len, payload_len, crc = HEADER.unpack(header)
+                key = f.read(key_len)
+                payload = f.read(payload_len)
+                if magic != MAGIC or len(key) < key_len or len(payload) < payload_len \
+                        or zlib.crc32(payload) != crc:
+                    return
+                length = HEADER.size + key_len + payload_len
+                yield offset, length, key.decode('utf-8'), codec, payload
+                offset += length
+
+    def _index_record(self, video_id, offset, length, deleted=False):
+        if deleted:
+            self.index_file.write(f"{video_id}\t{offset}\t{length}\tD\n")
+            self.index.pop(video_id, None)
+        else:
+            self.index_file.write(f"{video_id}\t{offset}\t{length}\n")
+            self.index[video_id] = (offset, length)
+
+    def _close_mmap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _read(self, offset, length):
+        if self.use_mmap:
+            if self._mmap is None or offset + length > len(self._mmap):
+                self._close_mmap()
+                self.segment.flush()
+                self._mmap = mmap.mmap(self.segment.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._mmap[offset:offset + length]
+        self.segment.flush()
+        if hasattr(os, 'pread'):
+            return os.pread(self.segment.fileno(), length, offset)
+        self.segment.seek(offset)
+        return self.segment.read(length)
+
+    # Records
+
+    def _append(self, video_id, payload, codec):
+        data = _encode_record(video_id, payload, codec)
+        self.segment.seek(0, os.SEEK_END)
+        offset = self.segment.tell()
+        self.segment.write(data)
+        self.segment.flush()
+        self._index_record(video_id, offset, len(data), deleted=codec == TOMBSTONE)
+        self.index_file.flush()
+
+    def put(self, video_id, record):
+        """Append a record (any JSON-serialisable dict); it replaces earlier ones for video_id"""
+        payload = _compress(json.dumps(record, ensure_ascii=False).encode('utf-8'), self.codec)
+        with self.lock:
+            self._append(video_id, payload, self.codec)
+
+    def get(self, video_id):
+        """The latest record for video_id, or None"""
+        with self.lock:
+            location = self.index.get(video_id)
+            if location is None:
+                return None
+            data = self._read(*location)
+
+        magic, version, codec, key_len, payload_len, crc = HEADER.unpack_from(data)
+        payload = data[HEADER.size + key_len:]
+        if magic != MAGIC or zlib.crc32(payload) != crc:
+            raise CorruptRecord(f"Record for {video_id} is damaged")
+        return json.loads(_decompress(payload, codec))
+
+    def delete(self, video_id):
+        with self.lock:
+            if video_id in self.index:
+                self._append(video_id, b'', TOMBSTONE)
+
+    def __contains__(self, video_id):
+        return video_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        with self.lock:
+            return list(self.index)
+
+    def items(self):
+        """(video_id, record) for every live record, in segment (i.e. write) order"""
+        with self.lock:
+            locations = sorted((offset, video_id) for video_id, (offset, _) in self.index.items())
+        for _, video_id in locations:
+            record = self.get(video_id)
+            if record is not None:
+                yield video_id, record
+
+    def stats(self):
+        with self.lock:
+            segment_bytes = os.path.getsize(self._segment_path(self.generation))
+            live_bytes = sum(length for _, length in self.index.values())
+            return {
+                'records': len(self.index),
+                'segment_bytes': segment_bytes,
+                'live_bytes': live_bytes,
+                'garbage_ratio': 1 - live_bytes / segment_bytes if segment_bytes else 0.0,
+                'generation': self.generation
+            }
+
+    def compact(self):
+        """
+        Rewrite only the live records into a new generation and switch to it.
+        Replaced and deleted records are dropped; returns the bytes reclaimed.
+        """
+        with self.lock:
+            before = os.path.getsize(self._segment_path(self.generation))
+            new_generation = self.generation + 1
+            locations = sorted((offset, length, video_id) for video_id, (offset, length) in self.index.items())
+
+            with open(self._segment_path(new_generation), 'wb') as segment, \
+                    open(self._index_path(new_generation), 'w', encoding='utf-8') as index_file:
+                for offset, length, video_id in locations:
+                    index_file.write(f"{video_id}\t{segment.tell()}\t{length}\n")
+                    segment.write(self._read(offset, length))
+                segment.flush()
+                os.fsync(segment.fileno())
+                index_file.flush()
+                os.fsync(index_file.fileno())
+
+            # Switching CURRENT is the commit point; a crash before it leaves the old generation in use
+            current = os.path.join(self.path, 'CURRENT')
+            with open(current + '.tmp', 'w', encoding='ascii') as f:
+                f.write(str(new_generation))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(current + '.tmp', current)
+
+            old_generation = self.generation
+            self.close()
+            self._open(new_generation)
+            for path in (self._segment_path(old_generation), self._index_path(old_generation)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return before - os.path.getsize(self._segment_path(new_generation))
+
+    def export(self, folder, output_format='txt'):
+        """Write every record out as individual files (the normal folder layout); returns the count"""
+        from transcript_core import FolderWriter
+
+        writer = FolderWriter(folder, output_format)
+        count = 0
+        for key, record in self.items():
+            # Keys of extra languages are 'video_id.language_code' (video IDs never contain a dot)
+            language = record['language_code'] if '.' in key else None
+            writer.write(record['video_num'] or count + 1, record['video'], transcript_from_record(record), language)
+            count += 1
+        return count
+
+    def close(self):
+        with self.lock:
+            self._close_mmap()
+            self.segment.close()
+            self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackedWriter:
+    """Pipeline writer that appends each transcript to a PackedStore in the output folder"""
+
+    def __init__(self, folder, compression='zstd'):
+        self.store = PackedStore(os.path.join(folder, STORE_DIRNAME), compression)
+
+    def write(self, video_num, video, transcript_result, language=None):
+        key = f"{video['id']}.{language}" if language else video['id']
+        self.store.put(key, record_from_transcript(video, transcript_result, video_num))
+        return f"{STORE_DIRNAME}#{key}", self.store.path
+
+    def close(self):
+        self.store.close()
+
+
+def main(argv=None):
+    from transcript_core import TEXT_FORMATS
+
+    parser = argparse.ArgumentParser(description="Inspect, export and compact a packed transcript store.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('stats', help="record count and size")
+    command.add_argument('store')
+    command = commands.add_parser('get', help="print one transcript as JSON")
+    command.add_argument('store')
+    command.add_argument('video_id')
+    command = commands.add_parser('export', help="write the transcripts out as individual files")
+    command.add_argument('store')
+    command.add_argument('folder')
+    command.add_argument('--format', default='txt', choices=tuple(TEXT_FORMATS))
+    command = commands.add_parser('compact', help="drop replaced and deleted records")
+    command.add_argument('store')
+
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.store):
+        print(f"No store at {args.store}", file=sys.stderr)
+        return 2
+
+    with PackedStore(args.store) as store:
+        if args.command == 'stats':
+            print(json.dumps(store.stats(), indent=2))
+        elif args.command == 'get':
+            record = store.get(args.video_id)
+            if record is None:
+                print(f"{args.video_id} is not in the store", file=sys.stderr)
+                return 1
+            print(json.dumps(record, ensure_ascii=False, indent=2))
+        elif args.command == 'export':
+            count = store.export(args.folder, args.format)
+            print(f"Exported {count} transcripts to '{args.folder}'")
+        elif args.command == 'compact':
+            reclaimed = store.compact()
+            print(f"Compacted to generation {store.generation}, reclaimed {reclaimed} bytes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Incremental playlist sync.
+
+The output folder remembers which videos each playlist had the last time it
+was synced (`.playlists.json`). A sync run enumerates the playlist again
+(one request per ~100 videos) but only fetches transcripts for videos that
+are new or failed transiently last time, optionally re-checks videos that had
+no captions, and reports the videos that have disappeared since.
+"""
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+from manifest import DONE, FAILED, SKIPPED
+from transcript_core import resolve_urls
+
+SYNC_STATE_FILENAME = '.playlists.json'
+
+
+def playlist_key(url):
+    """The playlist ID from a playlist URL (falls back to the URL itself)"""
+    ids = parse_qs(urlparse(url).query).get('list')
+    return ids[0] if ids else url
+
+
+class SyncState:
+    """Last synced contents of every playlist synced into a folder"""
+
+    def __init__(self, folder, filename=SYNC_STATE_FILENAME):
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, filename)
+        self.lock = threading.Lock()
+        self.playlists = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    self.playlists = json.load(f)
+            except ValueError:
+                pass  # Unreadable state just means the next sync starts from scratch
+
+    def get(self, playlist_id):
+        return self.playlists.get(playlist_id)
+
+    def update(self, playlist_id, url, videos):
+        """Store the playlist's current [(video_id, title)] list"""
+        with self.lock:
+            self.playlists[playlist_id] = {'url': url, 'videos': videos, 'synced_at': time.time()}
+            # Write to a temp file first so an interrupted save can't lose the old state
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.playlists, f, ensure_ascii=False)
+            os.replace(self.path + '.tmp', self.path)
+
+
+class PlaylistSync:
+    """
+    One playlist's sync: videos() yields only the (video_num, video) pairs
+    that need fetching, and finish() records the new snapshot and returns
+    a summary with the removed videos.
+    """
+
+    def __init__(self, url, manifest, state, recheck_missing=False):
+        self.url = url
+        self.playlist_id = playlist_key(url)
+        self.manifest = manifest
+        self.state = state
+        self.recheck_missing = recheck_missing
+
+        previous = state.get(self.playlist_id)
+        self.previous = dict(previous['videos']) if previous else {}
+        self.first_sync = previous is None
+        self.current = []
+        self.complete = False
+        self.counts = {'new': 0, 'retry': 0, 'recheck': 0, 'unchanged': 0, 'missing_captions': 0}
+
+    def videos(self):
+        for video_num, video in resolve_urls([self.url]):
+            self.current.append((video['id'], video['title']))
+            status = self.manifest.status(video['id'])
+
+            if status == DONE:
+                self.counts['unchanged'] += 1
+                continue
+            if status == FAILED:
+                # No captions last time; only worth another request when asked for
+                if not self.recheck_missing:
+                    self.counts['missing_captions'] += 1
+                    continue
+                self.counts['recheck'] += 1
+            elif video['id'] in self.previous or status not in (None, SKIPPED):
+                self.counts['retry'] += 1
+            else:
+                self.counts['new'] += 1
+            yield video_num, video
+
+        self.complete = True
+
+    @property
+    def skipped(self):
+        return self.counts['unchanged'] + self.counts['missing_captions']
+
+    def finish(self):
+        """Save the snapshot (only after a full enumeration) and return the sync summary"""
+        current_ids = {video_id for video_id, _ in self.current}
+        removed = [{'id': video_id, 'title': title} for video_id, title in self.previous.items()
+                   if video_id not in current_ids]
+        if self.complete:
+            self.state.update(self.playlist_id, self.url, self.current)
+        return dict(self.counts, playlist_id=self.playlist_id, total=len(self.current),
+                    removed=removed if self.complete else [], first_sync=self.first_sync,
+                    complete=self.complete)
+
+
+def compare_ids(current_ids, known_ids):
+    """(new, removed) video IDs of a playlist compared with IDs the caller already has"""
+    known, current = set(known_ids), set(current_ids)
+    return [i for i in current_ids if i not in known], [i for i in known_ids if i not in current]
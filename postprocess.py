@@ -0,0 +1,137 @@
+"""
+Streaming clean-up of caption snippets, between fetch and write.
+
+Auto-generated captions roll: each snippet repeats the tail of the one
+before, tags like [Music] are mixed into the text, and there is little or no
+punctuation. (Repeats are only dropped from auto-generated captions; in
+manually created ones they are real speech.) The stages below are chained
+generators, so a transcript is processed one snippet at a time and only the
+current sentence and chunk are held, however long the video:
+
+    clean_snippets -> drop_overlaps -> sentences -> chunks
+
+Tokens are counted as whitespace-separated words, which is close enough for
+sizing chunks and needs no tokenizer.
+"""
+import re
+from collections import deque
+
+# [Music], [Applause], (laughter), ♪ ... and similar non-speech tags
+NOISE_PATTERN = re.compile(
+    r'\[[^\]]*\]|\((?:music|applause|laughter|laughs|inaudible|silence|cheering)[^)]*\)|[♪♫]+', re.IGNORECASE)
+SENTENCE_END = re.compile(r'[.!?…][\'")\]]*$')
+OVERLAP_WINDOW = 30       # words of earlier text each snippet is compared with
+MIN_OVERLAP = 2           # shorter repeats are more likely speech than rolling captions
+MAX_SENTENCE_WORDS = 40   # captions without punctuation are cut into sentences of at most this many words
+SENTENCE_GAP = 2.0        # seconds of silence that end a sentence
+DEFAULT_CHUNK_TOKENS = 200
+DEFAULT_CHUNK_SECONDS = 120.0
+
+settings = {
+    'chunk_tokens': DEFAULT_CHUNK_TOKENS,
+    'chunk_seconds': DEFAULT_CHUNK_SECONDS
+}
+
+
+def configure_postprocessing(chunk_tokens=None, chunk_seconds=None):
+    """Process-wide chunk sizes for the chunks format (e.g. from CLI options)"""
+    if chunk_tokens is not None:
+        settings['chunk_tokens'] = chunk_tokens
+    if chunk_seconds is not None:
+        settings['chunk_seconds'] = chunk_seconds or None
+
+
+def clean_snippets(snippets):
+    """(start, end, words) per snippet, without noise tags; snippets left empty are dropped"""
+    for snippet in snippets:
+        words = NOISE_PATTERN.sub(' ', snippet.text).split()
+        if words:
+            yield snippet.start, snippet.start + snippet.duration, words
+
+
+def _normalize(word):
+    return word.strip('.,!?…;:\'"').lower()
+
+
+def _overlap(recent, words):
+    """Length of the longest run of words that ends recent (normalized words) and starts words"""
+    current = [_normalize(word) for word in words[:len(recent)]]
+    # Only positions holding the first word can start an overlap; the earliest is the longest
+    for i in range(len(recent) - len(current), len(recent)):
+        if recent[i] == current[0] and recent[i:] == current[:len(recent) - i]:
+            size = len(recent) - i
+            return size if size >= MIN_OVERLAP or size == len(words) else 0
+    return 0
+
+
+def drop_overlaps(items, window=OVERLAP_WINDOW):
+    """Strip the words each snippet repeats from the end of the text before it (rolling captions)"""
+    tail = deque(maxlen=window)
+    for start, end, words in items:
+        words = words[_overlap(list(tail), words):]
+        if words:
+            tail.extend(_normalize(word) for word in words)
+            yield start, end, words
+
+
+def sentences(items, max_words=MAX_SENTENCE_WORDS, gap=SENTENCE_GAP):
+    """
+    Regroup snippet words into {'start', 'end', 'tokens', 'text'} sentences:
+    at end punctuation, after a pause of `gap` seconds, or at max_words.
+    """
+    words = []
+    start = end = None
+    for item_start, item_end, item_words in items:
+        if words and item_start - end > gap:
+            yield {'start': start, 'end': end, 'tokens': len(words), 'text': ' '.join(words)}
+            words = []
+        for word in item_words:
+            if not words:
+                start = item_start
+            words.append(word)
+            end = item_end
+            if SENTENCE_END.search(word) or len(words) >= max_words:
+                yield {'start': start, 'end': end, 'tokens': len(words), 'text': ' '.join(words)}
+                words = []
+    if words:
+        yield {'start': start, 'end': end, 'tokens': len(words), 'text': ' '.join(words)}
+
+
+def chunks(sentence_items, max_tokens=DEFAULT_CHUNK_TOKENS, max_seconds=DEFAULT_CHUNK_SECONDS):
+    """
+    Pack whole sentences into {'chunk', 'start', 'end', 'tokens', 'text'} chunks
+    of at most max_tokens tokens and max_seconds seconds (None for no time
+    limit); a single sentence over the limit becomes a chunk of its own.
+    """
+    parts = []
+    tokens = 0
+    start = end = None
+    number = 0
+    for sentence in sentence_items:
+        if parts and (tokens + sentence['tokens'] > max_tokens
+                      or (max_seconds and sentence['end'] - start > max_seconds)):
+            yield {'chunk': number, 'start': start, 'end': end, 'tokens': tokens, 'text': ' '.join(parts)}
+            number += 1
+            parts, tokens = [], 0
+        if not parts:
+            start = sentence['start']
+        parts.append(sentence['text'])
+        tokens += sentence['tokens']
+        end = sentence['end']
+    if parts:
+        yield {'chunk': number, 'start': start, 'end': end, 'tokens': tokens, 'text': ' '.join(parts)}
+
+
+def transcript_sentences(transcript_result):
+    """Cleaned sentences of a fetched transcript, one at a time"""
+    items = clean_snippets(transcript_result.snippets)
+    if getattr(transcript_result, 'is_generated', False):
+        items = drop_overlaps(items)
+    return sentences(items)
+
+
+def transcript_chunks(transcript_result, max_tokens=None, max_seconds=None):
+    """Cleaned, chunked text of a fetched transcript (sizes default to the configured settings)"""
+    return chunks(transcript_sentences(transcript_result),
+                  max_tokens or settings['chunk_tokens'],
+                  settings['chunk_seconds'] if max_seconds is None else max_seconds)
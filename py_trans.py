@@ -1,142 +1,475 @@
-from youtube_transcript_api import YouTubeTranscriptApi
+"""
+YouTube Transcript Downloader - command line interface
+
+Downloads transcripts for any number of videos and playlists, e.g.:
+    python py_trans.py "https://www.youtube.com/playlist?list=..." -o transcripts
+    python py_trans.py --url-file urls.txt --workers 8 --no-resume
+
+Keeps a folder in step with a playlist, fetching only what's new since the last sync:
+    python py_trans.py "https://www.youtube.com/playlist?list=..." -o transcripts --sync
+
+Spreads a large backfill over workers on several machines (see crawl.py):
+    python py_trans.py crawl enqueue "https://www.youtube.com/playlist?list=..." --queue /shared/queue
+    python py_trans.py crawl work --queue /shared/queue -o /shared/transcripts
+
+Searches everything downloaded so far:
+    python py_trans.py search "gradient descent" --limit 10
+"""
+import argparse
+import json
 import os
-import re
-from urllib.parse import parse_qs, urlparse
-import requests
-from pytube import Playlist
-import time
-
-def get_playlist_video_ids(playlist_url):
-    """Extract all video IDs from a YouTube playlist URL"""
-    try:
-        playlist = Playlist(playlist_url)
-        video_ids = []
-        
-        # Get video URLs and extract IDs
-        for url in playlist.video_urls:
-            # Extract video ID from URL
-            if 'watch?v=' in url:
-                video_id = url.split('watch?v=')[1].split('&')[0]
-                video_ids.append(video_id)
-        
-        return video_ids
-    except Exception as e:
-        print(f"Error fetching playlist: {e}")
-        return []
+import sqlite3
+import sys
+from contextlib import closing
+from crawl import CrawlWorker, enqueue
+from egress import configure_shared_pool, parse_endpoints, DIRECT
+from manifest import RunManifest
+from playlist_sync import PlaylistSync, SyncState
+from postprocess import configure_postprocessing, DEFAULT_CHUNK_TOKENS, DEFAULT_CHUNK_SECONDS
+from languages import LanguagePlan, parse_languages
+from transcript_cache import configure_shared_cache
+from work_queue import open_queue, DEFAULT_LEASE
+from metrics import metrics
+from search_index import configure_shared_index, get_shared_index, DEFAULT_LIMIT
+from transcript_core import is_playlist, resolve_urls, run_pipeline, make_writer, OUTPUT_FORMATS
+from fetcher import DEFAULT_WORKERS, MAX_WORKERS
 
-def sanitize_filename(title):
-    """Remove invalid characters from filename"""
-    return re.sub(r'[<>:"/\\|?*]', '', title)
+# Exit codes for automation
+EXIT_OK = 0            # every selected video was downloaded (or already done)
+EXIT_PARTIAL = 1       # some videos failed
+EXIT_USAGE = 2         # bad arguments or nothing to download
+EXIT_ERROR = 3         # the run itself failed (e.g. playlist couldn't be read)
+EXIT_INTERRUPTED = 130
+
+
+def read_proxies(args):
+    """Egress endpoints from --proxy, --proxy-file and TRANSCRIPT_EGRESS (in that order of preference)"""
+    proxies = list(args.proxy or [])
+    if args.proxy_file:
+        with open(args.proxy_file, encoding='utf-8') as f:
+            proxies.extend(parse_endpoints(f.read()))
+    return proxies or parse_endpoints(os.environ.get('TRANSCRIPT_EGRESS', DIRECT))
+
+
+def read_urls(args):
+    """URLs from the command line plus any listed in --url-file (one per line, # for comments)"""
+    urls = list(args.urls)
+    for path in args.url_file or []:
+        with (sys.stdin if path == '-' else open(path, encoding='utf-8')) as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    urls.append(line)
+    return urls
+
+
+def run(urls, output_folder='transcripts', workers=DEFAULT_WORKERS, limiter=None,
+        use_cache=True, resume=True, start_from=1, quiet=False, formats=('txt',),
+        sync=False, recheck_missing=False, languages=None):
+    """
+    Download transcripts for urls into output_folder and return (success, failed, skipped) counts.
+    Requests go through the shared egress pool unless a limiter is given. With sync, playlists
+    only fetch videos that are new (or failed transiently) since the last sync into the folder.
+    A `languages` LanguagePlan saves several languages/translations per video. Videos that
+    failed permanently on an earlier run are skipped from the cache unless recheck_missing.
+    """
+    run_started = metrics.snapshot()
+    manifest = RunManifest(output_folder)
+    sync_state = SyncState(output_folder) if sync else None
+    syncs = []
+    writers = [make_writer(output_folder, output_format) for output_format in formats]
+    say = (lambda *a: None) if quiet else print
 
-def get_video_title(video_id):
-    """Try to get video title from YouTube"""
-    try:
-        url = f"https://www.youtube.com/watch?v={video_id}"
-        response = requests.get(url, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        
-        if response.status_code == 200:
-            # Try multiple patterns to extract title
-            patterns = [
-                r'"title":"([^"]+)"',
-                r'<title>([^<]+)</title>',
-                r'property="og:title" content="([^"]+)"'
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, response.text)
-                if match:
-                    title = match.group(1)
-                    # Clean up the title
-                    title = title.replace(' - YouTube', '')
-                    # Decode HTML entities
-                    title = title.encode().decode('unicode_escape')
-                    return title
-    except Exception as e:
-        print(f"  Warning: Could not fetch title: {e}")
-    
-    return video_id
-
-playlist_url = 'https://www.youtube.com/watch?v=gwZIgkyOPns&list=PLOR30RPQx4ZqxioCWsp68zM_zSaFMT4kM&index=6'
-output_folder = 'transcripts'
-
-# Create output folder if it doesn't exist
-os.makedirs(output_folder, exist_ok=True)
-
-try:
-    print("Fetching playlist videos...")
-    video_ids = get_playlist_video_ids(playlist_url)
-    print(f"Found {len(video_ids)} videos in playlist\n")
-    
-    if not video_ids:
-        print("No videos found in playlist. Please check the URL.")
-        exit(1)
-    
-    # Initialize the API
-    api = YouTubeTranscriptApi()
-    
     success_count = 0
     error_count = 0
-    start_from = 12  # Start from video 12
-    
-    for idx, video_id in enumerate(video_ids, 1):
-        # Skip videos before the starting index
-        if idx < start_from:
-            continue
-            
+    already_done = 0
+
+    def selected_videos():
+        # Videos are enumerated lazily, so fetching starts as soon as the first page is in
+        nonlocal already_done
+        for url in urls:
+            if sync and is_playlist(url):
+                playlist_sync = PlaylistSync(url, manifest, sync_state, recheck_missing)
+                syncs.append(playlist_sync)
+                yield from playlist_sync.videos()
+                continue
+
+            videos = resolve_urls([url], start_from,
+                                  on_invalid=lambda url: print(f"⚠ Skipping invalid YouTube URL: {url}"),
+                                  on_skipped=lambda video_num, video: manifest.record_skipped(
+                                      video['id'], index=video_num, title=video['title']))
+            for video_num, video in videos:
+                if (resume or sync) and manifest.is_done(video['id']):
+                    already_done += 1
+                    continue
+                yield video_num, video
+
+    # Fetch transcripts in parallel (rate limiter pauses and retries if YouTube blocks us)
+    results = run_pipeline(
+        selected_videos(),
+        writer=writers,
+        manifest=manifest,
+        index=get_shared_index(),
+        workers=workers,
+        limiter=limiter,
+        use_cache=use_cache,
+        languages=languages,
+        recheck_failed=recheck_missing,
+        on_backoff=lambda e, delay: print(f"  ⚠ Rate limited, pausing for {delay:.0f}s before retrying...")
+    )
+
+    # Closed on the way out (e.g. Ctrl+C), so the fetch workers stop at once and the writers are closed
+    with closing(results):
+        for result in results:
+            say(f"[{result['video_num']}] {result['title']} ({result['id']})")
+            if result['success']:
+                say(f"  ✓ Saved to: {result['path']}")
+                if len(result.get('languages', [])) > 1:
+                    say(f"    Languages: {', '.join(result['languages'])}")
+                success_count += 1
+            else:
+                print(f"  ✗ Error ({result['id']}): {result['error']}")
+                error_count += 1
+
+    for playlist_sync in syncs:
+        already_done += playlist_sync.skipped
+        report_sync(playlist_sync.finish(), say)
+
+    print("\nTimings:")
+    for line in metrics.report_lines(since=run_started):
+        print(f"  {line}")
+
+    return success_count, error_count, already_done
+
+
+def report_sync(summary, say=print):
+    if summary['first_sync']:
+        say(f"\nFirst sync of playlist {summary['playlist_id']}: {summary['total']} videos")
+    else:
+        say(f"\nSynced playlist {summary['playlist_id']}: {summary['new']} new, "
+            f"{summary['retry']} retried, {summary['recheck']} re-checked, "
+            f"{summary['unchanged']} unchanged of {summary['total']}")
+    if summary['missing_captions']:
+        say(f"  {summary['missing_captions']} videos had no captions last time "
+            f"(--recheck-missing to try them again)")
+    if not summary['complete']:
+        print(f"  ⚠ Playlist {summary['playlist_id']} was not read to the end; sync state left unchanged")
+    # Removals are always reported, since the transcripts on disk outlive the videos
+    for video in summary['removed']:
+        print(f"  - Removed from playlist: {video['title']} ({video['id']})")
+
+
+def write_metrics(path):
+    try:
+        # Written under a temporary name first so a scraper never reads half a file
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(metrics.render())
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print(f"Could not write metrics: {e}", file=sys.stderr)
+
+
+def build_fetch_parser():
+    """Options shared by plain runs and crawl workers: output, languages, egress, cache and index"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('-o', '--output', default='transcripts',
+                        help="output folder (default: %(default)s)")
+    parser.add_argument('--format', action='append', choices=OUTPUT_FORMATS, dest='formats',
+                        help="output format; repeat to write several from the same fetch "
+                             "(parquet puts the whole run in one file; default: txt)")
+    parser.add_argument('--chunk-tokens', type=int, default=DEFAULT_CHUNK_TOKENS, metavar='N',
+                        help="words per chunk in the chunks format (default: %(default)s)")
+    parser.add_argument('--chunk-seconds', type=float, default=DEFAULT_CHUNK_SECONDS, metavar='SECONDS',
+                        help="longest stretch of video per chunk, 0 for no limit (default: %(default)s)")
+    parser.add_argument('--lang', action='append', metavar='LIST', dest='languages',
+                        help="comma-separated language preference, e.g. en,de,auto ('auto' = the "
+                             "auto-generated track); repeat to save several languages per video (default: en)")
+    parser.add_argument('--translate', action='append', metavar='CODE',
+                        help="also save the transcript translated into CODE (a native CODE "
+                             "transcript is used when the video has one); can be repeated")
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"transcripts fetched in parallel, 1-{MAX_WORKERS} (default: %(default)s)")
+    parser.add_argument('--rate', type=float, default=0.2,
+                        help="initial requests per second (default: %(default)s)")
+    parser.add_argument('--max-rate', type=float, default=1.0,
+                        help="requests per second the limiter may speed up to (default: %(default)s)")
+    parser.add_argument('--proxy', action='append', metavar='URL',
+                        help="send requests through this HTTP/SOCKS proxy, 'direct' or 'source:IP'; "
+                             "can be repeated to spread the load (default: direct)")
+    parser.add_argument('--proxy-file', metavar='FILE', help="read more --proxy entries from FILE, one per line")
+    parser.add_argument('--cache-dir', help="transcript cache folder (default: ~/.cache/youtube-transcripts)")
+    parser.add_argument('--no-cache', action='store_true', help="don't read or write the transcript cache")
+    parser.add_argument('--index-dir', help="search index folder (default: same as the cache)")
+    parser.add_argument('--no-index', action='store_true', help="don't add transcripts to the search index")
+    parser.add_argument('--recheck-missing', action='store_true',
+                        help="retry videos that had no captions (or were private/deleted) last time "
+                             "instead of skipping them until the re-check interval is up")
+    parser.add_argument('--recheck-after', type=float, metavar='DAYS',
+                        help="days before videos without captions are tried again "
+                             "(default: 7, or TRANSCRIPT_RECHECK_DAYS)")
+    parser.add_argument('--metrics-file', metavar='FILE',
+                        help="write the run's metrics to FILE in the Prometheus text format "
+                             "(e.g. for node_exporter's textfile collector)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="only print errors and the summary")
+    return parser
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Download transcripts for YouTube videos and playlists.", parents=[build_fetch_parser()])
+    parser.add_argument('urls', nargs='*', metavar='URL',
+                        help="video or playlist URL (or bare video ID)")
+    parser.add_argument('-f', '--url-file', action='append', metavar='FILE',
+                        help="read URLs from FILE, one per line ('-' for stdin); can be repeated")
+    parser.add_argument('--resume', action=argparse.BooleanOptionalAction, default=True,
+                        help="skip videos the output folder's manifest marks as done (default: on)")
+    parser.add_argument('--start-from', type=int, default=1, metavar='N',
+                        help="skip playlist entries before index N")
+    parser.add_argument('--sync', action='store_true',
+                        help="only fetch playlist videos added (or failed transiently) since the last "
+                             "sync into the output folder, and report removed ones")
+    return parser
+
+
+def configure_fetching(args, proxies):
+    """
+    Set up chunk sizes, the shared cache, index and egress pool from the
+    fetch options; returns the LanguagePlan (or None)
+    """
+    languages = None
+    if args.languages or args.translate:
+        preferences = [parse_languages(spec) for spec in args.languages or []]
+        languages = LanguagePlan([p for p in preferences if p], args.translate or [])
+
+    cache_options = {'failure_ttl': args.recheck_after * 24 * 3600} if args.recheck_after is not None else {}
+    configure_postprocessing(chunk_tokens=args.chunk_tokens, chunk_seconds=args.chunk_seconds)
+    configure_shared_cache(args.cache_dir, enabled=not args.no_cache, **cache_options)
+    configure_shared_index(args.index_dir, enabled=not args.no_index)
+    # Each endpoint gets its own --rate/--max-rate budget
+    configure_shared_pool(proxies, rate=args.rate, max_rate=args.max_rate)
+    return languages
+
+
+def build_search_parser():
+    parser = argparse.ArgumentParser(
+        prog='py_trans.py search', description="Search the transcripts downloaded so far.")
+    parser.add_argument('query', nargs='+', help="words to look for (all must match)")
+    parser.add_argument('-n', '--limit', type=int, default=DEFAULT_LIMIT,
+                        help="number of hits (default: %(default)s)")
+    parser.add_argument('--video', metavar='VIDEO_ID', help="only search this video")
+    parser.add_argument('--index-dir', help="search index folder (default: same as the cache)")
+    parser.add_argument('--json', action='store_true', help="print the hits as JSON lines")
+    return parser
+
+
+def search_main(argv):
+    args = build_search_parser().parse_args(argv)
+    configure_shared_index(args.index_dir)
+    index = get_shared_index()
+    if index is None:
+        print("Search index is disabled (TRANSCRIPT_INDEX=0)", file=sys.stderr)
+        return EXIT_USAGE
+
+    hits = index.search(' '.join(args.query), limit=args.limit, video_id=args.video)
+    for hit in hits:
+        if args.json:
+            print(json.dumps(hit, ensure_ascii=False))
+        else:
+            print(f"{hit['timestamp']:>8}  {hit['title']} ({hit['video_id']})\n"
+                  f"          {hit['excerpt']}\n          {hit['url']}")
+    return EXIT_OK if hits else EXIT_PARTIAL
+
+
+def build_crawl_parser():
+    parser = argparse.ArgumentParser(
+        prog='py_trans.py crawl', description="Spread a large backfill over several workers and machines.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    queue_help = "work queue: a folder (file:///path, can be on a shared mount) or a SQLite file (sqlite:///path)"
+
+    command = commands.add_parser('enqueue', help="put every video behind the URLs on the queue")
+    command.add_argument('urls', nargs='*', metavar='URL', help="video or playlist URL (or bare video ID)")
+    command.add_argument('-f', '--url-file', action='append', metavar='FILE',
+                         help="read URLs from FILE, one per line ('-' for stdin); can be repeated")
+    command.add_argument('--start-from', type=int, default=1, metavar='N',
+                         help="skip playlist entries before index N")
+    command.add_argument('--queue', required=True, help=queue_help)
+
+    command = commands.add_parser('work', parents=[build_fetch_parser()],
+                                  help="lease videos from the queue, fetch them and write to the output folder")
+    command.add_argument('--queue', required=True, help=queue_help)
+    command.add_argument('--batch', type=int, default=8, metavar='N',
+                         help="videos leased at a time (default: %(default)s)")
+    command.add_argument('--lease', type=float, default=DEFAULT_LEASE, metavar='SECONDS',
+                         help="how long a lease lasts without being renewed; a worker that dies gives its "
+                              "videos back after this long (default: %(default)s)")
+    command.add_argument('--wait', action='store_true',
+                         help="keep polling for new videos when the queue is empty instead of exiting")
+    command.add_argument('--name', help="worker name in the queue (default: host-pid-random)")
+
+    command = commands.add_parser('status', help="count pending, leased, done and failed videos")
+    command.add_argument('--queue', required=True, help=queue_help)
+    command.add_argument('--failed', action='store_true', help="also list failed videos and their errors")
+    return parser
+
+
+def crawl_main(argv):
+    args = build_crawl_parser().parse_args(argv)
+    try:
+        queue = open_queue(args.queue)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Could not open queue: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.command == 'status':
+        counts = queue.stats()
+        print(', '.join(f"{count} {status}" for status, count in counts.items()))
+        if args.failed:
+            for video_id, error in queue.failures():
+                print(f"  {video_id}: {error}")
+        return EXIT_OK
+
+    if args.command == 'enqueue':
+        try:
+            urls = read_urls(args)
+        except OSError as e:
+            print(f"Could not read file: {e}", file=sys.stderr)
+            return EXIT_USAGE
+        if not urls:
+            print("No URLs given.", file=sys.stderr)
+            return EXIT_USAGE
         try:
-            print(f"[{idx}/{len(video_ids)}] Processing video: {video_id}")
-            
-            # Get video title
-            video_title = get_video_title(video_id)
-            print(f"  Title: {video_title}")
-            
-            # Fetch the transcript with rate limiting
-            time.sleep(5)  # Add delay to avoid IP blocking
-            
-            transcript_result = api.fetch(video_id)
-            
-            # Extract text from snippets
-            full_text = ""
-            for snippet in transcript_result.snippets:
-                full_text += snippet.text + " "
-            
-            # Create filename
-            safe_title = sanitize_filename(video_title)
-            filename = f"{idx:02d}_{safe_title}.txt"
-            filepath = os.path.join(output_folder, filename)
-            
-            # Save to file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f"Video ID: {video_id}\n")
-                f.write(f"Title: {video_title}\n")
-                f.write(f"URL: https://www.youtube.com/watch?v={video_id}\n")
-                f.write(f"Language: {transcript_result.language} ({transcript_result.language_code})\n")
-                f.write("-" * 80 + "\n\n")
-                f.write(full_text)
-            
-            print(f"  ✓ Saved to: {filepath}\n")
-            success_count += 1
-            
+            found, added = enqueue(queue, urls, args.start_from,
+                                   on_invalid=lambda url: print(f"⚠ Skipping invalid YouTube URL: {url}"))
+        except KeyboardInterrupt:
+            print("\nInterrupted; videos queued so far stay queued.", file=sys.stderr)
+            return EXIT_INTERRUPTED
         except Exception as e:
-            error_msg = str(e)
-            print(f"  ✗ Error: {error_msg}\n")
-            error_count += 1
-            
-            # If IP blocked, stop processing
-            if "IpBlocked" in error_msg or "blocked" in error_msg.lower():
-                print("\n⚠ YouTube is blocking requests from your IP.")
-                print("This happened because too many requests were made.")
-                print("Please wait a while before trying again, or use a VPN/proxy.")
-                break
-            
-            continue
-    
+            print(f"Fatal error: {e}", file=sys.stderr)
+            return EXIT_ERROR
+        print(f"Queued {added} videos ({found - added} were already on the queue)")
+        return EXIT_OK
+
+    try:
+        proxies = read_proxies(args)
+    except OSError as e:
+        print(f"Could not read file: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if args.rate <= 0 or args.max_rate < args.rate:
+        print("--rate must be positive and no larger than --max-rate", file=sys.stderr)
+        return EXIT_USAGE
+    if args.chunk_tokens < 1 or args.chunk_seconds < 0:
+        print("--chunk-tokens must be positive and --chunk-seconds not negative", file=sys.stderr)
+        return EXIT_USAGE
+    languages = configure_fetching(args, proxies)
+
+    say = (lambda *a: None) if args.quiet else print
+    worker = CrawlWorker(
+        queue, args.output,
+        formats=list(dict.fromkeys(args.formats or ['txt'])),
+        worker=args.name,
+        batch=args.batch,
+        lease_seconds=args.lease,
+        index=get_shared_index(),
+        workers=args.workers,
+        use_cache=not args.no_cache,
+        languages=languages,
+        recheck_failed=args.recheck_missing,
+        on_backoff=lambda e, delay: print(f"  ⚠ Rate limited, pausing for {delay:.0f}s before retrying...")
+    )
+
+    def report(result):
+        if result['success']:
+            say(f"✓ {result['title']} ({result['id']})")
+        else:
+            print(f"✗ {result['title']} ({result['id']}): {result['error']}")
+
+    run_started = metrics.snapshot()
+    say(f"Worker {worker.worker} taking videos from {args.queue}")
+    try:
+        counts = worker.run(wait=args.wait, on_result=report)
+    except KeyboardInterrupt:
+        print("\nInterrupted; unfinished videos went back on the queue.", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        print(f"Fatal error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        if args.metrics_file:
+            write_metrics(args.metrics_file)
+
+    print("\nTimings:")
+    for line in metrics.report_lines(since=run_started):
+        print(f"  {line}")
+    print(f"\nWorker done: {counts['done']} saved, {counts['failed']} failed, "
+          f"{counts['retried']} handed back for a retry")
+    return EXIT_PARTIAL if counts['failed'] or counts['retried'] else EXIT_OK
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['search']:
+        return search_main(argv[1:])
+    if argv[:1] == ['crawl']:
+        return crawl_main(argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        urls = read_urls(args)
+        proxies = read_proxies(args)
+    except OSError as e:
+        print(f"Could not read file: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if not urls:
+        parser.print_usage(sys.stderr)
+        print("No URLs given.", file=sys.stderr)
+        return EXIT_USAGE
+    if args.rate <= 0 or args.max_rate < args.rate:
+        print("--rate must be positive and no larger than --max-rate", file=sys.stderr)
+        return EXIT_USAGE
+    if args.chunk_tokens < 1 or args.chunk_seconds < 0:
+        print("--chunk-tokens must be positive and --chunk-seconds not negative", file=sys.stderr)
+        return EXIT_USAGE
+
+    languages = configure_fetching(args, proxies)
+
+    try:
+        success_count, error_count, already_done = run(
+            urls,
+            output_folder=args.output,
+            workers=args.workers,
+            use_cache=not args.no_cache,
+            resume=args.resume,
+            start_from=args.start_from,
+            quiet=args.quiet,
+            formats=list(dict.fromkeys(args.formats or ['txt'])),
+            sync=args.sync,
+            recheck_missing=args.recheck_missing,
+            languages=languages
+        )
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again with --resume to pick up where this left off.", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        print(f"Fatal error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        if args.metrics_file:
+            write_metrics(args.metrics_file)
+
     print(f"\n{'='*60}")
     print(f"Completed! {success_count} successful, {error_count} failed")
-    print(f"Transcripts saved in '{output_folder}' folder")
+    if already_done:
+        print(f"Skipped {already_done} videos handled in an earlier run")
+    print(f"Transcripts saved in '{args.output}' folder")
     print(f"{'='*60}")
 
-except Exception as e:
-    print(f"Fatal error: {e}")
\ No newline at end of file
+    if success_count == 0 and error_count == 0 and already_done == 0 and not args.sync:
+        return EXIT_USAGE
+    return EXIT_PARTIAL if error_count else EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Adaptive token-bucket rate limiter shared by all front ends.
+
+The request rate creeps up while YouTube keeps answering and is halved,
+with an exponential pause (plus jitter), whenever we get an IpBlocked/429
+style error. Callers wait out the pause and carry on instead of aborting.
+"""
+import random
+import threading
+import time
+
+BLOCK_ERROR_NAMES = ('IpBlocked', 'RequestBlocked', 'TooManyRequests')
+
+
+class RateLimitCancelled(Exception):
+    """Raised when a wait for the rate limiter is interrupted by cancellation"""
+
+
+def is_block_error(error):
+    """
+    Check whether an exception means YouTube is throttling or blocking us:
+    one of the block error types, or an HTTP error for a 429 response. The
+    message isn't looked at, since it can contain anything (e.g. the video
+    URL, or a "blocked in your country" reason for a permanent failure).
+    """
+    if type(error).__name__ in BLOCK_ERROR_NAMES:
+        return True
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) == 429
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket with additive increase / multiplicative decrease.
+
+    rate is in requests per second; the default of 0.2 matches the old
+    fixed 5 second sleep and grows towards max_rate while requests succeed.
+    """
+
+    def __init__(self, rate=0.2, min_rate=1 / 60, max_rate=1.0, burst=1,
+                 increase=0.02, backoff_base=30, backoff_max=900):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.paused_until = 0
+        self.consecutive_blocks = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def try_acquire(self):
+        """Take a token if one is available and return 0, else return the seconds until one is"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, cancel_event=None):
+        """Block until a request may be made. Returns False if cancelled while waiting."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return True
+
+            if cancel_event is not None:
+                if cancel_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+    def set_rate(self, rate, max_rate=None):
+        with self.lock:
+            self.max_rate = max_rate if max_rate is not None else max(self.max_rate, rate)
+            self.rate = min(rate, self.max_rate)
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_blocks = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def record_block(self):
+        """Halve the rate and pause everyone for an exponentially growing, jittered delay"""
+        with self.lock:
+            self.consecutive_blocks += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (self.consecutive_blocks - 1))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + delay)
+            self.tokens = 0
+            self.last_refill = now
+            return delay
+
+    def call(self, func, *args, cancel_event=None, max_attempts=6, on_backoff=None, **kwargs):
+        """
+        Call func(*args, **kwargs) under the limiter, retrying after a backoff
+        when it fails with a block error. on_backoff(error, delay) is called
+        before each pause so callers can report it.
+        """
+        attempt = 0
+        while True:
+            if not self.acquire(cancel_event):
+                raise RateLimitCancelled()
+
+            attempt += 1
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_block_error(e):
+                    raise
+                delay = self.record_block()
+                if attempt >= max_attempts:
+                    raise
+                if on_backoff:
+                    on_backoff(e, delay)
+                continue
+
+            self.record_success()
+            return result
+
+    def state(self):
+        with self.lock:
+            now = time.monotonic()
+            return {
+                'rate': self.rate,
+                'tokens': self.tokens,
+                'paused_for': max(0, self.paused_until - now),
+                'consecutive_blocks': self.consecutive_blocks
+            }
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    RateLimiter whose tokens and pauses live in a shared state backend
+    (see state_backend.py), so every worker process draws from one budget.
+    The adaptive rate itself is still tuned by each process.
+    """
+
+    def __init__(self, backend, name, **kwargs):
+        super().__init__(**kwargs)
+        self.backend = backend
+        self.name = name
+
+    def try_acquire(self):
+        with self.lock:
+            rate, burst = self.rate, self.burst
+        return self.backend.take_token(self.name, rate, burst)
+
+    def record_block(self):
+        delay = super().record_block()
+        self.backend.pause(self.name, delay)
+        return delay
+
+    def state(self):
+        return dict(super().state(), paused_for=self.backend.paused_for(self.name))
+
+
+# One limiter per process, since all requests leave from the same IP
+shared_limiter = RateLimiter()
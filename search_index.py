@@ -0,0 +1,199 @@
+"""
+Full-text search over downloaded transcripts.
+
+Every saved transcript is added to a SQLite FTS5 index, split into short
+chunks of consecutive snippets so each hit comes with the time offset it
+starts at. Re-downloading a video replaces its entries. Queries are ranked
+with bm25 and take milliseconds instead of grepping the output folders.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from transcript_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_INDEX_DIR = os.environ.get('TRANSCRIPT_INDEX_DIR', DEFAULT_CACHE_DIR)
+CHUNK_SECONDS = 20  # Snippets are merged into chunks of about this length
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+
+
+def format_timestamp(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+def to_match_query(query):
+    """Turn free text into an FTS5 query that matches all of its words (no syntax errors)"""
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"' for word in words)
+
+
+def _chunks(snippets, chunk_seconds=CHUNK_SECONDS):
+    """Merge consecutive snippets into (start, text) chunks of about chunk_seconds"""
+    start = None
+    texts = []
+    for snippet in snippets:
+        if start is None:
+            start = snippet.start
+        texts.append(snippet.text)
+        if snippet.start + snippet.duration - start >= chunk_seconds:
+            yield start, ' '.join(texts)
+            start, texts = None, []
+    if texts:
+        yield start, ' '.join(texts)
+
+
+class SearchIndex:
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        os.makedirs(index_dir, exist_ok=True)
+        self.path = os.path.join(index_dir, 'search.sqlite3')
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    title TEXT,
+                    url TEXT,
+                    language_code TEXT,
+                    first_chunk INTEGER,
+                    chunk_count INTEGER NOT NULL DEFAULT 0,
+                    indexed_at REAL NOT NULL
+                )
+            ''')
+            # Raises OperationalError if this SQLite build has no FTS5
+            self.conn.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                    text, video_id UNINDEXED, start UNINDEXED, tokenize = 'porter unicode61'
+                )
+            ''')
+            # Which chunks belong to which video, so re-indexing one doesn't scan the whole FTS table
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS video_chunks (
+                    chunk_id INTEGER PRIMARY KEY,
+                    video_id TEXT NOT NULL
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS video_chunks_video ON video_chunks (video_id)')
+            if not self.conn.execute('SELECT 1 FROM video_chunks LIMIT 1').fetchone():
+                # Index from before video_chunks existed (or an empty one)
+                self.conn.execute('INSERT INTO video_chunks SELECT rowid, video_id FROM chunks')
+
+    @contextmanager
+    def _write(self):
+        """
+        Transaction that takes SQLite's write lock up front, so other processes
+        sharing the index can't change a video between our reads and writes
+        """
+        with self.lock, self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            yield self.conn
+
+    def _delete_chunks(self, video_id):
+        self.conn.execute(
+            'DELETE FROM chunks WHERE rowid IN (SELECT chunk_id FROM video_chunks WHERE video_id = ?)', (video_id,))
+        self.conn.execute('DELETE FROM video_chunks WHERE video_id = ?', (video_id,))
+
+    def add(self, video, transcript_result):
+        """Index (or re-index) one transcript"""
+        rows = [(text, video['id'], start) for start, text in _chunks(transcript_result.snippets)]
+        with self._write():
+            self._delete_chunks(video['id'])
+            chunk_ids = [self.conn.execute('INSERT INTO chunks (text, video_id, start) VALUES (?, ?, ?)', row).lastrowid
+                         for row in rows]
+            self.conn.executemany('INSERT INTO video_chunks (chunk_id, video_id) VALUES (?, ?)',
+                                  [(chunk_id, video['id']) for chunk_id in chunk_ids])
+            first_chunk = chunk_ids[0] if chunk_ids else None
+            self.conn.execute(
+                'INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (video['id'], video['title'], video['url'], transcript_result.language_code,
+                 first_chunk, len(rows), time.time())
+            )
+
+    def remove(self, video_id):
+        with self._write():
+            self._delete_chunks(video_id)
+            self.conn.execute('DELETE FROM videos WHERE video_id = ?', (video_id,))
+
+    def search(self, query, limit=DEFAULT_LIMIT, video_id=None):
+        """
+        Ranked hits for the words in `query` (all must appear in a chunk), each
+        with the video ID, title, time offset, a link to that moment and a
+        highlighted excerpt.
+        """
+        match = to_match_query(query)
+        if not match:
+            return []
+        limit = max(1, min(int(limit), MAX_LIMIT))
+
+        sql = '''
+            SELECT c.video_id, v.title, v.url, c.start,
+                   snippet(chunks, 0, '[', ']', '...', 16), bm25(chunks)
+            FROM chunks c LEFT JOIN videos v ON v.video_id = c.video_id
+            WHERE chunks MATCH ?
+        '''
+        params = [match]
+        if video_id:
+            sql += ' AND c.video_id = ?'
+            params.append(video_id)
+        sql += ' ORDER BY bm25(chunks) LIMIT ?'
+        params.append(limit)
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        return [{
+            'video_id': vid,
+            'title': title,
+            'start': start,
+            'timestamp': format_timestamp(start),
+            'url': f"{url or 'https://www.youtube.com/watch?v=' + vid}&t={int(start)}s",
+            'excerpt': excerpt,
+            'score': round(-score, 4)
+        } for vid, title, url, start, excerpt, score in rows]
+
+    def stats(self):
+        with self.lock:
+            videos = self.conn.execute('SELECT COUNT(*) FROM videos').fetchone()[0]
+            chunks = self.conn.execute('SELECT COUNT(*) FROM chunks').fetchone()[0]
+        return {'videos': videos, 'chunks': chunks, 'path': self.path}
+
+
+_shared_index = None
+_shared_index_enabled = os.environ.get('TRANSCRIPT_INDEX', '1') != '0'
+_shared_index_lock = threading.Lock()
+
+
+def configure_shared_index(index_dir=None, enabled=True):
+    """Point the process-wide index at index_dir (or turn it off) before first use"""
+    global _shared_index, _shared_index_enabled
+    with _shared_index_lock:
+        _shared_index_enabled = enabled
+        _shared_index = None
+        if enabled:
+            try:
+                _shared_index = SearchIndex(index_dir or DEFAULT_INDEX_DIR)
+            except sqlite3.OperationalError:
+                _shared_index_enabled = False  # No FTS5 in this SQLite build
+
+
+def get_shared_index():
+    """Process-wide index, or None if disabled (TRANSCRIPT_INDEX=0) or FTS5 is unavailable"""
+    global _shared_index, _shared_index_enabled
+    with _shared_index_lock:
+        if not _shared_index_enabled:
+            return None
+        if _shared_index is None:
+            try:
+                _shared_index = SearchIndex()
+            except sqlite3.OperationalError:
+                _shared_index_enabled = False
+                return None
+        return _shared_index
@@ -0,0 +1,62 @@
+"""
+In-process request coalescing.
+
+When several threads (web clients, jobs) ask for the same thing at the same
+time, only the first one runs the fetch; the others wait for it and share its
+result or exception. Nothing is kept once the call finishes, that is what
+the transcript cache is for.
+"""
+import threading
+from rate_limiter import RateLimitCancelled
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, func, *args, cancel_event=None, **kwargs):
+        """
+        Return func(*args, **kwargs), or the result of an identical call
+        (same key) that is already in flight. Waiting callers raise
+        RateLimitCancelled if their own cancel_event is set first.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # Poll so a cancelled follower doesn't have to wait for the leader's fetch
+            while not call.done.wait(0.25):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RateLimitCancelled()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self.lock:
+            return {'in_flight': len(self.calls), 'coalesced': self.coalesced}
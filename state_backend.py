@@ -0,0 +1,227 @@
+"""
+Shared state for running the web app as several worker processes.
+
+Job status and results and the per-endpoint request budgets live in a
+backend every process can see, so a job can be polled or cancelled through
+any worker and all workers draw from one rate limit instead of each hitting
+YouTube on its own. (The transcript cache is already a SQLite file that any
+process on the host can share.)
+
+TRANSCRIPT_STATE_BACKEND picks the backend:
+    sqlite                        state.sqlite3 next to the transcript cache
+    sqlite:///path/to/state.db    a specific SQLite file
+    redis://localhost:6379/0      Redis or a compatible server (needs `pip install redis`)
+Unset means in-process state, as in the single process development server.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from transcript_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_SQLITE_PATH = os.path.join(DEFAULT_CACHE_DIR, 'state.sqlite3')
+
+
+def _take_token(tokens, updated, paused_until, now, rate, burst):
+    """Token bucket step shared by the backends: (tokens, wait) after trying to take one token"""
+    tokens = burst if tokens is None else min(burst, tokens + max(0, now - updated) * rate)
+    if now < paused_until:
+        return tokens, paused_until - now
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+class SQLiteBackend:
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        # Autocommit mode, so read-modify-write steps can take the write lock up front (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS lists (
+                    key TEXT NOT NULL, idx INTEGER NOT NULL, value TEXT NOT NULL, expires_at REAL,
+                    PRIMARY KEY (key, idx)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL,
+                    paused_until REAL NOT NULL
+                )
+            ''')
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO kv VALUES (?, ?, ?)', (key, json.dumps(value), expires_at))
+
+    def append(self, key, value):
+        with self._transaction() as conn:
+            idx = conn.execute('SELECT COALESCE(MAX(idx) + 1, 0) FROM lists WHERE key = ?', (key,)).fetchone()[0]
+            conn.execute('INSERT INTO lists VALUES (?, ?, ?, NULL)', (key, idx, json.dumps(value)))
+
+    def items(self, key, start=0):
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT value FROM lists WHERE key = ? AND idx >= ? AND (expires_at IS NULL OR expires_at > ?) '
+                'ORDER BY idx', (key, start, time.time())).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def expire(self, key, ttl):
+        expires_at = time.time() + ttl
+        with self._transaction() as conn:
+            conn.execute('UPDATE kv SET expires_at = ? WHERE key = ?', (expires_at, key))
+            conn.execute('UPDATE lists SET expires_at = ? WHERE key = ?', (expires_at, key))
+            # Expired rows are only hidden by the reads above; clear them out now and then
+            now = time.time()
+            conn.execute('DELETE FROM kv WHERE expires_at < ?', (now,))
+            conn.execute('DELETE FROM lists WHERE expires_at < ?', (now,))
+
+    def delete(self, key):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+            conn.execute('DELETE FROM lists WHERE key = ?', (key,))
+
+    def take_token(self, name, rate, burst=1):
+        """Take a token from the named bucket; returns 0, or the seconds until one is available"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT tokens, updated, paused_until FROM buckets WHERE name = ?', (name,)).fetchone()
+            tokens, updated, paused_until = row or (None, now, 0)
+            tokens, wait = _take_token(tokens, updated, paused_until, now, rate, burst)
+            conn.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)', (name, tokens, now, paused_until))
+        return wait
+
+    def pause(self, name, seconds):
+        """Stop every process from taking tokens from the bucket for `seconds`"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute('SELECT paused_until FROM buckets WHERE name = ?', (name,)).fetchone()
+            paused_until = max(row[0] if row else 0, now + seconds)
+            conn.execute('INSERT OR REPLACE INTO buckets VALUES (?, 0, ?, ?)', (name, now, paused_until))
+
+    def paused_for(self, name):
+        with self.lock:
+            row = self.conn.execute('SELECT paused_until FROM buckets WHERE name = ?', (name,)).fetchone()
+        return max(0, row[0] - time.time()) if row else 0
+
+
+class RedisBackend:
+    """Same operations on Redis or a Redis-compatible server, using WATCH/MULTI transactions"""
+
+    def __init__(self, url, prefix='transcripts:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The Redis state backend needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def append(self, key, value):
+        self.client.rpush(self.prefix + key, json.dumps(value))
+
+    def items(self, key, start=0):
+        return [json.loads(value) for value in self.client.lrange(self.prefix + key, start, -1)]
+
+    def expire(self, key, ttl):
+        self.client.expire(self.prefix + key, int(ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def take_token(self, name, rate, burst=1):
+        key = f"{self.prefix}bucket:{name}"
+        wait = []
+
+        def update(pipe):
+            now = time.time()
+            tokens, updated, paused_until = pipe.hmget(key, 'tokens', 'updated', 'paused_until')
+            tokens, seconds = _take_token(
+                float(tokens) if tokens is not None else None, float(updated or now),
+                float(paused_until or 0), now, rate, burst)
+            pipe.multi()
+            pipe.hset(key, mapping={'tokens': tokens, 'updated': now, 'paused_until': float(paused_until or 0)})
+            wait[:] = [seconds]
+
+        self.client.transaction(update, key)
+        return wait[0]
+
+    def pause(self, name, seconds):
+        key = f"{self.prefix}bucket:{name}"
+
+        def update(pipe):
+            now = time.time()
+            paused_until = max(float(pipe.hget(key, 'paused_until') or 0), now + seconds)
+            pipe.multi()
+            pipe.hset(key, mapping={'tokens': 0, 'updated': now, 'paused_until': paused_until})
+
+        self.client.transaction(update, key)
+
+    def paused_for(self, name):
+        paused_until = self.client.hget(f"{self.prefix}bucket:{name}", 'paused_until')
+        return max(0, float(paused_until) - time.time()) if paused_until else 0
+
+
+def open_backend(spec):
+    """Backend for a TRANSCRIPT_STATE_BACKEND value, or None for in-process state"""
+    if not spec:
+        return None
+    if spec == 'sqlite':
+        return SQLiteBackend()
+    if spec.startswith('sqlite:///'):
+        return SQLiteBackend(spec[len('sqlite:///'):])
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(spec)
+    raise ValueError(f"Unknown state backend: {spec}")
+
+
+_shared_backend = None
+_shared_backend_loaded = False
+_shared_backend_lock = threading.Lock()
+
+
+def get_shared_backend():
+    """Process-wide backend from TRANSCRIPT_STATE_BACKEND, or None if it isn't set"""
+    global _shared_backend, _shared_backend_loaded
+    with _shared_backend_lock:
+        if not _shared_backend_loaded:
+            _shared_backend = open_backend(os.environ.get('TRANSCRIPT_STATE_BACKEND', ''))
+            _shared_backend_loaded = True
+        return _shared_backend
@@ -0,0 +1,121 @@
+import os
+from packed_store import PackedStore
+
+
+def record(text):
+    return {'video': {'id': 'x', 'title': text, 'url': ''}, 'snippets': [[text, 0.0, 1.0]]}
+
+
+def open_store(tmp_path):
+    return PackedStore(str(tmp_path / 'store.pack'), compression='zlib')
+
+
+def segment_path(store):
+    return store._segment_path(store.generation)
+
+
+def index_path(store):
+    return store._index_path(store.generation)
+
+
+def test_records_survive_reopen(tmp_path):
+    with open_store(tmp_path) as store:
+        store.put('a', record('one'))
+        store.put('b', record('two'))
+        store.put('a', record('three'))
+        store.delete('b')
+
+    with open_store(tmp_path) as store:
+        assert store.keys() == ['a']
+        assert store.get('a') == record('three')
+        assert store.get('b') is None
+
+
+def test_torn_trailing_record_is_cut_off(tmp_path):
+    with open_store(tmp_path) as store:
+        store.put('a', record('one'))
+        store.put('b', record('two'))
+        good_size = os.path.getsize(segment_path(store))
+        offset, length = store.index['b']
+    # A crash halfway through appending a third record
+    with open(segment_path(store), 'rb') as f:
+        f.seek(offset)
+        partial = f.read(length - 5)
+    with open(segment_path(store), 'ab') as f:
+        f.write(partial)
+
+    with open_store(tmp_path) as store:
+        assert os.path.getsize(segment_path(store)) == good_size
+        assert store.get('b') == record('two')
+        store.put('c', record('three'))
+
+    with open_store(tmp_path) as store:
+        assert store.keys() == ['a', 'b', 'c']
+        assert store.get('c') == record('three')
+
+
+def test_records_missing_from_index_are_reindexed(tmp_path):
+    with open_store(tmp_path) as store:
+        store.put('a', record('one'))
+        store.put('b', record('two'))
+        store.delete('a')
+    # A crash after the segment writes but before the index caught up: keep the
+    # first index line and half of the second
+    with open(index_path(store), encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(index_path(store), 'w', encoding='utf-8') as f:
+        f.write(lines[0] + lines[1][:3])
+
+    with open_store(tmp_path) as store:
+        assert store.keys() == ['b']
+        assert store.get('b') == record('two')
+    with open(index_path(store), encoding='utf-8') as f:
+        assert all(line.endswith('\n') for line in f)
+
+
+def test_compact_keeps_only_live_records(tmp_path):
+    with open_store(tmp_path) as store:
+        for i in range(5):
+            store.put('a', record(f"version {i}"))
+        store.put('b', record('two'))
+        store.put('c', record('gone'))
+        store.delete('c')
+        old_files = (segment_path(store), index_path(store))
+        before = store.stats()
+
+        reclaimed = store.compact()
+
+        after = store.stats()
+        assert after['generation'] == before['generation'] + 1
+        assert reclaimed == before['segment_bytes'] - after['segment_bytes'] > 0
+        assert after['garbage_ratio'] == 0
+        assert not any(os.path.exists(path) for path in old_files)
+        assert store.get('a') == record('version 4')
+        store.put('d', record('after'))
+
+    with open_store(tmp_path) as store:
+        assert sorted(store.keys()) == ['a', 'b', 'd']
+        assert store.get('b') == record('two')
+        assert store.get('d') == record('after')
+
+
+def test_interrupted_compaction_leaves_old_generation_in_use(tmp_path):
+    with open_store(tmp_path) as store:
+        store.put('a', record('one'))
+        store.put('a', record('two'))
+    # Compaction died after writing part of the next generation, before switching CURRENT
+    with open(store._segment_path(2), 'wb') as f:
+        f.write(b'partial')
+    with open(store._index_path(2), 'w', encoding='utf-8') as f:
+        f.write('a\t0\t7\n')
+
+    with open_store(tmp_path) as store:
+        assert store.generation == 1
+        assert store.get('a') == record('two')
+        store.compact()
+        assert store.generation == 2
+        assert store.get('a') == record('two')
+
+    with open_store(tmp_path) as store:
+        assert store.generation == 2
+        assert store.keys() == ['a']
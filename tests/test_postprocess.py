@@ -0,0 +1,105 @@
+import postprocess
+from postprocess import (clean_snippets, drop_overlaps, sentences, chunks, transcript_sentences, transcript_chunks,
+                         MAX_SENTENCE_WORDS)
+from transcript_cache import CachedSnippet, CachedTranscript
+
+
+def snippets(*texts, duration=2.0):
+    """Back-to-back snippets, `duration` seconds each"""
+    return [CachedSnippet(text, i * duration, duration) for i, text in enumerate(texts)]
+
+
+def transcript(*texts, is_generated=True):
+    return CachedTranscript('vid', snippets(*texts), 'English', 'en', is_generated)
+
+
+def words_after_dedupe(*texts):
+    return ' '.join(word for _, _, words in drop_overlaps(clean_snippets(snippets(*texts))) for word in words)
+
+
+def sentence(start, end, text):
+    return {'start': start, 'end': end, 'tokens': len(text.split()), 'text': text}
+
+
+def test_noise_tags_are_removed_and_empty_snippets_dropped():
+    items = list(clean_snippets(snippets('[Music]', 'hello ♪♪ there', '(applause) welcome [ __ ] back', '♫')))
+    assert items == [(2.0, 4.0, ['hello', 'there']), (4.0, 6.0, ['welcome', 'back'])]
+
+
+def test_rolling_captions_are_deduplicated():
+    assert words_after_dedupe(
+        'so today we are going',
+        'we are going to talk about',
+        'to talk about rate limits',
+    ) == 'so today we are going to talk about rate limits'
+
+
+def test_overlap_ignores_case_and_punctuation():
+    assert words_after_dedupe('Thanks for watching.', 'for watching, and see you') == \
+        'Thanks for watching. and see you'
+
+
+def test_one_word_overlap_is_kept_unless_it_is_the_whole_snippet():
+    # Below MIN_OVERLAP a repeat is as likely to be speech as a rolled caption
+    assert words_after_dedupe('hello my', 'my friend') == 'hello my my friend'
+    assert words_after_dedupe('hello my', 'my') == 'hello my'
+
+
+def test_repeats_are_only_dropped_from_generated_captions():
+    texts = ('No. No.', 'No. No. I said no')
+    manual = [item['text'] for item in transcript_sentences(transcript(*texts, is_generated=False))]
+    generated = [item['text'] for item in transcript_sentences(transcript(*texts))]
+    assert manual == ['No.', 'No.', 'No.', 'No.', 'I said no']
+    assert generated == ['No.', 'No.', 'I said no']
+
+
+def test_sentences_end_at_punctuation():
+    items = clean_snippets(snippets('first part. second', 'part? third'))
+    assert list(sentences(items)) == [
+        sentence(0.0, 2.0, 'first part.'),
+        sentence(0.0, 4.0, 'second part?'),
+        sentence(2.0, 4.0, 'third'),
+    ]
+
+
+def test_sentences_end_at_a_pause():
+    items = [(0.0, 1.0, ['before']), (3.0, 4.0, ['still', 'going']), (6.5, 7.0, ['after'])]
+    assert list(sentences(items)) == [sentence(0.0, 4.0, 'before still going'), sentence(6.5, 7.0, 'after')]
+
+
+def test_sentences_without_punctuation_are_cut_at_max_words():
+    items = [(0.0, 1.0, ['word'] * (MAX_SENTENCE_WORDS * 2 + 3))]
+    assert [item['tokens'] for item in sentences(items)] == [MAX_SENTENCE_WORDS, MAX_SENTENCE_WORDS, 3]
+    assert [item['tokens'] for item in sentences(items, max_words=5)] == [5] * 16 + [3]
+
+
+def test_chunks_respect_the_token_limit():
+    items = [sentence(i, i + 1, 'one two three') for i in range(5)]
+    result = list(chunks(items, max_tokens=7, max_seconds=None))
+    assert [(item['chunk'], item['start'], item['end'], item['tokens']) for item in result] == \
+        [(0, 0, 2, 6), (1, 2, 4, 6), (2, 4, 5, 3)]
+    assert result[0]['text'] == 'one two three one two three'
+
+
+def test_chunks_respect_the_time_limit():
+    items = [sentence(i * 10, i * 10 + 5, 'short one') for i in range(5)]
+    result = list(chunks(items, max_tokens=100, max_seconds=25))
+    # A chunk may span up to 25s from its first sentence's start to its last one's end
+    assert [(item['start'], item['end']) for item in result] == [(0, 25), (30, 45)]
+
+
+def test_an_oversized_sentence_is_a_chunk_of_its_own():
+    items = [sentence(0, 1, 'a b'), sentence(1, 2, ' '.join(['long'] * 10)), sentence(2, 3, 'c d')]
+    assert [item['tokens'] for item in chunks(items, max_tokens=5)] == [2, 10, 2]
+
+
+def test_transcript_chunks_use_the_configured_sizes(monkeypatch):
+    texts = ['one two three four.'] * 6
+    monkeypatch.setitem(postprocess.settings, 'chunk_tokens', 8)
+    monkeypatch.setitem(postprocess.settings, 'chunk_seconds', None)
+    assert [item['tokens'] for item in transcript_chunks(transcript(*texts, is_generated=False))] == [8, 8, 8]
+    assert [item['tokens'] for item in transcript_chunks(transcript(*texts, is_generated=False), max_tokens=12)] == \
+        [12, 12]
+
+    monkeypatch.setitem(postprocess.settings, 'chunk_seconds', 3.0)
+    assert [item['tokens'] for item in transcript_chunks(transcript(*texts, is_generated=False))] == [4] * 6
@@ -0,0 +1,147 @@
+import threading
+import pytest
+import rate_limiter
+from rate_limiter import RateLimiter, RateLimitCancelled, is_block_error
+
+
+class FakeClock:
+    """Stands in for the time module; sleeping just moves the clock on"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeRandom:
+    """Jitter at a fixed fraction of its range"""
+
+    def __init__(self, fraction):
+        self.fraction = fraction
+
+    def uniform(self, low, high):
+        return low + (high - low) * self.fraction
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    monkeypatch.setattr(rate_limiter, 'random', FakeRandom(1.0))
+    return clock
+
+
+class IpBlocked(Exception):
+    pass
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"{status_code} error")
+        self.response = type('Response', (), {'status_code': status_code})()
+
+
+def test_block_errors_are_recognised_by_type_or_429():
+    assert is_block_error(IpBlocked('x'))
+    assert is_block_error(HTTPError(429))
+    assert not is_block_error(HTTPError(500))
+    assert not is_block_error(Exception('This video is blocked in your country'))
+
+
+def test_tokens_refill_at_the_current_rate(clock):
+    limiter = RateLimiter(rate=0.5, burst=2)
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == pytest.approx(2.0)
+
+    clock.now += 1
+    assert limiter.try_acquire() == pytest.approx(1.0)
+    clock.now += 1
+    assert limiter.try_acquire() == 0
+
+
+def test_block_halves_the_rate_and_pauses_exponentially(clock):
+    limiter = RateLimiter(rate=0.8, min_rate=0.1, backoff_base=30, backoff_max=200)
+
+    delays = [limiter.record_block() for _ in range(5)]
+    assert delays == [30, 60, 120, 200, 200]
+    assert limiter.rate == 0.1
+    assert limiter.try_acquire() == pytest.approx(200)
+
+    # No token until the pause is over, even though the bucket has refilled meanwhile
+    clock.now += 199
+    assert limiter.try_acquire() == pytest.approx(1)
+    clock.now += 1
+    assert limiter.try_acquire() == 0
+
+
+def test_backoff_jitter_stays_between_half_and_full_delay(clock, monkeypatch):
+    for fraction, expected in ((0.0, 15), (0.5, 22.5), (1.0, 30)):
+        monkeypatch.setattr(rate_limiter, 'random', FakeRandom(fraction))
+        assert RateLimiter(backoff_base=30).record_block() == expected
+
+
+def test_success_resets_the_backoff_and_creeps_the_rate_up(clock):
+    limiter = RateLimiter(rate=0.2, max_rate=0.25, increase=0.02, backoff_base=10)
+    limiter.record_block()
+    limiter.record_block()
+    assert limiter.state()['consecutive_blocks'] == 2
+
+    for _ in range(20):
+        limiter.record_success()
+    assert limiter.state()['consecutive_blocks'] == 0
+    assert limiter.rate == 0.25
+    assert limiter.record_block() == 10
+
+
+def test_call_waits_out_the_backoff_and_retries(clock):
+    limiter = RateLimiter(rate=1.0, backoff_base=30)
+    outcomes = [IpBlocked('slow down'), IpBlocked('slow down'), 'transcript']
+    backoffs = []
+
+    def fetch():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    result = limiter.call(fetch, on_backoff=lambda error, delay: backoffs.append(delay))
+    assert result == 'transcript'
+    assert backoffs == [30, 60]
+    assert sum(clock.slept) == pytest.approx(90)
+    assert limiter.state()['consecutive_blocks'] == 0
+
+
+def test_call_gives_up_after_max_attempts(clock):
+    limiter = RateLimiter(rate=1.0)
+    calls = []
+
+    def fetch():
+        calls.append(clock.now)
+        raise IpBlocked('still blocked')
+
+    with pytest.raises(IpBlocked):
+        limiter.call(fetch, max_attempts=3)
+    assert len(calls) == 3
+
+
+def test_other_errors_are_not_retried(clock):
+    limiter = RateLimiter(rate=1.0)
+    with pytest.raises(ValueError):
+        limiter.call(lambda: int('x'))
+    assert limiter.state()['consecutive_blocks'] == 0
+
+
+def test_cancelled_wait_raises(clock):
+    limiter = RateLimiter(rate=1.0)
+    limiter.record_block()
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(RateLimitCancelled):
+        limiter.call(lambda: 'never', cancel_event=cancel)
@@ -0,0 +1,73 @@
+import sqlite3
+import threading
+from search_index import SearchIndex
+from transcript_cache import CachedSnippet, CachedTranscript
+
+
+def video(video_id):
+    return {'id': video_id, 'title': f"Title {video_id}", 'url': f"https://www.youtube.com/watch?v={video_id}"}
+
+
+def transcript(video_id, *texts):
+    # 30 second snippets, so each one becomes a chunk of its own
+    return CachedTranscript(video_id, [CachedSnippet(text, i * 30.0, 30.0) for i, text in enumerate(texts)],
+                            'English', 'en')
+
+
+def hits(index, query):
+    return sorted((hit['video_id'], hit['start']) for hit in index.search(query))
+
+
+def test_reindexing_replaces_only_that_videos_chunks(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    index.add(video('a'), transcript('a', 'alpha one', 'alpha two'))
+    index.add(video('b'), transcript('b', 'beta one'))
+    index.add(video('a'), transcript('a', 'gamma one', 'gamma two', 'gamma three'))
+    index.add(video('b'), transcript('b', 'beta two'))
+
+    assert hits(index, 'alpha') == []
+    assert hits(index, 'gamma') == [('a', 0.0), ('a', 30.0), ('a', 60.0)]
+    assert hits(index, 'beta') == [('b', 0.0)]
+    assert hits(index, 'one') == [('a', 0.0)]
+    assert index.stats()['chunks'] == 4
+
+    index.remove('a')
+    assert hits(index, 'gamma') == []
+    assert index.stats() == dict(index.stats(), videos=1, chunks=1)
+
+
+def test_existing_index_without_chunk_table_is_backfilled(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    index.add(video('a'), transcript('a', 'alpha one', 'alpha two'))
+    index.add(video('b'), transcript('b', 'beta one'))
+    with index.conn:
+        index.conn.execute('DROP TABLE video_chunks')
+    index.conn.close()
+
+    index = SearchIndex(str(tmp_path))
+    index.add(video('a'), transcript('a', 'gamma'))
+    assert hits(index, 'alpha') == []
+    assert hits(index, 'beta') == [('b', 0.0)]
+
+
+def test_concurrent_reindexing_from_two_connections(tmp_path):
+    indexes = [SearchIndex(str(tmp_path)), SearchIndex(str(tmp_path))]
+    errors = []
+
+    def reindex(index, worker):
+        try:
+            for round_number in range(20):
+                for video_id in 'abc':
+                    index.add(video(video_id), transcript(video_id, f"{video_id}word {worker}", 'shared text'))
+        except sqlite3.Error as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reindex, args=(index, worker)) for worker, index in enumerate(indexes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert indexes[0].stats()['chunks'] == 6
+    assert [video_id for video_id, _ in hits(indexes[0], 'shared')] == ['a', 'b', 'c']
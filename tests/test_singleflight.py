@@ -0,0 +1,121 @@
+import threading
+import time
+from rate_limiter import RateLimitCancelled
+from singleflight import SingleFlight
+
+
+class Caller(threading.Thread):
+    """Runs flights.do(...) in a thread and keeps its result or exception"""
+
+    def __init__(self, flights, *args, **kwargs):
+        super().__init__(daemon=True)
+        self.flights, self.args, self.kwargs = flights, args, kwargs
+        self.result = self.error = None
+
+    def run(self):
+        try:
+            self.result = self.flights.do(*self.args, **self.kwargs)
+        except BaseException as e:
+            self.error = e
+
+    def outcome(self):
+        self.join(5)
+        assert not self.is_alive()
+        return self.result, self.error
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+class BlockingFetch:
+    """A fetch that runs until released, then returns or raises"""
+
+    def __init__(self, result='transcript'):
+        self.result = result
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def __call__(self, video_id):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(self.result, BaseException):
+            raise self.result
+        return self.result
+
+
+def start_leader_and_followers(flights, fetch, followers=2, **follower_kwargs):
+    leader = Caller(flights, 'vid', fetch, 'vid')
+    leader.start()
+    fetch.started.wait(5)
+    waiting = [Caller(flights, 'vid', fetch, 'vid', **follower_kwargs) for _ in range(followers)]
+    for caller in waiting:
+        caller.start()
+    wait_until(lambda: flights.stats()['coalesced'] == followers)
+    return leader, waiting
+
+
+def test_followers_share_the_leaders_result():
+    flights, fetch = SingleFlight(), BlockingFetch()
+    leader, followers = start_leader_and_followers(flights, fetch, followers=3)
+    fetch.release.set()
+
+    assert [caller.outcome() for caller in [leader] + followers] == [('transcript', None)] * 4
+    assert fetch.calls == 1
+    assert flights.stats() == {'in_flight': 0, 'coalesced': 3}
+
+
+def test_followers_share_the_leaders_error():
+    error = ValueError('no captions')
+    flights, fetch = SingleFlight(), BlockingFetch(error)
+    leader, followers = start_leader_and_followers(flights, fetch)
+    fetch.release.set()
+
+    assert all(caller.outcome() == (None, error) for caller in [leader] + followers)
+    assert fetch.calls == 1
+
+
+def test_leader_cancellation_lets_a_follower_fetch_itself():
+    flights, fetch = SingleFlight(), BlockingFetch(RateLimitCancelled())
+    own_cancel = threading.Event()
+    leader, (follower,) = start_leader_and_followers(flights, fetch, followers=1, cancel_event=own_cancel)
+    fetch.release.set()
+
+    # The follower wasn't cancelled itself, so it isn't stuck with the leader's flight...
+    _, error = follower.outcome()
+    assert isinstance(error, RateLimitCancelled) and not own_cancel.is_set()
+    assert flights.stats()['in_flight'] == 0
+    # ...and retrying (as fetcher.fetch_one does) makes it the leader of a new one
+    fetch.result = 'transcript'
+    assert flights.do('vid', fetch, 'vid', cancel_event=own_cancel) == 'transcript'
+    assert fetch.calls == 2
+
+
+def test_cancelled_follower_stops_waiting_for_the_leader():
+    flights, fetch = SingleFlight(), BlockingFetch()
+    cancel = threading.Event()
+    leader, (follower,) = start_leader_and_followers(flights, fetch, followers=1, cancel_event=cancel)
+    cancel.set()
+
+    _, error = follower.outcome()
+    assert isinstance(error, RateLimitCancelled)
+    assert leader.is_alive()
+    fetch.release.set()
+    assert leader.outcome() == ('transcript', None)
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flights, fetch = SingleFlight(), BlockingFetch()
+    leader = Caller(flights, 'vid', fetch, 'vid')
+    leader.start()
+    fetch.started.wait(5)
+
+    assert flights.do('other', lambda video_id: video_id, 'other') == 'other'
+    assert flights.stats() == {'in_flight': 1, 'coalesced': 0}
+    fetch.release.set()
+    leader.outcome()
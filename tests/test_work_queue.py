@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+import pytest
+import work_queue
+from work_queue import (SQLiteQueue, FileQueue, PENDING, LEASED, DONE, FAILED, MAX_ATTEMPTS, DEFAULT_LEASE,
+                        RETRY_DELAY)
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(work_queue, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['sqlite', 'file'])
+def queue(request, tmp_path, clock):
+    if request.param == 'sqlite':
+        return SQLiteQueue(str(tmp_path / 'crawl.db'))
+    return FileQueue(str(tmp_path / 'queue'))
+
+
+def task(video_id):
+    return {'video_id': video_id, 'video_num': 1, 'video': {'id': video_id}}
+
+
+def entry(queue, video_id):
+    """(status, worker, lease_until, attempts) of a task, whichever broker holds it"""
+    if isinstance(queue, SQLiteQueue):
+        return queue.conn.execute('SELECT status, worker, lease_until, attempts FROM tasks WHERE video_id = ?',
+                                  (video_id,)).fetchone()
+    status, name = queue._find(video_id, (PENDING, LEASED, DONE, FAILED))
+    with open(os.path.join(queue.folder, status, name), encoding='utf-8') as f:
+        data = json.load(f)
+    return status, data.get('worker'), data.get('lease_until'), data['attempts']
+
+
+def leased_ids(queue, worker, count=10, lease_seconds=DEFAULT_LEASE):
+    return [leased['video_id'] for leased in queue.lease(worker, count, lease_seconds)]
+
+
+def test_put_skips_videos_already_queued(queue):
+    assert queue.put([task('a'), task('b')]) == 2
+    assert queue.put([task('b'), task('c')]) == 1
+    assert queue.stats() == {PENDING: 3, LEASED: 0, DONE: 0, FAILED: 0}
+
+
+def test_each_task_is_leased_once_in_queue_order(queue):
+    queue.put([task(video_id) for video_id in 'abcde'])
+    assert leased_ids(queue, 'w1', 2) == ['a', 'b']
+    assert leased_ids(queue, 'w2', 10) == ['c', 'd', 'e']
+    assert leased_ids(queue, 'w3') == []
+    assert entry(queue, 'c')[:2] == (LEASED, 'w2')
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue, clock):
+    queue.put([task('a')])
+    assert leased_ids(queue, 'w1') == ['a']
+
+    clock.advance(DEFAULT_LEASE - 1)
+    assert leased_ids(queue, 'w2') == []
+    clock.advance(2)
+    assert leased_ids(queue, 'w2') == ['a']
+    status, worker, lease_until, attempts = entry(queue, 'a')
+    assert (status, worker, lease_until, attempts) == (LEASED, 'w2', clock.now + DEFAULT_LEASE, 2)
+
+    # The dead worker's extension doesn't take the lease back
+    queue.extend(['a'], 'w1')
+    assert entry(queue, 'a')[1] == 'w2'
+
+
+def test_extended_lease_is_not_reclaimed(queue, clock):
+    queue.put([task('a')])
+    leased_ids(queue, 'w1')
+    for _ in range(3):
+        clock.advance(DEFAULT_LEASE * 2 / 3)
+        queue.extend(['a'], 'w1')
+        assert leased_ids(queue, 'w2') == []
+    assert entry(queue, 'a')[:2] == (LEASED, 'w1')
+
+
+def test_reclaimed_task_goes_back_to_pending_without_a_lease(queue, clock):
+    queue.put([task('a'), task('b')])
+    leased_ids(queue, 'w1', 1)
+    clock.advance(DEFAULT_LEASE + 1)
+    leased_ids(queue, 'w2', 0)  # Leasing nothing still reclaims
+
+    assert entry(queue, 'a') == (PENDING, None, None, 1)
+
+
+def test_task_fails_after_its_lease_expires_too_often(queue, clock):
+    queue.put([task('a')])
+    for attempt in range(MAX_ATTEMPTS):
+        assert leased_ids(queue, f"w{attempt}") == ['a']
+        clock.advance(DEFAULT_LEASE + 1)
+
+    assert leased_ids(queue, 'last') == []
+    assert entry(queue, 'a')[0] == FAILED
+    assert queue.failures() == [('a', 'lease expired too often')]
+
+
+def test_retryable_failure_waits_before_the_next_attempt(queue, clock):
+    queue.put([task('a')])
+    for attempt in range(1, MAX_ATTEMPTS):
+        assert leased_ids(queue, 'w1') == ['a']
+        queue.fail('a', 'timed out')
+        status, worker, _, attempts = entry(queue, 'a')
+        assert (status, worker, attempts) == (PENDING, None, attempt)
+
+        # Not due before RETRY_DELAY seconds per attempt so far
+        clock.advance(RETRY_DELAY * attempt - 1)
+        assert leased_ids(queue, 'w1') == []
+        clock.advance(1)
+
+    assert leased_ids(queue, 'w1') == ['a']
+    queue.fail('a', 'timed out')
+    assert entry(queue, 'a')[0] == FAILED
+    assert queue.failures() == [('a', 'timed out')]
+
+
+def test_permanent_failure_is_not_retried(queue):
+    queue.put([task('a')])
+    leased_ids(queue, 'w1')
+    queue.fail('a', 'no captions', retry=False)
+    assert queue.stats() == {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 1}
+
+
+def test_release_hands_tasks_back_without_using_an_attempt(queue):
+    queue.put([task('a'), task('b')])
+    leased_ids(queue, 'w1')
+    queue.ack('a', {'filename': 'a.txt'})
+    queue.release(['a', 'b'])
+
+    assert entry(queue, 'a')[0] == DONE
+    assert entry(queue, 'b') == (PENDING, None, None, 0)
+    assert leased_ids(queue, 'w2') == ['b']
+
+
+def test_ack_and_fail_are_not_lost_while_leases_are_extended(queue):
+    video_ids = [f"v{i:03d}" for i in range(200)]
+    queue.put([task(video_id) for video_id in video_ids])
+    assert len(leased_ids(queue, 'w1', len(video_ids))) == len(video_ids)
+
+    # The lease keeper renews everything the worker holds while results come in
+    stop = threading.Event()
+
+    def keep_leases():
+        while not stop.is_set():
+            queue.extend(video_ids, 'w1')
+
+    keeper = threading.Thread(target=keep_leases, daemon=True)
+    keeper.start()
+    try:
+        for i, video_id in enumerate(video_ids):
+            if i % 2:
+                queue.fail(video_id, 'no captions', retry=False)
+            else:
+                queue.ack(video_id)
+    finally:
+        stop.set()
+        keeper.join(5)
+
+    assert queue.stats() == {PENDING: 0, LEASED: 0, DONE: 100, FAILED: 100}
@@ -0,0 +1,288 @@
+"""
+Playlist enumeration and video title resolution.
+
+Titles come in bulk from the playlist page data pytube already downloads
+(one request per ~100 videos). Anything still missing is looked up in
+parallel and remembered in the shared on-disk cache. Concurrent lookups of
+the same title or playlist share one request.
+"""
+import html
+import json
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pytube import Playlist, YouTube
+from transcript_cache import get_shared_cache
+from egress import get_shared_pool
+from http_client import get_shared_session
+from singleflight import SingleFlight
+from metrics import metrics
+
+TITLE_WORKERS = 8
+TITLE_ATTEMPTS = 2
+# Titles are nice to have: rather than hold a request while every endpoint is
+# paused, give up after this many seconds and let the caller use a placeholder
+TITLE_MAX_WAIT = 5
+
+title_flights = SingleFlight()
+playlist_flights = SingleFlight()
+
+WATCH_PAGE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept-Language': 'en-US,en'
+}
+
+
+def video_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def _find_key(data, key):
+    """Yield every value stored under `key` anywhere in a nested JSON structure"""
+    if isinstance(data, dict):
+        for k, v in data.items():
+            if k == key:
+                yield v
+            else:
+                yield from _find_key(v, key)
+    elif isinstance(data, list):
+        for item in data:
+            yield from _find_key(item, key)
+
+
+def _renderer_title(renderer):
+    title = renderer.get('title', {})
+    if 'simpleText' in title:
+        return title['simpleText']
+    runs = title.get('runs') or []
+    return ''.join(run.get('text', '') for run in runs) or None
+
+
+def _extract_page(data):
+    """Return ([{'id', 'title', 'url'}], continuation token) from one page of playlist JSON"""
+    entries = []
+    for renderer in _find_key(data, 'playlistVideoRenderer'):
+        video_id = renderer.get('videoId')
+        if video_id:
+            entries.append({'id': video_id, 'title': _renderer_title(renderer), 'url': video_url(video_id)})
+
+    continuation = None
+    for item in _find_key(data, 'continuationItemRenderer'):
+        for command in _find_key(item, 'continuationCommand'):
+            continuation = command.get('token')
+    return entries, continuation
+
+
+def _first_page(playlist):
+    """(entries, continuation token) of a pytube Playlist's first page"""
+    # Fetch the pages over the pooled keep-alive session instead of pytube's one-off connections
+    if not playlist._html:
+        with metrics.timer('playlist_page'):
+            playlist._html = get_shared_session().get(playlist.playlist_url, headers=WATCH_PAGE_HEADERS).text
+    return _extract_page(playlist.initial_data)
+
+
+def _next_page(playlist, continuation):
+    """(entries, continuation token) of the page behind a continuation token"""
+    url, headers, data = playlist._build_continuation_url(continuation)
+    with metrics.timer('playlist_page'):
+        response = get_shared_session().post(url, headers=dict(WATCH_PAGE_HEADERS, **headers), json=data)
+        response.raise_for_status()
+        return _extract_page(response.json())
+
+
+def _iter_pages(playlist):
+    """Yield (entries, has_more) for each page of a pytube Playlist"""
+    seen = set()
+    entries, continuation = _first_page(playlist)
+
+    while True:
+        page = [entry for entry in entries if entry['id'] not in seen]
+        seen.update(entry['id'] for entry in page)
+        if page or not continuation:
+            yield page, bool(continuation)
+
+        if not continuation:
+            break
+        entries, continuation = _next_page(playlist, continuation)
+
+
+def iter_playlist_pages(playlist):
+    """
+    Yield a pytube Playlist one page at a time as lists of entry dicts.
+    Titles are read straight from the page data; pages are only fetched as
+    the caller asks for them.
+    """
+    for page, _ in _iter_pages(playlist):
+        if page:
+            yield page
+
+
+def iter_playlist_videos(playlist_url):
+    """Yield a playlist's entries lazily, page by page, with titles resolved"""
+    for page in iter_playlist_pages(Playlist(playlist_url)):
+        resolve_titles(page)
+        yield from page
+
+
+def load_playlist(playlist_url):
+    """
+    All of a playlist's entries as a list. Callers loading the same playlist
+    at the same time share one enumeration; each gets its own copies.
+    """
+    videos = playlist_flights.do(playlist_url, lambda: list(iter_playlist_videos(playlist_url)))
+    return [dict(video) for video in videos]
+
+
+def _flight_gauges():
+    return [('coalesced_requests', {'kind': kind}, flights.stats()['coalesced'])
+            for kind, flights in (('title', title_flights), ('playlist', playlist_flights))]
+
+
+metrics.add_collector(_flight_gauges)
+
+
+def _fetch_title_via(endpoint, video_id):
+    with metrics.timer('title_lookup'):
+        return _lookup_title(endpoint, video_id)
+
+
+def _lookup_title(endpoint, video_id):
+    # pytube can't be given a per-request proxy, so it is only used for direct requests
+    if endpoint.is_direct:
+        try:
+            return YouTube(video_url(video_id)).title
+        except Exception:
+            pass
+
+    # Fallback: read the title from the watch page
+    response = endpoint.session().get(video_url(video_id), headers=WATCH_PAGE_HEADERS)
+    if response.status_code == 429:
+        response.raise_for_status()  # Lets the egress pool quarantine the endpoint
+    if response.status_code == 200:
+        match = re.search(r'"title":"((?:[^"\\]|\\.)+)"', response.text)
+        if match:
+            return json.loads(f'"{match.group(1)}"')
+
+        for pattern in (r'<title>([^<]+)</title>', r'property="og:title" content="([^"]+)"'):
+            match = re.search(pattern, response.text)
+            if match:
+                return html.unescape(match.group(1)).replace(' - YouTube', '').strip()
+
+    return None
+
+
+def fetch_title(video_id, pool=None):
+    """Look up a single video's title through the egress pool, or return None if it can't be found"""
+    try:
+        return title_flights.do(video_id, (pool or get_shared_pool()).call, _fetch_title_via, video_id,
+                                max_attempts=TITLE_ATTEMPTS, max_wait=TITLE_MAX_WAIT)
+    except Exception:
+        return None
+
+
+def resolve_titles(entries, workers=TITLE_WORKERS, use_cache=True):
+    """
+    Fill in missing 'title' values on entry dicts in place.
+    Cached titles are used first; the rest are fetched in parallel.
+    Entries whose title can't be found are left as None.
+    """
+    cache = get_shared_cache() if use_cache else None
+
+    if cache is not None:
+        cache.put_titles({entry['id']: entry['title'] for entry in entries if entry.get('title')})
+        cached = cache.get_titles([entry['id'] for entry in entries if not entry.get('title')])
+        for entry in entries:
+            if not entry.get('title'):
+                entry['title'] = cached.get(entry['id'])
+
+    missing = [entry for entry in entries if not entry.get('title')]
+    if missing:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='title') as executor:
+            for entry, title in zip(missing, executor.map(fetch_title, [e['id'] for e in missing])):
+                entry['title'] = title
+
+        if cache is not None:
+            cache.put_titles({entry['id']: entry['title'] for entry in missing if entry['title']})
+
+    return entries
+
+
+class PlaylistPager:
+    """
+    Serves a playlist one page at a time behind opaque cursors, so callers
+    can show the first videos while the rest are still being enumerated.
+    A cursor stands for the playlist's continuation token and position
+    (not a live connection), kept in the shared state backend when there is
+    one, so the next page can be served by any worker process. Cursors that
+    aren't used within `ttl` seconds are forgotten. Titles that can't be
+    looked up are left as None, like iter_playlist_videos does.
+    """
+
+    def __init__(self, ttl=600, backend=None):
+        self.ttl = ttl
+        self.backend = backend
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def first_page(self, playlist_url):
+        playlist = Playlist(playlist_url)
+        entries, continuation = _first_page(playlist)
+        return self._next(playlist, {'url': playlist_url, 'start': 0, 'seen': []}, entries, continuation)
+
+    def next_page(self, cursor):
+        """Return the page after `cursor`; raises KeyError for unknown or expired cursors"""
+        state = self._pop(cursor)
+        playlist = Playlist(state['url'])
+        entries, continuation = _next_page(playlist, state['continuation'])
+        return self._next(playlist, state, entries, continuation)
+
+    def _next(self, playlist, state, entries, continuation):
+        seen = set(state['seen'])
+        page = [entry for entry in entries if entry['id'] not in seen]
+        # Pages that only repeat earlier videos are skipped rather than sent empty
+        while not page and continuation:
+            entries, continuation = _next_page(playlist, continuation)
+            page = [entry for entry in entries if entry['id'] not in seen]
+
+        start = state['start']
+        resolve_titles(page)
+
+        cursor = None
+        if continuation:
+            cursor = uuid.uuid4().hex
+            self._save(cursor, {
+                'url': state['url'],
+                'continuation': continuation,
+                'start': start + len(page),
+                'seen': state['seen'] + [entry['id'] for entry in page]
+            })
+
+        return {'videos': page, 'start': start, 'next_cursor': cursor}
+
+    def _save(self, cursor, state):
+        if self.backend is not None:
+            self.backend.set(f"cursor:{cursor}", state, ttl=self.ttl)
+            return
+        with self.lock:
+            self.sessions[cursor] = (state, time.time() + self.ttl)
+
+    def _pop(self, cursor):
+        # Cursors are single use, like the pages they stand for
+        if self.backend is not None:
+            state = self.backend.get(f"cursor:{cursor}")
+            if state is None:
+                raise KeyError(cursor)
+            self.backend.delete(f"cursor:{cursor}")
+            return state
+        self._prune()
+        with self.lock:
+            return self.sessions.pop(cursor)[0]
+
+    def _prune(self):
+        now = time.time()
+        with self.lock:
+            for cursor in [c for c, (_, expires) in self.sessions.items() if expires < now]:
+                del self.sessions[cursor]
@@ -0,0 +1,291 @@
+"""
+Persistent on-disk cache of fetched transcripts.
+
+Transcripts are stored in a SQLite file keyed by video ID and language, so
+re-running a playlist (from any front end) doesn't spend YouTube requests.
+Resolved video titles are kept alongside them, and so are permanent
+failures (no captions, private or deleted videos) so later runs skip those
+videos until the re-check interval is up. Entries expire after a TTL and the
+least recently used transcripts are evicted once the cache grows past its
+size limit.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from metrics import metrics
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'TRANSCRIPT_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'youtube-transcripts')
+)
+DEFAULT_TTL = 30 * 24 * 3600  # 30 days
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024  # 500 MB
+DEFAULT_LANGUAGE = 'en'
+# Videos that failed permanently are tried again after this many days
+DEFAULT_FAILURE_TTL = float(os.environ.get('TRANSCRIPT_RECHECK_DAYS', 7)) * 24 * 3600
+
+
+class CachedSnippet:
+    """Same attributes as a youtube_transcript_api snippet"""
+
+    def __init__(self, text, start, duration):
+        self.text = text
+        self.start = start
+        self.duration = duration
+
+
+class CachedTranscript:
+    """Same attributes as a youtube_transcript_api FetchedTranscript"""
+
+    def __init__(self, video_id, snippets, language, language_code, is_generated=False):
+        self.video_id = video_id
+        self.snippets = snippets
+        self.language = language
+        self.language_code = language_code
+        self.is_generated = is_generated
+
+    def __iter__(self):
+        return iter(self.snippets)
+
+    def __len__(self):
+        return len(self.snippets)
+
+
+class CachedFailure(Exception):
+    """A video that failed permanently on an earlier run and isn't due for a re-check yet"""
+
+    def __init__(self, error_type, message, failed_at):
+        days = (time.time() - failed_at) / 86400
+        super().__init__(f"{message} (cached {error_type} from {days:.1f} days ago)")
+        self.error_type = error_type
+
+
+class TranscriptCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES,
+                 failure_ttl=DEFAULT_FAILURE_TTL):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, 'transcripts.sqlite3')
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_evict = 0
+        self.lock = threading.Lock()
+
+        # One connection shared by all threads; SQLite itself coordinates between processes
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    video_id TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    language_name TEXT,
+                    language_code TEXT,
+                    is_generated INTEGER,
+                    snippets BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, language)
+                )
+            ''')
+            self.conn.execute(
+                'CREATE INDEX IF NOT EXISTS transcripts_accessed ON transcripts (accessed_at)')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS failures (
+                    video_id TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    error_type TEXT NOT NULL,
+                    message TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, language)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS titles (
+                    video_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+
+    def get(self, video_id, language=DEFAULT_LANGUAGE):
+        """Return a CachedTranscript, or None if missing or expired"""
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                'SELECT language_name, language_code, is_generated, snippets, created_at '
+                'FROM transcripts WHERE video_id = ? AND language = ?',
+                (video_id, language)
+            ).fetchone()
+
+            if row is None or now - row[4] > self.ttl:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.conn.execute(
+                'UPDATE transcripts SET accessed_at = ? WHERE video_id = ? AND language = ?',
+                (now, video_id, language)
+            )
+
+        language_name, language_code, is_generated, blob, _ = row
+        snippets = [CachedSnippet(*item) for item in json.loads(zlib.decompress(blob))]
+        return CachedTranscript(video_id, snippets, language_name, language_code, bool(is_generated))
+
+    def put(self, video_id, transcript, language=DEFAULT_LANGUAGE):
+        """Store a fetched transcript (anything with snippets/language/language_code)"""
+        data = [[s.text, s.start, s.duration] for s in transcript.snippets]
+        blob = zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (video_id, language, transcript.language, transcript.language_code,
+                 int(getattr(transcript, 'is_generated', False)), blob, len(blob), now, now)
+            )
+            self.conn.execute(
+                'DELETE FROM failures WHERE video_id = ? AND language = ?', (video_id, language))
+            self._puts_since_evict += 1
+            evict = self._puts_since_evict >= 50
+
+        if evict:
+            self.evict()
+
+    def get_failure(self, video_id, language=DEFAULT_LANGUAGE):
+        """CachedFailure for a permanent failure that is still within failure_ttl, else None"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT error_type, message, created_at FROM failures WHERE video_id = ? AND language = ?',
+                (video_id, language)
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.failure_ttl:
+            return None
+        return CachedFailure(*row)
+
+    def put_failure(self, video_id, error, language=DEFAULT_LANGUAGE):
+        """Remember a permanent failure (the caller decides what counts as permanent)"""
+        # youtube_transcript_api errors carry a one-line cause next to their long help text
+        message = getattr(error, 'cause', None) or str(error)
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO failures VALUES (?, ?, ?, ?, ?)',
+                (video_id, language, getattr(error, 'error_type', type(error).__name__),
+                 str(message).strip()[:500], time.time())
+            )
+
+    def get_titles(self, video_ids):
+        """Return {video_id: title} for the IDs that have an unexpired cached title"""
+        titles = {}
+        cutoff = time.time() - self.ttl
+        video_ids = list(video_ids)
+        with self.lock:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(video_ids), 500):
+                chunk = video_ids[i:i + 500]
+                rows = self.conn.execute(
+                    f'SELECT video_id, title FROM titles WHERE created_at >= ? '
+                    f'AND video_id IN ({",".join("?" * len(chunk))})',
+                    [cutoff] + chunk
+                ).fetchall()
+                titles.update(rows)
+        return titles
+
+    def put_titles(self, titles):
+        """Store a {video_id: title} mapping"""
+        if not titles:
+            return
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO titles VALUES (?, ?, ?)',
+                [(video_id, title, now) for video_id, title in titles.items()]
+            )
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        with self.lock, self.conn:
+            self._puts_since_evict = 0
+            cutoff = time.time() - self.ttl
+            self.conn.execute('DELETE FROM transcripts WHERE created_at < ?', (cutoff,))
+            self.conn.execute('DELETE FROM titles WHERE created_at < ?', (cutoff,))
+            self.conn.execute(
+                'DELETE FROM failures WHERE created_at < ?', (time.time() - self.failure_ttl,))
+
+            total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM transcripts').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            rows = self.conn.execute(
+                'SELECT video_id, language, size FROM transcripts ORDER BY accessed_at').fetchall()
+            for video_id, language, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute(
+                    'DELETE FROM transcripts WHERE video_id = ? AND language = ?', (video_id, language))
+                total -= size
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM transcripts')
+            self.conn.execute('DELETE FROM titles')
+            self.conn.execute('DELETE FROM failures')
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts').fetchone()
+            failures = self.conn.execute('SELECT COUNT(*) FROM failures').fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'bytes': size,
+                'failures': failures,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+
+
+_shared_cache = None
+_shared_cache_enabled = os.environ.get('TRANSCRIPT_CACHE', '1') != '0'
+_shared_cache_lock = threading.Lock()
+
+
+def configure_shared_cache(cache_dir=None, enabled=True, **kwargs):
+    """Point the process-wide cache at cache_dir (or turn it off) before first use"""
+    global _shared_cache, _shared_cache_enabled
+    with _shared_cache_lock:
+        _shared_cache_enabled = enabled
+        _shared_cache = TranscriptCache(cache_dir or DEFAULT_CACHE_DIR, **kwargs) if enabled else None
+
+
+def _cache_gauges():
+    cache = _shared_cache
+    if cache is None:
+        return []
+    with cache.lock:
+        hits, misses = cache.hits, cache.misses
+    lookups = hits + misses
+    return [('cache_hits', {}, hits), ('cache_misses', {}, misses),
+            ('cache_hit_ratio', {}, hits / lookups if lookups else 0.0)]
+
+
+metrics.add_collector(_cache_gauges)
+
+
+def get_shared_cache():
+    """Process-wide cache in DEFAULT_CACHE_DIR, or None if disabled with TRANSCRIPT_CACHE=0"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if not _shared_cache_enabled:
+            return None
+        if _shared_cache is None:
+            _shared_cache = TranscriptCache()
+        return _shared_cache
@@ -0,0 +1,395 @@
+"""
+Shared transcript pipeline used by the CLI, the desktop GUI and the web app.
+
+    resolve -> fetch -> transform -> write
+
+resolve_urls() turns URLs into numbered video entries, run_pipeline()
+fetches them concurrently (through the shared egress pool and cache) and
+hands each transcript to one or more writers: per-video txt/clean/jsonl/chunks/srt/vtt
+files, a single Parquet file for the whole run, or a packed store.
+"""
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from fetcher import fetch_transcripts
+from manifest import classify_error, DONE
+from metrics import metrics
+from packed_store import PackedWriter
+from postprocess import transcript_sentences, transcript_chunks
+from titles import iter_playlist_videos, resolve_titles, video_url
+
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+def extract_video_id(url):
+    """Video ID from a watch/youtu.be URL or a bare 11 character ID, else None"""
+    if 'watch?v=' in url:
+        return url.split('watch?v=')[1].split('&')[0]
+    elif 'youtu.be/' in url:
+        return url.split('youtu.be/')[1].split('?')[0]
+    elif VIDEO_ID_PATTERN.match(url):
+        return url
+    return None
+
+
+def is_playlist(url):
+    return 'list=' in url
+
+
+def sanitize_filename(title):
+    """Remove invalid characters from filename"""
+    return re.sub(r'[<>:"/\\|?*]', '', title)
+
+
+def transcript_filename(video_num, title, extension='.txt', language=None):
+    """01_Title.txt, or 01_Title.de.txt when the run asked for several languages"""
+    tag = f".{language}" if language else ''
+    return f"{video_num:02d}_{sanitize_filename(title)}{tag}{extension}"
+
+
+# Resolve
+
+def fill_missing_titles(videos):
+    """Title videos whose title couldn't be looked up with their ID; returns those videos"""
+    missing = [video for video in videos if not video['title']]
+    for video in missing:
+        video['title'] = video['id']
+    return missing
+
+
+def resolve_video(url):
+    """Entry dict for a single video URL (title looked up), or None for an invalid URL"""
+    video_id = extract_video_id(url)
+    if not video_id:
+        return None
+    video = {'id': video_id, 'title': None, 'url': video_url(video_id)}
+    resolve_titles([video])
+    fill_missing_titles([video])
+    return video
+
+
+def resolve_urls(urls, start_from=1, on_invalid=None, on_skipped=None):
+    """
+    Yield (video_num, video) for every video behind the given URLs.
+    Playlists are enumerated lazily, one page at a time, and numbered by
+    their playlist position; entries before start_from are skipped (and
+    passed to on_skipped(video_num, video)).
+    """
+    for url in urls:
+        if is_playlist(url):
+            for video_num, video in enumerate(iter_playlist_videos(url), 1):
+                fill_missing_titles([video])
+                if video_num >= start_from:
+                    yield video_num, video
+                elif on_skipped:
+                    on_skipped(video_num, video)
+        else:
+            video = resolve_video(url)
+            if video:
+                yield 1, video
+            elif on_invalid:
+                on_invalid(url)
+
+
+def select_videos(videos, start_index=0, skip_ids=()):
+    """(video_num, video) pairs for a loaded video list: from start_index on, minus skip_ids"""
+    skip_ids = set(skip_ids)
+    return [(i, video) for i, video in enumerate(videos[start_index:], start_index + 1)
+            if video['id'] not in skip_ids]
+
+
+# Transform
+# Each format is a generator of text pieces, so writers can stream long transcripts to disk
+
+def _header(video, transcript_result):
+    return (
+        f"Video ID: {video['id']}\n"
+        f"Title: {video['title']}\n"
+        f"URL: {video['url']}\n"
+        f"Language: {transcript_result.language} ({transcript_result.language_code})\n"
+        f"{'-'*80}\n\n"
+    )
+
+
+def iter_transcript(video, transcript_result, video_num=None):
+    """Plain text transcript with the usual header, the snippets joined into one paragraph"""
+    yield _header(video, transcript_result)
+    for i, snippet in enumerate(transcript_result.snippets):
+        yield snippet.text if i == 0 else ' ' + snippet.text
+
+
+def iter_clean_transcript(video, transcript_result, video_num=None):
+    """Same header, then the cleaned-up text (see postprocess.py) one sentence per line"""
+    yield _header(video, transcript_result)
+    for sentence in transcript_sentences(transcript_result):
+        yield sentence['text'] + '\n'
+
+
+def transcript_rows(video, transcript_result, video_num=None):
+    """One dict per snippet, with its timing and the video it belongs to"""
+    for i, snippet in enumerate(transcript_result.snippets):
+        yield {
+            'video_id': video['id'],
+            'video_num': video_num,
+            'title': video['title'],
+            'language': transcript_result.language,
+            'language_code': transcript_result.language_code,
+            'is_generated': bool(getattr(transcript_result, 'is_generated', False)),
+            'snippet': i,
+            'start': snippet.start,
+            'duration': snippet.duration,
+            'text': snippet.text
+        }
+
+
+def iter_jsonl(video, transcript_result, video_num=None):
+    """One JSON object per snippet, with timestamps"""
+    for row in transcript_rows(video, transcript_result, video_num):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def iter_chunks(video, transcript_result, video_num=None):
+    """One JSON object per chunk of cleaned sentences, with start and end timestamps (for search/RAG)"""
+    for chunk in transcript_chunks(transcript_result):
+        yield json.dumps({
+            'video_id': video['id'],
+            'video_num': video_num,
+            'title': video['title'],
+            'language_code': transcript_result.language_code,
+            **chunk
+        }, ensure_ascii=False) + '\n'
+
+
+def _timestamp(seconds, separator):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def _cues(transcript_result, separator):
+    for i, snippet in enumerate(transcript_result.snippets, 1):
+        start = _timestamp(snippet.start, separator)
+        end = _timestamp(snippet.start + snippet.duration, separator)
+        yield i, f"{start} --> {end}", snippet.text
+
+
+def iter_srt(video, transcript_result, video_num=None):
+    for i, timing, text in _cues(transcript_result, ','):
+        yield f"{i}\n{timing}\n{text}\n\n"
+
+
+def iter_vtt(video, transcript_result, video_num=None):
+    yield f"WEBVTT\nKind: captions\nLanguage: {transcript_result.language_code}\n\n"
+    for _, timing, text in _cues(transcript_result, '.'):
+        yield f"{timing}\n{text}\n\n"
+
+
+# Per-video text formats: name -> (file extension, transform)
+TEXT_FORMATS = {
+    'txt': ('.txt', iter_transcript),
+    'clean': ('.clean.txt', iter_clean_transcript),
+    'jsonl': ('.jsonl', iter_jsonl),
+    'chunks': ('.chunks.jsonl', iter_chunks),
+    'srt': ('.srt', iter_srt),
+    'vtt': ('.vtt', iter_vtt)
+}
+OUTPUT_FORMATS = tuple(TEXT_FORMATS) + ('parquet', 'packed')
+
+
+def render_stream(video_num, video, transcript_result, output_format='txt', language=None):
+    """(filename, iterator of text pieces) for one transcript in one of TEXT_FORMATS"""
+    extension, transform = TEXT_FORMATS[output_format]
+    filename = transcript_filename(video_num, video['title'], extension, language)
+    return filename, transform(video, transcript_result, video_num)
+
+
+def render(video_num, video, transcript_result, output_format='txt', language=None):
+    """(filename, text) for one transcript in one of TEXT_FORMATS"""
+    filename, pieces = render_stream(video_num, video, transcript_result, output_format, language)
+    return filename, ''.join(pieces)
+
+
+# Write
+
+class FolderWriter:
+    """Writes each transcript as its own file in a folder"""
+
+    def __init__(self, folder, output_format='txt'):
+        self.folder = folder
+        self.output_format = output_format
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, video_num, video, transcript_result, language=None):
+        """Save one transcript and return (filename, path)"""
+        filename, pieces = render_stream(video_num, video, transcript_result, self.output_format, language)
+        path = os.path.join(self.folder, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(pieces)
+        return filename, path
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """
+    Collects a whole run into a single Parquet file (needs pyarrow), one row
+    per snippet. Rows are written in row groups of batch_rows; the file is
+    only complete once close() has been called.
+    """
+
+    def __init__(self, folder, filename=None, batch_rows=50000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.schema = pyarrow.schema([
+            ('video_id', pyarrow.string()),
+            ('video_num', pyarrow.int32()),
+            ('title', pyarrow.string()),
+            ('language', pyarrow.string()),
+            ('language_code', pyarrow.string()),
+            ('is_generated', pyarrow.bool_()),
+            ('snippet', pyarrow.int32()),
+            ('start', pyarrow.float64()),
+            ('duration', pyarrow.float64()),
+            ('text', pyarrow.string())
+        ])
+        os.makedirs(folder, exist_ok=True)
+        # A new file per run, so resuming never has to rewrite an earlier one
+        self.filename = filename or f"transcripts-{time.strftime('%Y%m%d-%H%M%S')}.parquet"
+        self.path = os.path.join(folder, self.filename)
+        self.batch_rows = batch_rows
+        self.rows = []
+        self.writer = None
+        self.lock = threading.Lock()
+
+    def write(self, video_num, video, transcript_result, language=None):
+        # Rows carry their language_code, so several languages share the file
+        with self.lock:
+            self.rows.extend(transcript_rows(video, transcript_result, video_num))
+            if len(self.rows) >= self.batch_rows:
+                self._flush()
+        return self.filename, self.path
+
+    def _flush(self):
+        if not self.rows:
+            return
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, self.schema, compression='zstd')
+        self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+
+def make_writer(folder, output_format='txt'):
+    if output_format == 'parquet':
+        return ParquetWriter(folder)
+    if output_format == 'packed':
+        return PackedWriter(folder)
+    if output_format not in TEXT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    return FolderWriter(folder, output_format)
+
+
+def run_pipeline(videos, writer=None, manifest=None, output_format='txt', index=None, **fetch_options):
+    """
+    Fetch, transform and write transcripts for an iterable of
+    (video_num, video) pairs, yielding one result dict per video in order.
+
+    `writer` may be a single writer or a list of them (e.g. txt files plus a
+    Parquet file), all fed from the same fetch result; writers are closed at
+    the end. Without a writer the text in `output_format` is returned in
+    result['content']. Results are recorded in `manifest` and saved
+    transcripts added to the search `index` when given. fetch_options go to fetcher.fetch_transcripts (workers, cancel_event,
+    use_cache, languages, ...).
+
+    With a `languages` plan every transcript of a video is written, tagged
+    with its language code, and result['languages'] lists the codes; the
+    first one is the primary transcript used for content and the index.
+    """
+    if writer is None:
+        writers = []
+    elif isinstance(writer, (list, tuple)):
+        writers = list(writer)
+    else:
+        writers = [writer]
+
+    pending = {}
+    counter = itertools.count()
+
+    def video_ids():
+        for video_num, video in videos:
+            pending[next(counter)] = (video_num, video)
+            yield video['id']
+
+    fetched = fetch_transcripts(video_ids(), **fetch_options)
+    try:
+        for offset, video_id, transcript_result, error in fetched:
+            video_num, video = pending.pop(offset)
+            result = {'id': video_id, 'video_num': video_num, 'title': video['title']}
+
+            if error is None and isinstance(transcript_result, list):
+                transcripts = [(t.language_code, t) for t in transcript_result]
+                result['languages'] = [language for language, _ in transcripts]
+                transcript_result = transcripts[0][1]
+            else:
+                transcripts = [(None, transcript_result)]
+
+            if error is None:
+                try:
+                    if writers:
+                        with metrics.timer('write'):
+                            files = [w.write(video_num, video, t, language)
+                                     for language, t in transcripts for w in writers]
+                        result['path'] = files[0][1]
+                        result['filename'] = files[0][0]
+                    else:
+                        with metrics.timer('render'):
+                            result['filename'], result['content'] = render(
+                                video_num, video, transcript_result, output_format, transcripts[0][0])
+                except Exception as e:
+                    result.pop('filename', None)
+                    result.pop('path', None)
+                    error = e
+
+            if error is None and index is not None:
+                try:
+                    with metrics.timer('index'):
+                        index.add(video, transcript_result)
+                except Exception as e:
+                    # The transcript itself was saved; searching for it is a nice-to-have
+                    result['index_error'] = str(e)
+
+            if error is None:
+                result.update(success=True, status=DONE)
+            else:
+                result.update(success=False, status=classify_error(error), error=str(error))
+                metrics.inc('errors_total', error=type(error).__name__)
+            metrics.inc('transcripts_total', outcome=result['status'])
+
+            if manifest is not None:
+                fields = {key: result[key] for key in ('filename', 'error') if key in result}
+                manifest.record(video_id, result['status'], index=video_num, title=video['title'], **fields)
+
+            yield result
+    finally:
+        # When the caller stops early this stops the fetch workers straight away
+        fetched.close()
+        for w in writers:
+            w.close()
@@ -1,25 +1,34 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from youtube_transcript_api import YouTubeTranscriptApi
-from pytube import Playlist, YouTube
 import os
-import re
+import json
 import time
-import zipfile
-from io import BytesIO
+from jobs import JobManager, ShuttingDown
+from egress import get_shared_pool, configure_shared_pool, parse_endpoints, DIRECT
+from state_backend import get_shared_backend
+from metrics import metrics
+from fetcher import transcript_flights, DEFAULT_WORKERS, MAX_WORKERS
+from titles import load_playlist, PlaylistPager, title_flights, playlist_flights
+from manifest import RunManifest
+from playlist_sync import compare_ids
+from languages import LanguagePlan, parse_languages
+from search_index import get_shared_index, DEFAULT_LIMIT
+from zip_stream import iter_zip, read_file_chunks
+from transcript_core import (is_playlist, resolve_video, select_videos, fill_missing_titles,
+                             run_pipeline, make_writer, TEXT_FORMATS, OUTPUT_FORMATS)
 
 app = Flask(__name__)
 CORS(app)
 
-def extract_video_id(url):
-    if 'watch?v=' in url:
-        return url.split('watch?v=')[1].split('&')[0]
-    elif 'youtu.be/' in url:
-        return url.split('youtu.be/')[1].split('?')[0]
-    return None
+# With TRANSCRIPT_STATE_BACKEND set (production mode), worker processes share job state and request budgets
+state_backend = get_shared_backend()
+if state_backend is not None:
+    configure_shared_pool(parse_endpoints(os.environ.get('TRANSCRIPT_EGRESS', DIRECT)), backend=state_backend)
 
-def is_playlist(url):
-    return 'list=' in url
+job_manager = JobManager(max_workers=int(os.environ.get('TRANSCRIPT_JOB_WORKERS', 4)), backend=state_backend)
+playlist_pager = PlaylistPager(backend=state_backend)
+metrics.add_collector(lambda: [('jobs', {'status': status}, count)
+                               for status, count in job_manager.status_counts().items()])
 
 @app.route('/')
 def index():
@@ -31,71 +40,49 @@ def load_url():
         data = request.json
         url = data.get('url', '').strip()
         
+        cursor = data.get('cursor')
+        
+        # Next page of a playlist that is being loaded incrementally
+        if cursor:
+            try:
+                page = playlist_pager.next_page(cursor)
+            except KeyError:
+                return jsonify({'error': 'Cursor expired, please load the URL again'}), 410
+            fill_missing_titles(page['videos'])
+            return jsonify(dict(page, type='playlist', count=len(page['videos'])))
+        
         if not url:
             return jsonify({'error': 'URL is required'}), 400
         
-        video_list = []
+        if is_playlist(url) and data.get('paginate'):
+            # Return the first page right away; the rest is fetched with next_cursor
+            page = playlist_pager.first_page(url)
+            fill_missing_titles(page['videos'])
+            return jsonify(dict(page, type='playlist', count=len(page['videos'])))
         
         if is_playlist(url):
-            playlist = Playlist(url)
-            for idx, video_url in enumerate(playlist.video_urls, 1):
-                video_id = extract_video_id(video_url)
-                if video_id:
-                    try:
-                        yt = YouTube(video_url)
-                        title = yt.title
-                    except Exception as e:
-                        # Fallback: try to get title from video page
-                        try:
-                            import requests
-                            response = requests.get(video_url)
-                            match = re.search(r'<title>([^<]+)</title>', response.text)
-                            if match:
-                                title = match.group(1).replace(' - YouTube', '').strip()
-                            else:
-                                title = f"Video {idx}"
-                        except:
-                            title = f"Video {idx}"
-                    
-                    video_list.append({
-                        'id': video_id,
-                        'title': title,
-                        'url': video_url
-                    })
+            # Titles come with the playlist pages; only the gaps are looked up (in parallel).
+            # Clients loading the same playlist at once share one enumeration.
+            video_list = load_playlist(url)
+            fill_missing_titles(video_list)
             
-            return jsonify({
+            response = {
                 'type': 'playlist',
                 'videos': video_list,
                 'count': len(video_list)
-            })
+            }
+            # Clients that already have some of the playlist can ask what changed since
+            known_ids = data.get('known_ids')
+            if isinstance(known_ids, list):
+                response['new_ids'], response['removed_ids'] = compare_ids(
+                    [video['id'] for video in video_list], known_ids)
+            return jsonify(response)
         else:
-            video_id = extract_video_id(url)
-            if video_id:
-                try:
-                    yt = YouTube(url)
-                    title = yt.title
-                except Exception as e:
-                    # Fallback: try to get title from video page
-                    try:
-                        import requests
-                        response = requests.get(url)
-                        match = re.search(r'<title>([^<]+)</title>', response.text)
-                        if match:
-                            title = match.group(1).replace(' - YouTube', '').strip()
-                        else:
-                            title = video_id
-                    except:
-                        title = video_id
-                
-                video_list.append({
-                    'id': video_id,
-                    'title': title,
-                    'url': url
-                })
-                
+            video = resolve_video(url)
+            if video:
                 return jsonify({
                     'type': 'video',
-                    'videos': video_list,
+                    'videos': [video],
                     'count': 1
                 })
             else:
@@ -104,6 +91,77 @@ def load_url():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def iter_download_results(videos, start_index=0, cancel_event=None, workers=DEFAULT_WORKERS, skip_ids=(),
+                          output_format='txt'):
+    """Fetch transcripts concurrently, yielding each result (in playlist order) as soon as it is ready"""
+    return run_pipeline(select_videos(videos, start_index, skip_ids), output_format=output_format,
+                        workers=workers, cancel_event=cancel_event)
+
+def get_workers(data):
+    """Number of concurrent fetches requested by the client, capped by the server limit"""
+    default = int(os.environ.get('TRANSCRIPT_FETCH_WORKERS', DEFAULT_WORKERS))
+    try:
+        workers = int(data.get('workers', default))
+    except (TypeError, ValueError):
+        workers = default
+    return max(1, min(workers, MAX_WORKERS))
+
+def get_format(data, allowed=OUTPUT_FORMATS):
+    """Output format requested by the client, or None if it isn't one of `allowed`"""
+    output_format = data.get('format') or 'txt'
+    return output_format if output_format in allowed else None
+
+def get_languages(data):
+    """LanguagePlan from "languages": ["en,de,auto", ...] and "translate": ["fr", ...], or None for the default"""
+    preferences = [parse_languages(str(spec)) for spec in data.get('languages') or []]
+    translations = [str(code) for code in data.get('translate') or []]
+    preferences = [p for p in preferences if p]
+    if not preferences and not translations:
+        return None
+    return LanguagePlan(preferences, translations)
+
+def wants_stream(data):
+    """Check whether the client asked for a streamed (NDJSON/SSE) response"""
+    accept = request.headers.get('Accept', '')
+    return bool(data.get('stream')) or 'application/x-ndjson' in accept or 'text/event-stream' in accept
+
+def stream_download(videos, start_index, workers, skip_ids=(), output_format='txt'):
+    """Stream download results as NDJSON lines, or as SSE events if the client asked for them"""
+    use_sse = 'text/event-stream' in request.headers.get('Accept', '')
+    
+    def encode(event):
+        line = json.dumps(event)
+        if use_sse:
+            return f"event: {event['type']}\ndata: {line}\n\n"
+        return line + "\n"
+    
+    def generate():
+        total = len(select_videos(videos, start_index, skip_ids))
+        success_count = 0
+        error_count = 0
+        
+        # Send something immediately so the client sees the first byte right away
+        yield encode({'type': 'start', 'total': total, 'start_index': start_index})
+        
+        results = iter_download_results(videos, start_index, workers=workers, skip_ids=skip_ids,
+                                        output_format=output_format)
+        for result in results:
+            if result['success']:
+                success_count += 1
+            else:
+                error_count += 1
+            yield encode(dict(result, type='result'))
+        
+        yield encode({'type': 'done', 'success_count': success_count, 'error_count': error_count})
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if use_sse else 'application/x-ndjson'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
 @app.route('/api/download', methods=['POST'])
 def download_transcripts():
     try:
@@ -114,59 +172,180 @@ def download_transcripts():
         if not videos:
             return jsonify({'error': 'No videos provided'}), 400
         
-        api = YouTubeTranscriptApi()
-        results = []
+        # Transcript text comes back in the response, so only the per-video text formats work here
+        output_format = get_format(data, TEXT_FORMATS)
+        if output_format is None:
+            return jsonify({'error': f"format must be one of: {', '.join(TEXT_FORMATS)}"}), 400
         
-        for i in range(start_index, len(videos)):
-            video = videos[i]
-            video_num = i + 1
-            
-            try:
-                time.sleep(5)  # Rate limiting to avoid IP blocking
-                transcript_result = api.fetch(video['id'])
-                
-                # Extract text
-                full_text = " ".join([snippet.text for snippet in transcript_result.snippets])
-                
-                # Create filename
-                safe_title = re.sub(r'[<>:"/\\|?*]', '', video['title'])
-                
-                content = f"""Video ID: {video['id']}
-Title: {video['title']}
-URL: {video['url']}
-Language: {transcript_result.language} ({transcript_result.language_code})
-{'-'*80}
-
-{full_text}"""
-                
-                results.append({
-                    'success': True,
-                    'video_num': video_num,
-                    'title': video['title'],
-                    'filename': f"{video_num:02d}_{safe_title}.txt",
-                    'content': content
-                })
-                
-            except Exception as e:
-                error_msg = str(e)
-                results.append({
-                    'success': False,
-                    'video_num': video_num,
-                    'title': video['title'],
-                    'error': error_msg
-                })
-                
-                # Stop if IP blocked
-                if "IpBlocked" in error_msg or "blocked" in error_msg.lower():
-                    break
+        workers = get_workers(data)
+        skip_ids = data.get('skip_ids', [])
+        
+        if wants_stream(data):
+            return stream_download(videos, start_index, workers, skip_ids, output_format)
         
+        results = list(iter_download_results(videos, start_index, workers=workers, skip_ids=skip_ids,
+                                             output_format=output_format))
         return jsonify({'results': results})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def run_download_job(job, videos, start_index, workers, skip_ids, output_format='txt', languages=None,
+                     recheck_failed=False):
+    """Job work: save each transcript in the job's output folder and record it in the job's manifest"""
+    manifest = RunManifest(job.output_dir)
+    for video_num, video in enumerate(videos[:start_index], 1):
+        manifest.record_skipped(video['id'], index=video_num, title=video.get('title'))
+    results = run_pipeline(
+        select_videos(videos, start_index, skip_ids),
+        writer=make_writer(job.output_dir, output_format),
+        manifest=manifest,
+        index=get_shared_index(),
+        workers=workers,
+        cancel_event=job.cancel_event,
+        languages=languages,
+        recheck_failed=recheck_failed
+    )
+    for result in results:
+        result.pop('path', None)  # Server-side path; clients fetch files through the job's ZIP
+        yield result
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    try:
+        data = request.json
+        videos = data.get('videos', [])
+        start_index = data.get('start_index', 0)
+        
+        if not videos:
+            return jsonify({'error': 'No videos provided'}), 400
+        
+        output_format = get_format(data)
+        if output_format is None:
+            return jsonify({'error': f"format must be one of: {', '.join(OUTPUT_FORMATS)}"}), 400
+        
+        workers = get_workers(data)
+        languages = get_languages(data)
+        recheck_failed = bool(data.get('recheck_failed'))
+        
+        # Resuming: skip_ids lists videos that were already downloaded in an earlier run
+        skip_ids = set(data.get('skip_ids', []))
+        output_dir = None
+        
+        # Resuming a job continues in its output folder and skips what its manifest marks as done
+        resume_job_id = data.get('resume_job_id')
+        if resume_job_id:
+            previous = job_manager.get(resume_job_id)
+            if not previous:
+                return jsonify({'error': 'Job to resume not found'}), 404
+            if not previous.is_finished():
+                return jsonify({'error': 'Job to resume is still running'}), 409
+            output_dir = previous.output_dir
+            manifest = RunManifest(output_dir)
+            skip_ids.update(video['id'] for video in videos if manifest.is_done(video['id']))
+        
+        job = job_manager.submit(
+            lambda job: run_download_job(job, videos, start_index, workers, skip_ids, output_format,
+                                         languages, recheck_failed),
+            total=len(select_videos(videos, start_index, skip_ids)),
+            output_dir=output_dir
+        )
+        
+        return jsonify({'job_id': job.id, 'status': job.status, 'skipped': len(skip_ids)}), 202
+        
+    except ShuttingDown as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    since = request.args.get('since', 0, type=int)
+    return jsonify(job.to_dict(since=since))
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({'job_id': job.id, 'status': job.status, 'cancelled': True})
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """For load balancers: 503 once the server is draining for shutdown"""
+    if not job_manager.accepting:
+        return jsonify({'status': 'draining'}), 503
+    return jsonify({'status': 'ok'})
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """Ranked full-text hits (video, title, timestamp, excerpt) over every downloaded transcript"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    
+    index = get_shared_index()
+    if index is None:
+        return jsonify({'error': 'Search index is disabled'}), 503
+    
+    started = time.perf_counter()
+    hits = index.search(query, limit=request.args.get('limit', DEFAULT_LIMIT, type=int),
+                        video_id=request.args.get('video_id'))
+    return jsonify({'query': query, 'hits': hits, 'count': len(hits),
+                    'took_ms': round((time.perf_counter() - started) * 1000, 2)})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage latencies, outcomes, error classes, throttling and limiter state in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/egress', methods=['GET'])
+def egress_status():
+    """Health, rate and quarantine state of every egress endpoint, plus how many fetches were coalesced"""
+    return jsonify({
+        'endpoints': get_shared_pool().state(),
+        'coalesced': {
+            'transcripts': transcript_flights.stats(),
+            'titles': title_flights.stats(),
+            'playlists': playlist_flights.stats()
+        }
+    })
+
+def zip_response(entries):
+    """Stream a ZIP archive of (arcname, chunks) entries as it is compressed"""
+    response = Response(stream_with_context(metrics.time_iter('zip', iter_zip(entries))),
+                        mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=transcripts.zip'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/jobs/<job_id>/zip', methods=['GET'])
+def download_job_zip(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    # Parquet files and packed stores are only complete once the job has closed its writers
+    if not job.is_finished():
+        return jsonify({'error': 'Job is still running', 'status': job.status}), 409
+    
+    # Everything the job wrote (including a packed store's folder), minus its run manifest
+    filenames = sorted(
+        os.path.relpath(os.path.join(folder, name), job.output_dir)
+        for folder, _, names in os.walk(job.output_dir) for name in names if not name.startswith('.'))
+    if not filenames:
+        return jsonify({'error': 'No files to download'}), 400
+    
+    return zip_response(
+        (name, read_file_chunks(os.path.join(job.output_dir, name))) for name in filenames)
+
 @app.route('/api/download_zip', methods=['POST'])
 def download_zip():
+    """Zip transcripts posted by the client (kept for API clients; the web UI zips a job instead)"""
     try:
         data = request.json
         files = data.get('files', [])
@@ -174,22 +353,7 @@ def download_zip():
         if not files:
             return jsonify({'error': 'No files to download'}), 400
         
-        # Create zip file in memory
-        memory_file = BytesIO()
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for file_data in files:
-                filename = file_data['filename']
-                content = file_data['content']
-                zf.writestr(filename, content)
-        
-        memory_file.seek(0)
-        
-        return send_file(
-            memory_file,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name='transcripts.zip'
-        )
+        return zip_response((f['filename'], [f['content']]) for f in files)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,355 @@
+"""
+Durable work queues for distributed crawls (see crawl.py).
+
+A coordinator puts videos on the queue; any number of workers lease a few at
+a time, fetch them and ack or fail each one. A lease that isn't extended or
+acked in time (the worker died) expires and the video goes back to pending,
+so every video is fetched at least once. Retryable failures wait a little
+longer before each new attempt and end up as failed after MAX_ATTEMPTS.
+
+Brokers share one small interface (put, lease, extend, ack, fail, release,
+stats), picked with open_queue():
+    sqlite:///path/crawl.db    one SQLite file (processes on one machine)
+    file:///shared/queue       a folder of task files changed with atomic
+                               renames, so it also works on a shared mount
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+MAX_ATTEMPTS = 5
+DEFAULT_LEASE = 300  # seconds
+RETRY_DELAY = 60     # seconds, times the attempts so far
+CLAIM_SUFFIX = '.claim'
+STALE_CLAIM = 60     # seconds before a half-finished change of a dead worker is undone
+CLAIM_POLL = 0.01    # seconds between looks at a task another worker has claimed
+
+
+class SQLiteQueue:
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # Autocommit mode, so leasing can take the write lock up front (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    video_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    worker TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_until)')
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    def put(self, tasks):
+        """Queue {'video_id', ...} payloads; videos already on the queue are left alone. Returns the number added."""
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO tasks (video_id, payload, status, updated_at) VALUES (?, ?, ?, ?)',
+                [(task['video_id'], json.dumps(task, ensure_ascii=False), PENDING, now) for task in tasks])
+            return conn.total_changes - before
+
+    def lease(self, worker, count=1, lease_seconds=DEFAULT_LEASE):
+        """Take up to `count` pending tasks (reclaiming expired leases first); returns their payloads"""
+        now = time.time()
+        with self._transaction() as conn:
+            self._reclaim(conn, now)
+            # For pending tasks lease_until is when a retry is due (NULL: right away)
+            rows = conn.execute(
+                'SELECT video_id, payload FROM tasks WHERE status = ? AND (lease_until IS NULL OR lease_until <= ?) '
+                'ORDER BY rowid LIMIT ?', (PENDING, now, count)).fetchall()
+            conn.executemany(
+                'UPDATE tasks SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, '
+                'updated_at = ? WHERE video_id = ?',
+                [(LEASED, worker, now + lease_seconds, now, video_id) for video_id, _ in rows])
+        return [json.loads(payload) for _, payload in rows]
+
+    def _reclaim(self, conn, now):
+        # Tasks whose worker went away; the ones that already used up their attempts are given up on
+        conn.execute(
+            'UPDATE tasks SET status = ?, error = ?, updated_at = ? '
+            'WHERE status = ? AND lease_until < ? AND attempts >= ?',
+            (FAILED, 'lease expired too often', now, LEASED, now, self.max_attempts))
+        conn.execute(
+            'UPDATE tasks SET status = ?, worker = NULL, lease_until = NULL, updated_at = ? '
+            'WHERE status = ? AND lease_until < ?',
+            (PENDING, now, LEASED, now))
+
+    def extend(self, video_ids, worker, lease_seconds=DEFAULT_LEASE):
+        """Keep leases alive while the worker is still busy with them"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                'UPDATE tasks SET lease_until = ? WHERE video_id = ? AND status = ? AND worker = ?',
+                [(now + lease_seconds, video_id, LEASED, worker) for video_id in video_ids])
+
+    def ack(self, video_id, result=None):
+        with self._transaction() as conn:
+            conn.execute(
+                'UPDATE tasks SET status = ?, result = ?, error = NULL, updated_at = ? WHERE video_id = ?',
+                (DONE, json.dumps(result, ensure_ascii=False), time.time(), video_id))
+
+    def fail(self, video_id, error, retry=True):
+        """Record a failure; retryable ones go back to pending until they run out of attempts"""
+        with self._transaction() as conn:
+            now = time.time()
+            attempts = (conn.execute('SELECT attempts FROM tasks WHERE video_id = ?', (video_id,)).fetchone() or [0])[0]
+            status = PENDING if retry and attempts < self.max_attempts else FAILED
+            conn.execute(
+                'UPDATE tasks SET status = ?, worker = NULL, lease_until = ?, error = ?, updated_at = ? '
+                'WHERE video_id = ?', (status, now + RETRY_DELAY * attempts, str(error), now, video_id))
+
+    def release(self, video_ids):
+        """Hand leased tasks back untouched (e.g. when a worker is stopped)"""
+        with self._transaction() as conn:
+            conn.executemany(
+                'UPDATE tasks SET status = ?, worker = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0), '
+                'updated_at = ? WHERE video_id = ? AND status = ?',
+                [(PENDING, time.time(), video_id, LEASED) for video_id in video_ids])
+
+    def stats(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status').fetchall()
+        return dict({PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}, **dict(rows))
+
+    def failures(self, limit=100):
+        with self.lock:
+            return self.conn.execute(
+                'SELECT video_id, error FROM tasks WHERE status = ? ORDER BY updated_at DESC LIMIT ?',
+                (FAILED, limit)).fetchall()
+
+
+class FileQueue:
+    """
+    One JSON file per task, in a folder per status. Every change claims the
+    file first by renaming it to a hidden name (rename is atomic, so only
+    one worker can win), rewrites it while nobody else can see it and then
+    renames it into its new folder. That works across machines sharing a
+    mount without any server.
+    """
+
+    def __init__(self, folder, max_attempts=MAX_ATTEMPTS):
+        # File names start with the time a task may be leased, plus a sequence number, so
+        # pending/ lists in queue order and retries that aren't due yet sort to the end
+        self.folder = folder
+        self.max_attempts = max_attempts
+        for status in (PENDING, LEASED, DONE, FAILED):
+            os.makedirs(os.path.join(folder, status), exist_ok=True)
+
+    def _path(self, status, name):
+        return os.path.join(self.folder, status, name)
+
+    def _names(self, status, suffix='.json'):
+        return sorted(name for name in os.listdir(os.path.join(self.folder, status)) if name.endswith(suffix))
+
+    def _read(self, path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, path, task):
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(task, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _claim(self, status, name):
+        """Take a task file out of sight of other workers; None if one of them got there first"""
+        claimed = self._path(status, f"{name}.{uuid.uuid4().hex}{CLAIM_SUFFIX}")
+        try:
+            os.rename(self._path(status, name), claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _publish(self, claimed, status, name, task):
+        """Rewrite a claimed task file and make it visible again in `status`"""
+        with open(claimed, 'w', encoding='utf-8') as f:
+            json.dump(task, f, ensure_ascii=False)
+        os.rename(claimed, self._path(status, name))
+
+    def _find(self, video_id, statuses=(LEASED, PENDING)):
+        for status in statuses:
+            for name in self._names(status):
+                if name.split('-', 1)[1] == f"{video_id}.json":
+                    return status, name
+        return None, None
+
+    def put(self, tasks):
+        known = {name.split('-', 1)[1][:-len('.json')]
+                 for status in (PENDING, LEASED, DONE, FAILED) for name in self._names(status)}
+        prefix = f"{time.time():017.6f}"
+        added = 0
+        for task in tasks:
+            if task['video_id'] in known:
+                continue
+            known.add(task['video_id'])
+            entry = {'video_id': task['video_id'], 'payload': task, 'attempts': 0}
+            self._write(self._path(PENDING, f"{prefix}{added:06d}-{task['video_id']}.json"), entry)
+            added += 1
+        return added
+
+    def lease(self, worker, count=1, lease_seconds=DEFAULT_LEASE):
+        self._reclaim()
+        leased = []
+        now = time.time()
+        for name in self._names(PENDING):
+            if len(leased) >= count or float(name[:17]) > now:
+                break
+            claimed = self._claim(PENDING, name)
+            if claimed is None:
+                continue
+            entry = self._read(claimed)
+            entry.update(worker=worker, lease_until=time.time() + lease_seconds, attempts=entry['attempts'] + 1)
+            self._publish(claimed, LEASED, name, entry)
+            leased.append(entry['payload'])
+        return leased
+
+    def _restore_stale_claims(self, statuses=(PENDING, LEASED), video_id=None):
+        """Put back claims left behind by a worker that died halfway through a change; returns the ones still live"""
+        now = time.time()
+        live = 0
+        for status in statuses:
+            for claim in self._names(status, CLAIM_SUFFIX):
+                name = claim.rsplit('.', 2)[0]
+                if video_id is not None and name.split('-', 1)[1] != f"{video_id}.json":
+                    continue
+                path = self._path(status, claim)
+                try:
+                    if os.path.getmtime(path) < now - STALE_CLAIM:
+                        os.rename(path, self._path(status, name))
+                    else:
+                        live += 1
+                except FileNotFoundError:
+                    pass
+        return live
+
+    def _reclaim(self):
+        now = time.time()
+        self._restore_stale_claims()
+
+        for name in self._names(LEASED):
+            try:
+                entry = self._read(self._path(LEASED, name))
+            except (OSError, ValueError):
+                continue  # Being changed right now
+            if not entry.get('worker') or entry.get('lease_until', now) >= now:
+                continue
+            claimed = self._claim(LEASED, name)
+            if claimed is None:
+                continue
+            entry = self._read(claimed)
+            if entry.get('lease_until', now) >= now:
+                self._publish(claimed, LEASED, name, entry)  # Extended in the meantime
+            elif entry['attempts'] >= self.max_attempts:
+                self._publish(claimed, FAILED, name, dict(entry, error='lease expired too often'))
+            else:
+                self._publish(claimed, PENDING, name, dict(entry, worker=None, lease_until=None))
+
+    def extend(self, video_ids, worker, lease_seconds=DEFAULT_LEASE):
+        wanted = {f"{video_id}.json" for video_id in video_ids}
+        for name in self._names(LEASED):
+            if name.split('-', 1)[1] in wanted:
+                claimed = self._claim(LEASED, name)
+                if claimed is None:
+                    continue
+                entry = self._read(claimed)
+                if entry.get('worker') == worker:
+                    entry['lease_until'] = time.time() + lease_seconds
+                self._publish(claimed, LEASED, name, entry)
+
+    def _take(self, video_id, statuses):
+        """
+        (claimed path, name, entry) of a task in one of `statuses`, or None if
+        it isn't there. While someone else has the task claimed (e.g. the
+        worker's own lease keeper extending it) this waits for them to finish.
+        """
+        while True:
+            status, name = self._find(video_id, statuses)
+            claimed = self._claim(status, name) if name is not None else None
+            if claimed is not None:
+                return claimed, name, self._read(claimed)
+            if not self._restore_stale_claims(statuses, video_id):
+                # Nobody has it claimed either, but it may just have been published again
+                status, name = self._find(video_id, statuses)
+                if name is None:
+                    return None
+                continue
+            time.sleep(CLAIM_POLL)
+
+    def ack(self, video_id, result=None):
+        taken = self._take(video_id, (LEASED, PENDING))
+        if taken is not None:
+            claimed, name, entry = taken
+            self._publish(claimed, DONE, name, dict(entry, result=result, error=None))
+
+    def fail(self, video_id, error, retry=True):
+        taken = self._take(video_id, (LEASED,))
+        if taken is None:
+            return
+        claimed, name, entry = taken
+        entry = dict(entry, error=str(error), worker=None, lease_until=None)
+        if retry and entry['attempts'] < self.max_attempts:
+            due = f"{time.time() + RETRY_DELAY * entry['attempts']:017.6f}000000-{video_id}.json"
+            self._publish(claimed, PENDING, due, entry)
+        else:
+            self._publish(claimed, FAILED, name, entry)
+
+    def release(self, video_ids):
+        for video_id in video_ids:
+            taken = self._take(video_id, (LEASED,))
+            if taken is not None:
+                claimed, name, entry = taken
+                self._publish(claimed, PENDING, name, dict(
+                    entry, worker=None, lease_until=None, attempts=max(entry['attempts'] - 1, 0)))
+
+    def stats(self):
+        return {status: len(self._names(status)) for status in (PENDING, LEASED, DONE, FAILED)}
+
+    def failures(self, limit=100):
+        failed = []
+        for name in self._names(FAILED)[:limit]:
+            entry = self._read(self._path(FAILED, name))
+            failed.append((entry['video_id'], entry.get('error')))
+        return failed
+
+
+def open_queue(spec):
+    """Queue for sqlite:///path, file:///folder, a .db/.sqlite3 file or a folder"""
+    if spec.startswith('sqlite:///'):
+        return SQLiteQueue(spec[len('sqlite:///'):])
+    if spec.startswith('file://'):
+        return FileQueue(spec[len('file://'):])
+    if spec.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SQLiteQueue(spec)
+    return FileQueue(spec)
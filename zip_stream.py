@@ -0,0 +1,61 @@
+"""
+Streaming ZIP writer.
+Builds a ZIP_DEFLATED archive chunk by chunk so it can be sent to the client
+while it is being written, without ever holding the whole archive in memory.
+"""
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkBuffer:
+    """Write-only, non-seekable file object that collects bytes until drained"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def read_file_chunks(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            yield chunk
+
+
+def iter_zip(entries):
+    """
+    Yield the bytes of a ZIP archive built from (arcname, chunks) entries,
+    where chunks is an iterable of bytes/str. Only the data of the entry
+    currently being compressed is in memory at any time.
+    """
+    buffer = _ChunkBuffer()
+    # zipfile notices the buffer can't seek and writes data descriptors instead
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for arcname, chunks in entries:
+            with zf.open(arcname, 'w') as dest:
+                for chunk in chunks:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+
+    # Central directory
+    data = buffer.drain()
+    if data:
+        yield data